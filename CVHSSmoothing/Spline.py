@@ -1,11 +1,19 @@
 import datetime
+import functools
+import io
+import itertools
+import os
 import time
 import numpy as np
-import numpy.ma as ma
-from scipy import interpolate
-from scipy.interpolate import interp1d
 import pandas as pd
 
+from CVHSSmoothing import core
+from CVHSSmoothing.core import CHUNK_HOURS, check_interval, support_padding
+from CVHSSmoothing.kernels import clip_negative
+
+# HEC-DSS missing value flag
+MISSING = -901.
+
 def read_timeseries_info(input):
   """
   Read DSS pathname part info, units, and type from first seven lines
@@ -209,277 +217,559 @@ def insert_peak_1am(daily_accumulation, hourly_accumulation, date, value):
 
   return hourly_accumulation
 
-def generate_hydrograph(hourly_accumulation):
+def fit_accumulation(hourly_accumulation, engine = "splrep"):
+  """
+  Accept hourly_accumulation and an engine name (see engines.py) or fit
+  function. Generate an interpolation function with the engine,
+  constrained by the specified (unmasked) values, with hours (period
+  ordinals) as x. Return spline_function.
+
+  """
+
+  return core.fit_accumulation(hourly_accumulation.values, 
+    hourly_accumulation.index[0].ordinal, engine)
+
+def generate_hydrograph(hourly_accumulation, engine = "splrep"):
   """
-  Accept hourly_accumulation. Generate a cubic spline interpolation 
-  function, constrained by the specified (unmasked) values. Interpolate
-  on an hourly basis, differentiate using the  numpy diff function, and
-  multiply by 24 (to convert from cfs-days to cfs-hours) in order to 
-  generate a "smoothed" hydrologic timeseries. Return hydrologic_timeseries. 
+  Accept hourly_accumulation and engine. Generate a cubic spline 
+  interpolation function, constrained by the specified (unmasked)
+  values. Interpolate on an hourly basis, differentiate using the numpy
+  diff function, and multiply by 24 (to convert from cfs-days to
+  cfs-hours) in order to generate a "smoothed" hydrologic timeseries.
+  Return hydrologic_timeseries. 
   
   """
 
-  masked_dates = ma.array(hourly_accumulation.index.view('int64'),
-    mask = hourly_accumulation.isna()) 
-  masked_flows = ma.array(hourly_accumulation.values,
-    mask = hourly_accumulation.isna) 
-  spline_function = interpolate.splrep(masked_dates.compressed(),
-    hourly_accumulation.dropna().values, s=0)
-  y_spline = interpolate.splev(hourly_accumulation.index.view('int64'),
-    spline_function, der=0)      
-  y_hourly_hydrograph_temp = np.diff(y_spline)*24
-  y_hourly_hydrograph = np.hstack((0,y_hourly_hydrograph_temp))
+  y_hourly_hydrograph = core.generate_hydrograph(hourly_accumulation.values,
+    hourly_accumulation.index[0].ordinal, engine)
   hydrologic_timeseries = pd.Series(y_hourly_hydrograph, 
     index = hourly_accumulation.index)  
 
   return hydrologic_timeseries
 
+def interval_epart(interval):
+  """
+  Accept an output interval in minutes. Return the DSS pathname E-part.
+
+  """
+
+  check_interval(interval)
+  if interval == 60:
+    return "1hour"
+  return "%dMIN" % interval
+
+def epart_interval(epart):
+  """
+  Accept a DSS pathname E-part written by interval_epart. Return the
+  interval in minutes.
+
+  """
+
+  epart = epart.upper()
+  if epart.endswith("HOUR"):
+    return 60 * int(epart[:-4])
+  return int(epart.replace("MINUTE", "").replace("MIN", ""))
+
+def hydrograph_chunks(hourly_accumulation, interval = 60, 
+  chunk_hours = CHUNK_HOURS, engine = "splrep"):
+  """
+  Accept hourly_accumulation, an output interval in minutes, a chunk
+  length in hours and engine. Fit the spline through the accumulation once, then
+  evaluate and differentiate it at every interval from the first to the
+  last hour of hourly_accumulation, chunk_hours at a time, so memory use
+  does not grow with the record length or interval. Return a generator
+  of flow arrays, starting with the interval ending one interval after the first
+  hour.
+
+  """
+
+  return core.hydrograph_chunks(hourly_accumulation.values, 
+    hourly_accumulation.index[0].ordinal, interval, chunk_hours, engine)
+
 def read_peaks_file(peaks_file_name):
+  """
+  Accept the name of a peaks file. Read it with core.read_peak_table and
+  return peak_types, a dictionary of faux date to peak flow, a
+  dictionary of faux date to real date and the faux dates, with dates
+  as daily Periods.
 
-  tmp = pd.read_csv(peaks_file_name,sep ='\t', skiprows=7, header=None, usecols=[1,2,3], names = ['date','peak','peak_types'])
-  tmp.loc[:,'date'] = pd.to_datetime(tmp.date).dt.to_period(freq='D')
-  tmp.loc[:,'faux_date'] = tmp.date + 146097 
-  tmp = tmp.dropna()
+  """
 
-  peak_types = tmp.peak_types.astype(int).astype(str).to_list()
-  peak_dictionary = dict(zip(tmp.faux_date, tmp.peak.astype(float)))
-  real_dates = dict(zip(tmp.faux_date, tmp.date))
-  peak_dates = tmp.faux_date.to_list()
+  peaks = core.read_peak_table(peaks_file_name)
+  peak_dates = [pd.Period(ordinal = day, freq='D') for day in peaks["day"]]
+
+  peak_types = peaks["type"].tolist()
+  peak_dictionary = dict(zip(peak_dates, peaks["value"].tolist()))
+  real_dates = {date: date - core.FAUX_OFFSET for date in peak_dates}
 
   return peak_types, peak_dictionary, real_dates, peak_dates
 
+def read_daily_flows(daily_flow_readlines, location, missing_log_file):
+  """
+  Accept the data lines of a daily timeseries input file (header
+  removed), gage location name and an open log file. Parse the faux
+  dates and daily flows; unreadable values are logged and set to 0.0.
+  The first entry is the start of the first day with zero flow, so each
+  following date marks the end of the day whose flow it carries. Return
+  dates and flows lists.
 
-def spline(daily_flow_filename, location, peaks_file_name = False):
-  """ 
-  Accept daily timeseries input filename, gage location name, and 
-  (optional) filename for irregular time series of peaks. Create a 
-  summation time series from daily average flows. Insert additional 
-  points to reflect peak flow information, if known. Develop a spline
-  function to "smoothly" interpolate between points on accumulation 
-  curve. Differentiate spline function on an hourly basis to generate a
-  "smoothed" hourly flow timeseries. Check for negative flows and add 
-  additional points to the accumulation curve (based on a linear 
-  interpolation of daily plus peak accumulation curve) to further 
-  constrain the spline interpolation. Recompute spline and check for 
-  negative flows; repeat up to 15 iterations or until minimum flow is 
-  greater than -0.01 cfs. Write resulting hourly hydrograph to a text 
-  file in dssts compatible format. 
-  
   """
- 
-  start_timer = time.time()
- 
-  #TODO make cleaner input filehanding logic
-  daily_flow_readlines = open(daily_flow_filename, "r").readlines()
-  timeseries_info = read_timeseries_info(daily_flow_readlines)
-  del daily_flow_readlines[0:7]
-  start_date = daily_flow_readlines[0].strip().split()[1]
-  start = read_date(start_date)
-  dates = []
-  flows = []
-  first_date = read_faux_date(start_date)
-  dates.append(first_date)
-  flows.append(0)
 
-  print (f"Reading input timeseries for {location}") 
+  knot_days, flows = core.read_daily_lines(daily_flow_readlines, location,
+    missing_log_file)
+  dates = [pd.Period(ordinal = day, freq='D') for day in knot_days]
 
-  missing_log_file_name = location + "_missing.log"
-  missing_log_file = open(missing_log_file_name, "w")
-
-
-  for line in daily_flow_readlines:
-    try:
-      raw_date = line.strip().split()[1]
-      faux_date = read_faux_date(raw_date) + 1
-      dates.append(faux_date)
-      a = line.strip().split()[2]
-      b = float(a)
-      flows.append(b)
-    except IndexError:
-      missing_log_file.write("Error: %s \t line: %s" % (location, line))
-      flows.append(0.0)
-    except ValueError:
-      missing_log_file.write("Error: %s \t line: %s" % (location, line)) 
-      flows.append(0.0)
-      
-  print ("Generating smoothed (hourly) timeseries")
+  return dates, list(flows)
 
-  x_days = pd.PeriodIndex(dates, freq = 'D')
-  y_days = np.array(flows)
-  daily_hydrograph = pd.Series(y_days, index = dates)
-  #TODO might want to remove this check for negative flows,
-  #TODO but adding here because this has been forgotten before...
-  daily_hydrograph[daily_hydrograph<0] = 0
+def build_hourly_accumulation(dates, flows, record_end = True):
+  """
+  Accept dates and flows from read_daily_flows. Create the daily
+  summation time series and place it on the first hour of each day of
+  an hourly index; remaining hours are NaN. If record_end, the last hour
+  of the record is pinned to the total volume, otherwise the index stops
+  at the last daily point. Return daily_accumulation and
+  hourly_accumulation.
 
-  daily_accumulation = daily_hydrograph.cumsum()
+  """
 
+  dates = pd.PeriodIndex(dates, freq='D')
+  daily_accumulation, accumulation, first_hour = core.build_accumulation(
+    dates.asi8, flows, record_end)
 
-  hourly_accumulation = daily_accumulation.asfreq('H', how='start')
-  targ_idx = pd.period_range(daily_accumulation.index.min()-1, daily_accumulation.index.max(), freq='H')[1:]
-  hourly_accumulation = hourly_accumulation.reindex(targ_idx)
-  hourly_accumulation[-1] = np.max(hourly_accumulation)
+  return (pd.Series(daily_accumulation, index = dates), 
+    hourly_series(accumulation, first_hour))
 
+@functools.lru_cache(maxsize = core.TIMELINE_CACHE_SIZE)
+def period_index(ordinal, periods, freq):
+  """
+  Accept the ordinal of the first period, the number of periods and a
+  frequency. Return the PeriodIndex, built once and shared (indexes are
+  immutable) by every series with the same period and frequency.
 
-  # Calculate hourly hydrograph no peaks
-  hourly_hydrograph_no_peak = generate_hydrograph(hourly_accumulation.copy())
-  
-  peak_log_file_name =  location + "_peaks.log"
-  peak_log_file = open(peak_log_file_name, "w")
-  
-  if peaks_file_name: 
+  """
 
-    peak_types, peak_dictionary, real_dates, peak_dates = read_peaks_file(peaks_file_name)
-    peak_values = list(peak_dictionary.values())
-  
-    for i in range(0, len(peak_dates)):
-
-      peak_date = peak_dates[i]
-      peak_value = peak_values[i]
-      peak_type = peak_types[i]
-
-      # # lets check out the no-peak hydrograph for a given peak date
-
-      # sub_hydrograph = hourly_hydrograph_no_peak[(peak_date-5).asfreq('H')-23:(peak_date+5).asfreq('H')+1]
-      # sub_hourly_accum = hourly_accumulation[(peak_date-5).asfreq('H')-23:(peak_date+5).asfreq('H')+1]
-      # sub_daily_accum = daily_accumulation[peak_date-2:peak_date+2]
-
-      # #TODO there is some unwanted mutation in these functions
-      # hourly_accumulation_1 = insert_peak_1am(sub_daily_accum.copy(), 
-      #     sub_hourly_accum.copy(), peak_date, peak_value)
-      # hourly_hydrograph_1 = generate_hydrograph(hourly_accumulation_1)
-
-      # hourly_accumulation_2 = insert_peak_12am(sub_daily_accum.copy(), 
-      #     sub_hourly_accum.copy(), peak_date, peak_value)
-      # hourly_hydrograph_2 = generate_hydrograph(hourly_accumulation_2)
-
-      # hourly_accumulation_3 = insert_peak_11am(sub_daily_accum.copy(), 
-      #   sub_hourly_accum.copy(), peak_date, peak_value)
-      # hourly_hydrograph_3 = generate_hydrograph(hourly_accumulation_3)
-
-      # hourly_accumulation_4 = insert_peak_11pm(sub_daily_accum.copy(), 
-      #     sub_hourly_accum.copy(), peak_date, peak_value)
-      # hourly_hydrograph_4 = generate_hydrograph(hourly_accumulation_4)
-
-      # hourly_accumulation_5 = insert_peak_10pm(sub_daily_accum.copy(), 
-      #     sub_hourly_accum.copy(), peak_date, peak_value)
-      # hourly_hydrograph_5 = generate_hydrograph(hourly_accumulation_5)
-
-      # fig, axes = plt.subplots(nrows=2, ncols=3, sharey=True, sharex=True,figsize=[10,5])
-      # axes = axes.flatten()
-      # name = peaks_file_name.split('\\')[-1].split('.')[0].replace('@', ' ')
-      # sub_hydrograph.plot(label='no-peak',   ax=axes[0])
-      # hourly_hydrograph_1.plot(label='1am',  ax=axes[1])
-      # axes[1].axvline(peak_date.asfreq('H', how='start')+1, color ='k', linestyle='--')
-      # hourly_hydrograph_2.plot(label='12am', ax=axes[2])
-      # axes[2].axvline(peak_date.asfreq('H', how='start')+0, color ='k', linestyle='--')
-      # hourly_hydrograph_3.plot(label='11am', ax=axes[3])
-      # axes[3].axvline(peak_date.asfreq('H', how='start')+11, color ='k', linestyle='--')
-      # hourly_hydrograph_4.plot(label='11pm', ax=axes[4])
-      # axes[4].axvline(peak_date.asfreq('H', how='start')+23, color ='k', linestyle='--')
-      # hourly_hydrograph_4.plot(label='10pm', ax=axes[5])
-      # axes[5].axvline(peak_date.asfreq('H', how='start')+22, color ='k', linestyle='--')
-      # for ax in axes:
-      #   ax.axhline(peak_value, linestyle='-', color='k')
-      #   ax.legend()
-      # plt.suptitle(peak_date.strftime('%d %b %Y'))
-      # plt.tight_layout()
-      # plt.savefig(f"plots/{name}_{peak_date.strftime('%Y_%m_%d')}.png")
-
-      if(peak_type == "0"):
-        hourly_accumulation = insert_peak_1am(daily_accumulation, 
-        hourly_accumulation, peak_date, peak_value)
-        peak_log_file.write("Inserting peak of %.2f on %s at 1 AM\n" %  (peak_value, peak_date)) 
+  return pd.period_range(pd.Period(ordinal = ordinal, freq = freq), 
+    periods = periods, freq = freq)
 
-      if(peak_type == "1"):
-        hourly_accumulation = insert_peak_12am(daily_accumulation, 
-        hourly_accumulation, peak_date, peak_value)
-        peak_log_file.write("Inserting peak of %.2f on %s at 12 AM\n" % (peak_value, peak_date)) 
+def interval_freq(interval):
+  """
+  Accept an interval in minutes. Return its pandas frequency.
 
-      if(peak_type == "2"):
-        hourly_accumulation = insert_peak_11am(daily_accumulation, 
-        hourly_accumulation, peak_date, peak_value)
-        peak_log_file.write("Inserting peak of %.2f on %s at 11 AM\n" % (peak_value, peak_date))    
-       
-      if(peak_type == "3"):
-        hourly_accumulation = insert_peak_11pm(daily_accumulation, 
-        hourly_accumulation, peak_date, peak_value)
-        peak_log_file.write("Inserting peak of %.2f on %s at 11 PM\n" % (peak_value, peak_date))    
-          
-      if(peak_type == "4"):
-        hourly_accumulation = insert_peak_10pm(daily_accumulation, 
+  """
+
+  return 'H' if interval == 60 else '%dT' % interval
+
+def hourly_series(values, first_hour):
+  """
+  Accept an hourly array from core.py and the hour ordinal of its first
+  value. Return it as a Series on an hourly PeriodIndex. As in the
+  output files, each flow is labelled with the hour its interval ends
+  (the hydrograph's leading 0 is at its first hour).
+
+  """
+
+  return pd.Series(values, index = period_index(int(first_hour), 
+    np.size(values), 'H'))
+
+def ending_series(values, first_end, interval = 60, name = None):
+  """
+  Accept flows for consecutive intervals, the minute ordinal (since
+  1970-01-01 0000) of the end of the first interval, the interval in
+  minutes and (optional) series name. Return them as a Series on a
+  PeriodIndex of the interval, each flow labelled with the end of its
+  interval as in the output files and spline().
+
+  """
+
+  freq = interval_freq(interval)
+  return pd.Series(values, name = name, index = period_index(pd.Period(
+    ordinal = int(first_end), freq = 'T').asfreq(freq).ordinal, 
+    np.size(values), freq))
+
+peak_inserters = {
+  "0": (insert_peak_1am, "1 AM"),
+  "1": (insert_peak_12am, "12 AM"),
+  "2": (insert_peak_11am, "11 AM"),
+  "3": (insert_peak_11pm, "11 PM"),
+  "4": (insert_peak_10pm, "10 PM"),
+}
+
+def insert_peaks(daily_accumulation, hourly_accumulation, peak_dates, 
+  peak_values, peak_types, peak_log_file):
+  """
+  Accept daily_accumulation, hourly_accumulation, and matching lists of
+  peak dates, values and types. Insert each peak at the hour given by
+  its type (see peak_inserters) and log it. Return new
+  hourly_accumulation.
+
+  """
+
+  for peak_date, peak_value, peak_type in zip(peak_dates, peak_values, peak_types):
+    if peak_type in peak_inserters:
+      inserter, hour_label = peak_inserters[peak_type]
+      hourly_accumulation = inserter(daily_accumulation, 
         hourly_accumulation, peak_date, peak_value)
-        peak_log_file.write("Inserting peak of %.2f on %s at 10 PM\n" % (peak_value, peak_date))  
+      peak_log_file.write("Inserting peak of %.2f on %s at %s\n" % 
+        (peak_value, peak_date, hour_label))
 
-  else:
-    peak_log_file.write("No peaks specified")   
+  return hourly_accumulation
 
-  print ("Cleaning negative flows")
+def select_peaks(daily_accumulation, peak_dates, peak_values, peak_types):
+  """
+  Accept daily_accumulation and matching lists of peak dates, values and
+  types. Return the three lists restricted to peaks whose day lies 
+  entirely within daily_accumulation.
 
-  hourly_hydrograph = generate_hydrograph(hourly_accumulation)
-  linear_function = interp1d(hourly_accumulation.dropna().index.view('int64'), 
-                             hourly_accumulation.dropna().values, kind = 'linear')
-  count = 0
- 
-  while np.min(hourly_hydrograph) <= -0.01 and count < 15:
-    hourly_accumulation.loc[(hourly_hydrograph <0) | (hourly_hydrograph.shift(1) <0)] = linear_function(hourly_accumulation.loc[(hourly_hydrograph <0) | (hourly_hydrograph.shift(1) <0)].index.view('int64'))
-    hourly_hydrograph = generate_hydrograph(hourly_accumulation)
+  """
 
-    
-    count+=1
-    print (f"{count} iterations completed; min flow = {np.min(hourly_hydrograph)}") 
-    #print(hourly_hydrograph.loc[hourly_hydrograph<0].describe())
-
-  print ("Checking peaks") 
-
-  if peaks_file_name:     
-    for date in peak_dates:
-      peak_good = True
-      for hour in range(0, 24):
-        hourly_date = pd.Period(freq = "H", year = date.year, 
-          month = date.month, day = date.day, hour = hour)
-        hourly_ordinate = hourly_date
-        if (hourly_hydrograph[hourly_date] > (peak_dictionary[date] + 1) \
-          or hourly_hydrograph[hourly_date + 1] > (peak_dictionary[date] \
-          + 1)) and peak_good == True:
-        
-          print (f"Peak on Date: {real_dates[date].to_timestamp().strftime('%Y-%m-%d')} is being overestimated") 
-          peak_log_file.write("Peak on Date: %s is being overestimated\n" 
-            % (real_dates[date]))
-          peak_good = False
+  in_range = [i for i, peak_date in enumerate(peak_dates) 
+    if peak_date in daily_accumulation.index 
+    and peak_date + 1 in daily_accumulation.index]
 
+  return ([peak_dates[i] for i in in_range], 
+    [peak_values[i] for i in in_range], [peak_types[i] for i in in_range])
 
-  print ("Writing results to file")
+def clean_negative_flows(hourly_accumulation, max_iterations = 15, 
+  verbose = True, engine = "splrep"):
+  """
+  Accept hourly_accumulation and engine. Generate the hourly hydrograph and, while
+  it has flows below -0.01 cfs, constrain the accumulation at (and after)
+  every negative hour with a linear interpolation of the original
+  accumulation points, then recompute; repeat up to max_iterations
+  times, reporting progress if verbose. hourly_accumulation is updated
+  in place. Return hourly_hydrograph.
+
+  """
+
+  accumulation = hourly_accumulation.to_numpy(dtype=float, copy=True)
+  hourly_hydrograph = core.clean_negative_flows(accumulation, 
+    hourly_accumulation.index[0].ordinal, max_iterations, verbose, engine)
+  hourly_accumulation[:] = accumulation
+
+  return pd.Series(hourly_hydrograph, index = hourly_accumulation.index)
+
+def check_peaks(hourly_hydrograph, peak_dates, peak_dictionary, real_dates, 
+  peak_log_file):
+  """
+  Accept hourly_hydrograph and the peak information from
+  read_peaks_file. Report and log every peak date on which an hourly
+  flow exceeds the peak by more than 1 cfs.
+
+  """
 
-  output_file_name = location 
-  y_hourly_hydrograph_string = []
-  for y in hourly_hydrograph:
-    if y >= 0:
-      y_hourly_hydrograph_string.append("%.2f" % y)
-    else:
-      y_hourly_hydrograph_string.append("0.00")
-  output_file = open(output_file_name, "w")
+  peaks = core.peak_table([date.ordinal for date in peak_dates],
+    [peak_dictionary[date] for date in peak_dates], [""]*len(peak_dates))
+  overestimated = core.check_peaks(hourly_hydrograph.values, 
+    hourly_hydrograph.index[0].ordinal, peaks)
+
+  for date in [pd.Period(ordinal = day, freq='D') for day in overestimated]:
+    print (f"Peak on Date: {real_dates[date].to_timestamp().strftime('%Y-%m-%d')} is being overestimated") 
+    peak_log_file.write("Peak on Date: %s is being overestimated\n" 
+      % (real_dates[date]))
+
+def write_smooth_output(output_file_name, timeseries_info, start_date, 
+  chunks, interval = 60):
+  """
+  Accept output_file_name, timeseries_info, the raw start date string,
+  an iterable of flow arrays for consecutive intervals starting with the
+  interval ending at start date 0000 plus one interval, and the interval
+  in minutes. Write the flows chunk by chunk to a text file in dssts
+  compatible format with negative flows written as 0.00 and NaN 
+  (missing) flows as the DSS missing value. The file is written under a
+  temporary name and moved into place once complete.
+
+  """
+
+  epart = interval_epart(interval)
+  partial_file_name = output_file_name + ".part"
+  output_file = open(partial_file_name, "w")
   
   timeseries_info["fpart"] = "SYNTHETIC"
   output_file.write("/" + timeseries_info["apart"])
   output_file.write("/" + timeseries_info["bpart"])
   output_file.write("/" + timeseries_info["cpart"])
-  output_file.write("/" + "/" + "1hour")
+  output_file.write("/" + "/" + epart)
   output_file.write("/" + timeseries_info["fpart"] + "/")
   output_file.write("\n")
   output_file.write("CFS\n")
   output_file.write("PER-AVER\n")
-  output_file.write(start_date + " 0100\n")
+  output_file.write(start_date + " %02d%02d\n" % divmod(interval, 60))
    
-  for o in range(1, np.size(hourly_accumulation)):
-    output_file.write(y_hourly_hydrograph_string[o])
-    output_file.write("\n")
+  for chunk in chunks:
+    y = clip_negative(chunk, MISSING)
+    np.savetxt(output_file, y, fmt="%.2f")
   
   output_file.write("END")
   output_file.write("\n")
   output_file.write("FINISH")
   output_file.close()
+  # Only a finished file is moved into place, so a crash never leaves a
+  # truncated output under the final name.
+  os.replace(partial_file_name, output_file_name)
+
+class LogLines(list):
+  """
+  A log sink collecting the lines written to it, for the core functions
+  that write to a log file.
+
+  """
+
+  def write(self, text):
+    self.append(text)
+
+def smooth_record(daily_flow_readlines, location = "", peaks = None,
+  interval = 60, engine = "splrep", correct_overestimated = False,
+  dtype = None, min_steady_days = None, warm_start = False,
+  saved_knots = None, progress = None):
+  """
+  Accept the data lines of a daily timeseries input file (header
+  removed), the gage location name used in log messages, (optional)
+  peak table and the spline() settings; saved_knots is the
+  core.read_knot_file result of an earlier warm_start run. Smooth the
+  record as spline() does, without touching any file or stdout:
+  progress messages go to the progress function, if given. Safe to run
+  on several threads at once. Return a dictionary of "hydrograph"
+  (hourly, with a leading 0), "first_hour", "chunks" (a generator of the
+  output flows at interval, as written by spline()) and the
+  diagnostics: "missing_log" and "peak_log" (lists of the lines spline()
+  writes to its logs), "overestimated" and "corrected" (peak dates) and
+  "min_flow"; with warm_start also "constrained_hours" and "digest" for
+  core.write_knot_file.
+
+  """
+
+  report = progress or (lambda message: None)
+  check_interval(interval)
+  if dtype is not None and (min_steady_days or warm_start):
+    raise ValueError("dtype cannot be combined with min_steady_days or warm_start")
+  missing_log, peak_log = LogLines(), LogLines()
+  result = {"missing_log": missing_log, "peak_log": peak_log}
+
+  knot_days, flows = core.read_daily_lines(daily_flow_readlines, location, 
+    missing_log)
+      
+  report ("Generating smoothed (hourly) timeseries")
+
+  # The accumulation is kept as its knots; hourly values are only
+  # evaluated from the fit
+  daily_accumulation, hours, values, first_hour, size = core.build_knots(
+    knot_days, flows)
+  
+  if peaks is not None: 
+    peaks = core.select_peaks(knot_days, peaks)
+    hours, values = core.insert_knots(hours, values, *core.peak_knots(
+      knot_days, daily_accumulation, peaks, peak_log))
+  else:
+    peak_log.write("No peaks specified")   
+
+  report ("Cleaning negative flows")
+
+  spans, seed_hours, max_iterations = None, None, 15
+  if warm_start:
+    digest = core.knot_digest(hours, values, size, engine, min_steady_days)
+    if saved_knots is not None:
+      seed_hours = saved_knots["hours"] - first_hour
+      if saved_knots["digest"] == digest:
+        max_iterations = 0
+      report (f"Starting from {seed_hours.size} saved knots")
+    initial_hours, initial_values = hours, values
+
+  verbose = progress or False
+  if min_steady_days:
+    spans = core.steady_spans(hours, values, size, min_steady_days)
+    y, hours, values = core.clean_thinned_flows(hours, values, first_hour,
+      size, spans, max_iterations, verbose, engine, seed_hours = seed_hours)
+  elif dtype is None:
+    y, hours, values = core.clean_knot_flows(hours, values, first_hour, size,
+      max_iterations, verbose, engine, seed_hours = seed_hours)
+  else:
+    offsets, local = core.rebase_knots(hours, values, size, dtype)
+    y, hours, local = core.clean_rebased_knot_flows(offsets, hours, local,
+      first_hour, size, verbose = verbose, engine = engine)
+    values = core.restore_knots(offsets, hours, local)
+
+  if warm_start:
+    result["constrained_hours"] = first_hour + core.constrained_hours(
+      initial_hours, initial_values, hours, values)
+    result["digest"] = digest
+
+  report ("Checking peaks") 
+
+  result["overestimated"], result["corrected"] = [], []
+  windows = []
+  if peaks is not None:     
+    overestimated = core.check_peaks(y, first_hour, peaks)
+    if correct_overestimated and overestimated:
+      # The output outside the corrected windows stays on the knots
+      # it was fit from
+      remaining = core.correct_peaks(core.knot_accumulation(hours, values,
+        size), first_hour, y, peaks, overestimated, engine, windows = windows)
+      for day in sorted(set(overestimated) - set(remaining)):
+        real_date = core.day_string(day - core.FAUX_OFFSET)
+        result["corrected"].append(real_date)
+        peak_log.write("Peak on Date: %s was overestimated and corrected\n"
+          % real_date)
+      overestimated = remaining
+    for day in overestimated:
+      real_date = core.day_string(day - core.FAUX_OFFSET)
+      result["overestimated"].append(real_date)
+      report (f"Peak on Date: {real_date} is being overestimated") 
+      peak_log.write("Peak on Date: %s is being overestimated\n" 
+        % real_date)
+
+  if interval == 60:
+    chunks = (y[i:i + CHUNK_HOURS] for i in range(1, y.size, CHUNK_HOURS))
+  elif spans:
+    chunks = core.thinned_chunks(hours, values, first_hour, size, spans,
+      interval, engine)
+  elif dtype is not None:
+    chunks = core.rebased_knot_chunks(offsets, hours, local, first_hour, size,
+      interval, engine)
+  else:
+    chunks = core.knot_chunks(hours, values, first_hour, size, interval, 
+      engine = engine)
+  if interval != 60 and windows:
+    chunks = core.splice_chunks(chunks, windows, first_hour, interval, engine)
+
+  result.update({"hydrograph": y, "first_hour": first_hour,
+    "chunks": chunks, "min_flow": float(np.min(y))})
+  return result
+
+def spline(daily_flow_filename, location, peaks_file_name = False, 
+  interval = 60, engine = "splrep", correct_overestimated = False,
+  dtype = None, min_steady_days = None, warm_start = False):
+  """ 
+  Accept daily timeseries input filename, gage location name, and 
+  (optional) filename for irregular time series of peaks. Create a 
+  summation time series from daily average flows. Insert additional 
+  points to reflect peak flow information, if known. Develop a spline
+  function to "smoothly" interpolate between points on accumulation 
+  curve. Differentiate spline function on an hourly basis to generate a
+  "smoothed" hourly flow timeseries. Check for negative flows and add 
+  additional points to the accumulation curve (based on a linear 
+  interpolation of daily plus peak accumulation curve) to further 
+  constrain the spline interpolation. Recompute spline and check for 
+  negative flows; repeat up to 15 iterations or until minimum flow is 
+  greater than -0.01 cfs. Write resulting hydrograph to a text file in
+  dssts compatible format, at interval minutes (default hourly). The
+  interpolation engine is any name registered in engines.py or a fit
+  function. If correct_overestimated, peaks the hydrograph overestimates
+  are corrected locally (see core.correct_peaks) rather than only
+  reported. If dtype is given (e.g. np.float32), the accumulation is
+  stored re-based on each day's volume as dtype and fit a block at a
+  time (see core.rebase_knots), sub-hourly output included; the block
+  fits only approximate the whole-record fit, so hourly flows differ
+  from the default result around sharp peaks (see
+  core.clean_rebased_knot_flows). If min_steady_days is given, runs
+  of at least that many days of constant flow are written at that flow
+  and only the spans between them are fit (see core.steady_spans). If
+  warm_start, the hours negative flow cleaning constrained are saved to
+  location + "_knots.npz" and the next run constrains them before its
+  first fit; on unchanged inputs it then needs no further iterations.
+  The smoothing itself is smooth_record(); this function reads the
+  files, prints progress and writes the output, the location +
+  "_missing.log" and "_peaks.log" logs and the saved knots. Return the
+  hourly hydrograph on real dates, labelled by the end of each hour as
+  in the output file (its leading 0 at 0000 of the first day).
+  
+  """
+ 
+  start_timer = time.time()
+  check_interval(interval)
+ 
+  with open(daily_flow_filename, "r") as daily_flow_file:
+    daily_flow_readlines = daily_flow_file.readlines()
+  timeseries_info = read_timeseries_info(daily_flow_readlines)
+  del daily_flow_readlines[0:7]
+  start_date = daily_flow_readlines[0].strip().split()[1]
+
+  print (f"Reading input timeseries for {location}") 
+
+  knot_file_name = location + "_knots.npz"
+  result = smooth_record(daily_flow_readlines, location, 
+    core.read_peak_table(peaks_file_name) if peaks_file_name else None,
+    interval, engine, correct_overestimated, dtype, min_steady_days,
+    warm_start, core.read_knot_file(knot_file_name) if warm_start else None,
+    progress = print)
+
+  for log_file_name, lines in ((location + "_missing.log", 
+    result["missing_log"]), (location + "_peaks.log", result["peak_log"])):
+    with open(log_file_name, "w") as log_file:
+      log_file.writelines(lines)
+  if warm_start:
+    core.write_knot_file(knot_file_name, result["constrained_hours"], 
+      result["digest"])
+
+  print ("Writing results to file")
+
+  write_smooth_output(location, timeseries_info, start_date, result["chunks"],
+    interval)
 
   end_timer = time.time()
   compute_time = (end_timer-start_timer)/60
   print( f"Compute time: {compute_time:.2f} minutes")
 
+  return hourly_series(result["hydrograph"], 
+    result["first_hour"] - 24*core.FAUX_OFFSET)
+
+def smooth_window(daily_flow_filename, start, end, peaks_file_name = False,
+  padding = None, interval = 60, engine = "splrep"):
+  """
+  Accept daily timeseries input filename, window start and end dates 
+  (anything pd.Period accepts), (optional) peaks filename, padding in
+  days (defaults to support_padding()), output interval in minutes and
+  engine.
+  Read only the daily values from start - padding to end + padding,
+  insert the peaks inside that range, clean negative flows and generate
+  the hydrograph as spline() does. Return the hydrograph (unclipped, 
+  period-ending, real dates) for every interval of start through end:
+  from start 0000 plus one interval to 0000 of the day after end.
+
+  """
+
+  if padding is None:
+    padding = support_padding()
+  start = pd.Period(start, freq='D')
+  end = pd.Period(end, freq='D')
+
+  with open(daily_flow_filename, "r") as daily_flow_file:
+    records = itertools.islice(daily_flow_file, 7, None)
+    first_line = next(records)
+    record_start = read_date(first_line.strip().split()[1])
+    first_offset = max((start - padding - record_start).n, 0)
+    last_offset = (end + padding - record_start).n
+    if last_offset < first_offset:
+      raise ValueError(f"{start} to {end} is outside of {daily_flow_filename}")
+    # One line past the padded window tells whether the record ends inside it
+    lines = itertools.chain([first_line], records)
+    daily_flow_readlines = list(itertools.islice(lines, first_offset, 
+      last_offset + 2))
+
+  record_end = len(daily_flow_readlines) <= last_offset - first_offset + 1
+  daily_flow_readlines = daily_flow_readlines[:last_offset - first_offset + 1]
+  if not daily_flow_readlines:
+    raise ValueError(f"{start} to {end} is outside of {daily_flow_filename}")
+  expected_date = record_start + first_offset
+  if read_date(daily_flow_readlines[0].strip().split()[1]) != expected_date:
+    raise ValueError(f"{daily_flow_filename} is not a continuous daily record")
+
+  knot_days, flows = core.read_daily_lines(daily_flow_readlines, 
+    daily_flow_filename, io.StringIO())
+  daily_accumulation, accumulation, first_hour = core.build_accumulation(
+    knot_days, flows, record_end = record_end)
+
+  if peaks_file_name:
+    core.insert_peaks(knot_days, daily_accumulation, accumulation, 
+      core.select_peaks(knot_days, core.read_peak_table(peaks_file_name)))
+
+  core.clean_negative_flows(accumulation, first_hour, verbose = False, 
+    engine = engine)
+
+  per_hour = check_interval(interval)
+  y = np.concatenate([[0.]] + list(core.hydrograph_chunks(accumulation, 
+    first_hour, interval, engine = engine)))
+  first = 24*(start.ordinal + core.FAUX_OFFSET) - first_hour
+  last = 24*(end.ordinal + core.FAUX_OFFSET) + 23 - first_hour
+  y = y[first*per_hour + 1:(last + 1)*per_hour + 1]
+
+  return ending_series(y, 1440*start.ordinal + interval, interval)
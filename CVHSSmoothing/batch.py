@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from CVHSSmoothing.catalog import Catalog
+from CVHSSmoothing.Spline import spline
+from CVHSSmoothing.validation import validate_output_file
+
+def file_hash(file_name):
+  """
+  Accept file_name. Return the sha256 hex digest of the file contents,
+  or None if the file does not exist.
+
+  """
+
+  if not file_name or not os.path.exists(file_name):
+    return None
+  digest = hashlib.sha256()
+  with open(file_name, "rb") as f:
+    for block in iter(lambda: f.read(1 << 20), b""):
+      digest.update(block)
+  return digest.hexdigest()
+
+def is_finished_output(output_file_name):
+  """
+  Accept output_file_name. Return True if the file exists and ends with
+  the FINISH line written by spline(), False otherwise.
+
+  """
+
+  if not os.path.exists(output_file_name):
+    return False
+  with open(output_file_name, "rb") as f:
+    f.seek(0, os.SEEK_END)
+    f.seek(max(f.tell() - 16, 0))
+    return f.read().rstrip().endswith(b"FINISH")
+
+def read_journal(journal_file_name):
+  """
+  Accept journal_file_name. Return the batch progress journal as a
+  dictionary with "completed" and "failed" entries keyed by location. A
+  missing journal returns an empty one.
+
+  """
+
+  journal = {"completed": {}, "failed": {}}
+  if os.path.exists(journal_file_name):
+    with open(journal_file_name, "r") as f:
+      journal.update(json.load(f))
+  return journal
+
+def write_journal(journal, journal_file_name):
+  """
+  Accept journal and journal_file_name. Write the journal to a temporary
+  file in the same directory and atomically move it over the previous
+  journal, so an interrupted write never leaves a corrupt journal.
+
+  """
+
+  journal_dir = os.path.dirname(os.path.abspath(journal_file_name))
+  fd, tmp_name = tempfile.mkstemp(dir=journal_dir, suffix=".tmp")
+  try:
+    with os.fdopen(fd, "w") as f:
+      json.dump(journal, f, indent=2, sort_keys=True)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_name, journal_file_name)
+  except BaseException:
+    if os.path.exists(tmp_name):
+      os.remove(tmp_name)
+    raise
+
+def _input_hashes(daily_flow_filename, peaks_file_name):
+  return {"daily": file_hash(daily_flow_filename),
+    "peaks": file_hash(peaks_file_name) if peaks_file_name else None}
+
+def journal_options(options):
+  """
+  Accept one job's spline() keyword arguments. Return them as stored in
+  the journal: dtypes (e.g. np.float32) by name, other values as they
+  are. Raise TypeError for values the journal cannot store, e.g. an
+  engine fit function (register it and pass its name instead).
+
+  """
+
+  stored = {}
+  for key, value in options.items():
+    if isinstance(value, (type, np.dtype)):
+      try:
+        value = np.dtype(value).name
+      except TypeError:
+        pass
+    try:
+      json.dumps(value)
+    except (TypeError, ValueError):
+      raise TypeError(f"Option {key}={value!r} cannot be stored in the batch "
+        "journal; pass a JSON value (a registered engine name, not a "
+        "function)")
+    stored[key] = value
+  return stored
+
+def is_job_done(journal, daily_flow_filename, location, peaks_file_name = False):
+  """
+  Accept journal and the spline() arguments of one job. Return True if
+  the journal records the job as completed, the output file is finished
+  and unchanged since it was recorded, and the inputs are unchanged.
+
+  """
+
+  entry = journal["completed"].get(location)
+  if entry is None or not is_finished_output(location):
+    return False
+  if entry["output"] != file_hash(location):
+    return False
+  return entry["inputs"] == _input_hashes(daily_flow_filename, peaks_file_name)
+
+def run_job(smoother, daily_flow_filename, location, peaks_file_name,
+  options, catalog_dir = None, validate = False):
+  """
+  Accept the smoother, one job's spline() arguments and options,
+  (optional) results catalog directory and whether to validate. Run it,
+  check that its output was finished, run its daily volume check and
+  add it to the catalog; the hydrograph spline() returns is checked
+  unclipped as well (see validate_output_file). Return the error (None
+  on success), the run time in seconds and the volume check (None if
+  not validated).
+
+  """
+
+  start_timer = time.time()
+  report = None
+  try:
+    hydrograph = smoother(daily_flow_filename, location, peaks_file_name,
+      **options)
+    if not is_finished_output(location):
+      raise RuntimeError(f"{location} was not written completely")
+    if validate:
+      # spline() returns the hourly hydrograph; other smoothers may not
+      report = validate_output_file(location, daily_flow_filename, worst = 1,
+        hydrograph = hydrograph if isinstance(hydrograph, pd.Series) else None)
+    if catalog_dir:
+      with Catalog(catalog_dir) as catalog:
+        catalog.add_output(location)
+  except Exception as e:
+    return f"{type(e).__name__}: {e}", time.time() - start_timer, None
+  return None, time.time() - start_timer, report
+
+def failed_attempts(journal, daily_flow_filename, location, peaks_file_name):
+  """
+  Accept the journal and one job's spline() arguments. Return the number
+  of times the job has failed with its current inputs; a failure with
+  other daily or peaks files (e.g. since fixed) does not count.
+
+  """
+
+  failure = journal["failed"].get(location)
+  if failure is None or failure.get("inputs") != _input_hashes(
+    daily_flow_filename, peaks_file_name):
+    return 0
+  return failure["attempts"]
+
+def record_job(journal, daily_flow_filename, location, peaks_file_name,
+  options, error, seconds, report = None):
+  """
+  Accept the journal, one job's spline() arguments and options, and the
+  error, run time and volume check from run_job. Record the job as
+  failed (counting the attempt, with the sha256 of its inputs) or
+  completed, with the sha256 of its output and inputs and its volume
+  check.
+
+  """
+
+  inputs = _input_hashes(daily_flow_filename, peaks_file_name)
+  if error is not None:
+    failure = {"attempts": failed_attempts(journal, daily_flow_filename,
+      location, peaks_file_name) + 1, "error": error, "inputs": inputs}
+    journal["failed"][location] = failure
+    print (f"Failed {location} (attempt {failure['attempts']}): {failure['error']}")
+    return
+
+  journal["failed"].pop(location, None)
+  journal["completed"][location] = {
+    "output": file_hash(location),
+    "inputs": inputs,
+    "options": journal_options(options),
+    "seconds": round(seconds, 3)}
+  if report is not None:
+    journal["completed"][location]["volume"] = report
+    print (f"{location} daily volume error: max {report['max_error']}, mean {report['mean_error']}")
+    if "unclipped" in report:
+      print (f"{location} unclipped daily volume error: max {report['unclipped']['max_error']}")
+
+def run_batch(jobs, journal_file_name, max_attempts = 3, smoother = spline,
+  validate = True, workers = 1, catalog_dir = None):
+  """
+  Accept jobs, an iterable of (daily_flow_filename, location,
+  peaks_file_name) tuples as passed to spline(), optionally followed by
+  a dictionary of keyword arguments for that gauge (e.g. {"engine":
+  "pchip"}), and journal_file_name. Run each job that the progress
+  journal does not record as completed with the same options,
+  recording the sha256 of the output and inputs after every finished
+  job. Failed jobs are recorded with their attempt count, error and
+  input sha256s, and are retried on later runs until max_attempts is
+  reached; changing a failed job's daily or peaks file resets its count.
+  Options must be JSON values (dtypes are stored by name); any other
+  option raises TypeError before a job is run. If validate,
+  the daily volume check of each finished output is stored with its
+  journal entry. With workers > 1 the jobs run on a process pool (the
+  smoother must then be picklable) and are recorded as they finish. If
+  catalog_dir is given, each finished output is also added to that
+  results catalog (see catalog.py) by the process that wrote it. Return
+  the journal.
+
+  """
+
+  journal = read_journal(journal_file_name)
+  pending = []
+
+  for job in jobs:
+    daily_flow_filename, location, peaks_file_name = job[:3]
+    options = dict(job[3]) if len(job) > 3 else {}
+    stored_options = journal_options(options)
+
+    if is_job_done(journal, daily_flow_filename, location, peaks_file_name) \
+      and journal["completed"][location].get("options", {}) == stored_options:
+      print (f"Skipping {location}, already completed")
+      continue
+
+    attempts = failed_attempts(journal, daily_flow_filename, location,
+      peaks_file_name)
+    if attempts >= max_attempts:
+      print (f"Skipping {location}, failed {attempts} times")
+      continue
+
+    journal["completed"].pop(location, None)
+    pending.append((daily_flow_filename, location, peaks_file_name, options))
+
+  if workers > 1 and len(pending) > 1:
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+      futures = {executor.submit(run_job, smoother, *job, catalog_dir,
+        validate): job for job in pending}
+      for future in as_completed(futures):
+        record_job(journal, *futures[future], *future.result())
+        write_journal(journal, journal_file_name)
+  else:
+    for job in pending:
+      record_job(journal, *job, *run_job(smoother, *job, catalog_dir,
+        validate))
+      write_journal(journal, journal_file_name)
+
+  return journal
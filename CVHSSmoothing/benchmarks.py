@@ -0,0 +1,289 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scipy
+
+from CVHSSmoothing import core
+from CVHSSmoothing.compare_engines import run_engine, synthetic_record
+from CVHSSmoothing.segments import spline_segments
+from CVHSSmoothing.Spline import MISSING, spline
+from CVHSSmoothing.streaming import stream_hydrograph
+from CVHSSmoothing.validation import read_output_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, "benchmark_baseline.json")
+DEER_CREEK = os.path.join(ROOT, "USBC_1DAY", "Yuba-Feather", "CVHS",
+  "DEER_CR_NR_SMARTVILLE.txt")
+DEER_CREEK_PEAKS = os.path.join(ROOT, "USBC_PEAKS", "DEER_CR_NR_SMARTVILLE.txt")
+DEER = os.path.join(ROOT, "USBC_1DAY", "Yuba-Feather", "WCM_Update", "DEER.txt")
+
+# Allowed growth over the baseline before a case fails: ratio, plus an
+# absolute allowance so that very short cases are not flagged by noise
+TIME_THRESHOLD = 1.25
+TIME_ALLOWANCE = 0.05
+MEMORY_THRESHOLD = 1.20
+MEMORY_ALLOWANCE = 1.0
+# Relative drift allowed in the output summary statistics
+OUTPUT_TOLERANCE = 1e-6
+
+def spline_output(daily_flow_filename, *args, function = spline,
+  first_day = 0, days = None, **kwargs):
+  """
+  Accept a daily timeseries input filename and the spline() (or
+  function) arguments after it, plus the first day and number of days
+  of the record to keep. Run it on that excerpt in a temporary
+  directory with its printing suppressed. Return the written values.
+
+  """
+
+  with open(daily_flow_filename, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()
+  last_day = None if days is None else 7 + first_day + days
+  with tempfile.TemporaryDirectory() as directory:
+    input_file_name = os.path.join(directory, "benchmark.txt")
+    output_file_name = os.path.join(directory, "benchmark.out")
+    with open(input_file_name, "w") as input_file:
+      input_file.writelines(lines[:7] + lines[7 + first_day:last_day])
+    with contextlib.redirect_stdout(io.StringIO()):
+      function(input_file_name, output_file_name, *args, **kwargs)
+    return read_output_values(output_file_name)[0]
+
+def synthetic_stream(years, seed):
+  days, flows, peaks = synthetic_record(int(365.25*years), seed)
+  return np.concatenate(list(stream_hydrograph(flows,
+    days[0].ordinal + core.FAUX_OFFSET, peaks)))
+
+# Benchmark cases: name -> function returning the output values
+BENCHMARK_CASES = {
+  "spline_deer_creek_peaks": lambda: spline_output(DEER_CREEK,
+    DEER_CREEK_PEAKS, first_day = 15000, days = 3650),
+  "spline_deer_15_minute": lambda: spline_output(DEER, False, 15,
+    days = 1825),
+  "segments_deer_creek": lambda: spline_output(DEER_CREEK, DEER_CREEK_PEAKS,
+    function = spline_segments, first_day = 15000, days = 3650),
+  "pchip_synthetic_20_years": lambda: run_engine("pchip",
+    *synthetic_record(int(365.25*20), 0)),
+  "stream_synthetic_50_years": lambda: synthetic_stream(50, 1),
+  "read_peaks": lambda: core.read_peak_table(DEER_CREEK_PEAKS)["value"],
+}
+
+def output_summary(values):
+  """
+  Accept output values. Return their count, NaN count, sum, min and max
+  and a SHA-256 of the values rounded to the two decimals written to the
+  output files.
+
+  """
+
+  values = np.asarray(values, dtype=float)
+  finite = values[np.isfinite(values)]
+  rounded = np.round(np.nan_to_num(values, nan = MISSING), 2)
+  return {
+    "values": int(values.size),
+    "nan": int(values.size - finite.size),
+    "sum": float(finite.sum()),
+    "min": float(finite.min()) if finite.size else None,
+    "max": float(finite.max()) if finite.size else None,
+    "sha256": hashlib.sha256(rounded.tobytes()).hexdigest(),
+  }
+
+def run_case(case, repeat = 3):
+  """
+  Accept a benchmark function and the number of timed runs. Run it
+  once to warm up, then under tracemalloc for its peak allocation, then time it (best of
+  repeat) and summarise its output. Return the case result dictionary.
+
+  """
+
+  # Warm up imports, caches and JIT compilation first
+  case()
+  tracemalloc.start()
+  case()
+  peak_memory = tracemalloc.get_traced_memory()[1] / 2**20
+  tracemalloc.stop()
+
+  timings = []
+  for i in range(repeat):
+    start_timer = time.perf_counter()
+    values = case()
+    timings.append(time.perf_counter() - start_timer)
+
+  return {"seconds": min(timings), "memory_mb": peak_memory,
+    "output": output_summary(values)}
+
+def environment():
+  """
+  Return the interpreter, dependency versions and machine the results
+  were measured with.
+
+  """
+
+  return {"python": platform.python_version(), "numpy": np.__version__,
+    "pandas": pd.__version__, "scipy": scipy.__version__,
+    "machine": platform.machine(), "processor": platform.processor(),
+    "system": platform.system()}
+
+def run_benchmarks(cases = None, repeat = 3):
+  """
+  Accept (optional) case names (defaults to every case in
+  BENCHMARK_CASES) and the number of timed runs. Return the results:
+  the environment and a dictionary of case name to run_case result.
+
+  """
+
+  results = {}
+  for name in cases or BENCHMARK_CASES:
+    print (f"Running {name}")
+    results[name] = run_case(BENCHMARK_CASES[name], repeat)
+  return {"environment": environment(), "cases": results}
+
+def read_baseline(baseline_file = BASELINE_FILE):
+  """
+  Accept the baseline file name. Return the stored results, or None if
+  there is no baseline.
+
+  """
+
+  if not os.path.exists(baseline_file):
+    return None
+  with open(baseline_file, "r") as f:
+    return json.load(f)
+
+def write_baseline(results, baseline_file = BASELINE_FILE):
+  """
+  Accept benchmark results and the baseline file name. Write the
+  results as the new baseline, keeping any stored cases that were not
+  rerun.
+
+  """
+
+  baseline = read_baseline(baseline_file) or {"cases": {}}
+  baseline["environment"] = results["environment"]
+  baseline["cases"].update(results["cases"])
+  with open(baseline_file, "w") as f:
+    json.dump(baseline, f, indent = 2, sort_keys = True)
+    f.write("\n")
+
+def relative_change(current, baseline):
+  if baseline == current:
+    return 0.
+  return (current - baseline) / abs(baseline) if baseline else np.inf
+
+def compare_results(results, baseline, time_threshold = TIME_THRESHOLD,
+  memory_threshold = MEMORY_THRESHOLD, output_tolerance = OUTPUT_TOLERANCE):
+  """
+  Accept benchmark results, the baseline and the thresholds. A case
+  fails if its time or peak memory grows past threshold times the
+  baseline (plus a small absolute allowance), its output count changes
+  or its output statistics drift by more than output_tolerance
+  (relative to the largest magnitude). A checksum change within
+  tolerance is reported but does not fail. Return a DataFrame of
+  checks (case, check, baseline, current, change, status).
+
+  """
+
+  rows = []
+  for name, result in results["cases"].items():
+    stored = baseline["cases"].get(name)
+    if stored is None:
+      rows.append([name, "baseline", None, None, None, "new"])
+      continue
+
+    limit = stored["seconds"]*time_threshold + TIME_ALLOWANCE
+    rows.append([name, "seconds", stored["seconds"], result["seconds"],
+      relative_change(result["seconds"], stored["seconds"]),
+      "FAIL" if result["seconds"] > limit else "ok"])
+    limit = stored["memory_mb"]*memory_threshold + MEMORY_ALLOWANCE
+    rows.append([name, "memory_mb", stored["memory_mb"], result["memory_mb"],
+      relative_change(result["memory_mb"], stored["memory_mb"]),
+      "FAIL" if result["memory_mb"] > limit else "ok"])
+
+    output, stored_output = result["output"], stored["output"]
+    scale = max(abs(stored_output["min"] or 0), abs(stored_output["max"] or 0),
+      abs(stored_output["sum"]) / max(stored_output["values"], 1), 1.)
+    for check in ("values", "nan", "sum", "min", "max"):
+      old, new = stored_output[check], output[check]
+      if check in ("values", "nan") or old is None or new is None:
+        failed = old != new
+      else:
+        # The sum is compared as a mean per value
+        count = max(stored_output["values"], 1) if check == "sum" else 1
+        failed = abs(new - old)/count > output_tolerance*scale
+      rows.append([name, f"output {check}", old, new,
+        relative_change(new, old) if None not in (old, new) else None,
+        "FAIL" if failed else "ok"])
+    rows.append([name, "output sha256", stored_output["sha256"][:12],
+      output["sha256"][:12], None,
+      "ok" if stored_output["sha256"] == output["sha256"] else "changed"])
+
+  return pd.DataFrame(rows, columns = ["case", "check", "baseline",
+    "current", "change", "status"])
+
+def format_report(report, baseline, results, show_all = False):
+  """
+  Accept the compare_results DataFrame, the baseline and the results.
+  Return a readable report: environment changes, then the failed and
+  changed checks (or every check if show_all).
+
+  """
+
+  lines = []
+  for key, value in results["environment"].items():
+    stored = baseline.get("environment", {}).get(key)
+    if stored != value:
+      lines.append(f"Environment {key}: {stored} -> {value}")
+  shown = report if show_all else report[report.status != "ok"]
+  if shown.empty:
+    lines.append(f"All {report.case.nunique()} cases within thresholds")
+  else:
+    with pd.option_context("display.width", 200, "display.max_columns", 10,
+      "display.max_rows", None, "display.float_format", "{:.6g}".format):
+      shown = shown.assign(change = shown.change.map(lambda change:
+        "" if change is None or pd.isna(change) else f"{change:+.1%}"
+        if change == 0 or abs(change) >= 0.001 else f"{change:+.1e}"))
+      lines.append(shown.to_string(index = False))
+  return "\n".join(lines)
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description =
+    "Run the benchmark cases and compare them with the stored baseline.")
+  parser.add_argument("--cases", nargs = "+", choices = list(BENCHMARK_CASES),
+    help = "cases to run (default: all)")
+  parser.add_argument("--repeat", type = int, default = 3,
+    help = "timed runs per case; the best is kept")
+  parser.add_argument("--baseline", default = BASELINE_FILE)
+  parser.add_argument("--update", action = "store_true",
+    help = "store the results as the new baseline instead of comparing")
+  parser.add_argument("--time-threshold", type = float, default = TIME_THRESHOLD)
+  parser.add_argument("--memory-threshold", type = float,
+    default = MEMORY_THRESHOLD)
+  parser.add_argument("--output-tolerance", type = float,
+    default = OUTPUT_TOLERANCE)
+  parser.add_argument("--all", action = "store_true",
+    help = "show every check, not only failures and changes")
+  args = parser.parse_args(argv)
+
+  results = run_benchmarks(args.cases, args.repeat)
+  baseline = read_baseline(args.baseline)
+  if args.update or baseline is None:
+    write_baseline(results, args.baseline)
+    print (f"Baseline written to {args.baseline}")
+    return 0
+
+  report = compare_results(results, baseline, args.time_threshold,
+    args.memory_threshold, args.output_tolerance)
+  print (format_report(report, baseline, results, args.all))
+  return 1 if (report.status == "FAIL").any() else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,288 @@
+import argparse
+import glob
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from CVHSSmoothing import core
+from CVHSSmoothing.Spline import ending_series
+from CVHSSmoothing.validation import read_output_values
+
+# Values are stored as little-endian float64, NaN for missing
+VALUE_DTYPE = np.dtype("<f8")
+INDEX_FILE = "index.sqlite"
+VALUES_FILE = "values.f8"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+  id INTEGER PRIMARY KEY,
+  gauge TEXT NOT NULL,
+  apart TEXT, bpart TEXT, cpart TEXT, epart TEXT, fpart TEXT,
+  units TEXT, type TEXT,
+  start INTEGER NOT NULL,
+  interval INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  offset INTEGER NOT NULL,
+  source TEXT,
+  complete INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS records_gauge ON records (gauge, interval);
+"""
+
+COLUMNS = ("id", "gauge", "apart", "bpart", "cpart", "epart", "fpart",
+  "units", "type", "start", "interval", "count", "offset", "source")
+
+def minute_ordinal(date):
+  """
+  Accept a date as DDMMMYYYY or anything numpy reads as a date, with an
+  optional HHMM time after a space (2400 is the end of the day). Return
+  it as minutes since 1970-01-01 0000.
+
+  """
+
+  date, _, time = str(date).strip().partition(" ")
+  if "-" in date:
+    day = int(np.datetime64(date, "D").astype(np.int64))
+  else:
+    day = core.day_ordinal(date, faux = False)
+  time = time.strip() or "0000"
+  return 1440*day + 60*int(time[:2]) + int(time[2:4])
+
+def read_output_header(output_file_name):
+  """
+  Accept the name of a dssts output file written by spline(). Return
+  its DSS pathname parts, units and type (the timeseries_info keys) and
+  the minute ordinal of the end of its first interval.
+
+  """
+
+  with open(output_file_name, "r") as output_file:
+    lines = [output_file.readline().strip() for i in range(4)]
+  parts = lines[0].split("/")
+  info = dict(zip(("apart", "bpart", "cpart", "dpart", "epart", "fpart"),
+    parts[1:7]))
+  del info["dpart"]
+  info["units"], info["type"] = lines[1], lines[2]
+  return info, minute_ordinal(lines[3])
+
+class Catalog(object):
+  """
+  An on-disk catalog of smoothed results: an SQLite index of each
+  record's gauge, DSS pathname parts, start, interval and count, and one
+  fixed-width binary file of their values. Any gauge and date range is
+  read by memory-mapping just those values. Processes may append to the
+  same catalog at once: space is reserved in the index, then written
+  outside the lock. A record is only visible once its values are
+  written.
+
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok = True)
+    self.values_file_name = os.path.join(directory, VALUES_FILE)
+    self.connection = sqlite3.connect(os.path.join(directory, INDEX_FILE),
+      timeout = 60, isolation_level = None)
+    self.connection.executescript(SCHEMA)
+    if not os.path.exists(self.values_file_name):
+      open(self.values_file_name, "ab").close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    self.connection.close()
+
+  def transaction(self, statements):
+    """
+    Accept a function of the connection. Run it in an exclusive write
+    transaction. Return its result.
+
+    """
+
+    self.connection.execute("BEGIN IMMEDIATE")
+    try:
+      result = statements(self.connection)
+    except BaseException:
+      self.connection.execute("ROLLBACK")
+      raise
+    self.connection.execute("COMMIT")
+    return result
+
+  def append(self, gauge, info, start, interval, values, source = None):
+    """
+    Accept the gauge name, timeseries_info (DSS pathname parts, units and
+    type), the minute ordinal of the end of the first interval, the
+    interval in minutes, the values and (optional) source file name.
+    Store the values as the gauge's record at that interval, replacing
+    any earlier one. Return the record id.
+
+    """
+
+    values = np.ascontiguousarray(values, dtype = VALUE_DTYPE)
+    row = [gauge] + [info.get(key) for key in ("apart", "bpart", "cpart",
+      "epart", "fpart", "units", "type")] + [int(start), int(interval),
+      values.size]
+
+    def reserve(connection):
+      offset = connection.execute("SELECT COALESCE(MAX(offset + count), 0) "
+        "FROM records").fetchone()[0]
+      cursor = connection.execute("INSERT INTO records (gauge, apart, bpart, "
+        "cpart, epart, fpart, units, type, start, interval, count, offset, "
+        "source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        row + [offset, source])
+      return cursor.lastrowid, offset
+
+    record_id, offset = self.transaction(reserve)
+    with open(self.values_file_name, "r+b") as values_file:
+      values_file.seek(offset*VALUE_DTYPE.itemsize)
+      values_file.write(values.tobytes())
+      values_file.flush()
+      os.fsync(values_file.fileno())
+
+    def publish(connection):
+      connection.execute("DELETE FROM records WHERE gauge = ? AND "
+        "interval = ? AND complete = 1", (gauge, int(interval)))
+      connection.execute("UPDATE records SET complete = 1 WHERE id = ?",
+        (record_id,))
+
+    self.transaction(publish)
+    return record_id
+
+  def add_output(self, output_file_name, gauge = None):
+    """
+    Accept the name of a dssts output file written by spline() and the
+    gauge name (defaults to the file name without its extension). Store
+    its values. Return the record id.
+
+    """
+
+    if gauge is None:
+      gauge = os.path.splitext(os.path.basename(output_file_name))[0]
+    info, start = read_output_header(output_file_name)
+    values, interval = read_output_values(output_file_name)
+    return self.append(gauge, info, start, interval, values,
+      os.path.abspath(output_file_name))
+
+  def records(self, **criteria):
+    """
+    Accept (optional) column values to match, e.g. gauge or bpart.
+    Return the complete records as a DataFrame.
+
+    """
+
+    unknown = set(criteria) - set(COLUMNS)
+    if unknown:
+      raise ValueError(f"Unknown catalog columns: {', '.join(sorted(unknown))}")
+    where = "".join(f" AND {column} = ?" for column in criteria)
+    rows = self.connection.execute(f"SELECT {', '.join(COLUMNS)} FROM records "
+      f"WHERE complete = 1{where} ORDER BY gauge, interval",
+      list(criteria.values())).fetchall()
+    return pd.DataFrame(rows, columns = COLUMNS)
+
+  def read(self, gauge, start = None, end = None, interval = None):
+    """
+    Accept the gauge name, (optional) first and last dates of the range
+    to read (see minute_ordinal; by default the whole record) and the
+    interval in minutes (needed only if the gauge is stored at several).
+    Memory-map the values of the intervals within the range. Return
+    them as a Series on a PeriodIndex of the interval, labelled with
+    the end of each interval as in the output file (see
+    Spline.ending_series).
+
+    """
+
+    records = self.records(gauge = gauge, **({"interval": interval}
+      if interval else {}))
+    if records.empty:
+      raise KeyError(f"{gauge} is not in the catalog")
+    if len(records) > 1:
+      raise ValueError(f"{gauge} is stored at intervals "
+        f"{records.interval.tolist()}; give the interval")
+    record = records.iloc[0]
+    interval = int(record.interval)
+
+    # Positions of the intervals ending after 0000 of start and by 2400
+    # of end
+    first = 0 if start is None else (minute_ordinal(start) -
+      record.start) // interval + 1
+    last = record["count"] if end is None else (minute_ordinal(end) + 1440 -
+      record.start) // interval + 1
+    first, last = max(int(first), 0), min(int(last), int(record["count"]))
+
+    if last > first:
+      values = np.array(np.memmap(self.values_file_name, dtype = VALUE_DTYPE,
+        mode = "r", offset = int(record.offset + first)*VALUE_DTYPE.itemsize,
+        shape = (last - first,)))
+    else:
+      values = np.empty(0, dtype = VALUE_DTYPE)
+    return ending_series(values, int(record.start) + first*interval, interval,
+      gauge)
+
+  def compact(self):
+    """
+    Rewrite the values file with only the complete records, dropping
+    the space of replaced records and interrupted writes. No other
+    process may use the catalog meanwhile. Return the number of values
+    kept.
+
+    """
+
+    compact_file_name = self.values_file_name + ".compact"
+
+    def rewrite(connection):
+      rows = connection.execute("SELECT id, offset, count FROM records "
+        "WHERE complete = 1 ORDER BY offset").fetchall()
+      values = np.memmap(self.values_file_name, dtype = VALUE_DTYPE,
+        mode = "r") if rows else None
+      offset = 0
+      with open(compact_file_name, "wb") as compact_file:
+        for record_id, old_offset, count in rows:
+          compact_file.write(values[old_offset:old_offset + count].tobytes())
+          connection.execute("UPDATE records SET offset = ? WHERE id = ?",
+            (offset, record_id))
+          offset += count
+      del values
+      connection.execute("DELETE FROM records WHERE complete = 0")
+      os.replace(compact_file_name, self.values_file_name)
+      return offset
+
+    return self.transaction(rewrite)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description =
+    "Add smoothed output files to a results catalog, or read from it.")
+  parser.add_argument("catalog", help = "catalog directory")
+  commands = parser.add_subparsers(dest = "command", required = True)
+  add = commands.add_parser("add", help = "add output files")
+  add.add_argument("files", nargs = "+", help = "output files or glob patterns")
+  commands.add_parser("list", help = "list the records")
+  read = commands.add_parser("read", help = "write a gauge's values as CSV")
+  read.add_argument("gauge")
+  read.add_argument("--start", help = "first date, e.g. 1997-01-01")
+  read.add_argument("--end", help = "last date, e.g. 1997-03-31")
+  read.add_argument("--interval", type = int, help = "interval in minutes")
+  read.add_argument("--out", help = "CSV file (default: standard output)")
+  commands.add_parser("compact", help = "reclaim the space of replaced records")
+  args = parser.parse_args()
+
+  with Catalog(args.catalog) as catalog:
+    if args.command == "add":
+      for pattern in args.files:
+        for output_file_name in sorted(glob.glob(pattern)) or [pattern]:
+          catalog.add_output(output_file_name)
+          print (f"Added {output_file_name}")
+    elif args.command == "list":
+      print (catalog.records().drop(columns = ["id", "offset", "source"])
+        .to_string(index = False))
+    elif args.command == "read":
+      series = catalog.read(args.gauge, args.start, args.end, args.interval)
+      csv = series.to_csv(args.out, header = True, float_format = "%.2f")
+      if args.out is None:
+        print (csv, end = "")
+    else:
+      print (f"Kept {catalog.compact()} values")
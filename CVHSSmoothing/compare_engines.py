@@ -0,0 +1,193 @@
+import argparse
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from CVHSSmoothing import core
+from CVHSSmoothing.engines import available_engines
+from CVHSSmoothing.segments import FAUX_OFFSET, read_daily_record
+from CVHSSmoothing.validation import daily_volume_errors
+
+def run_engine(engine, days, flows, peaks):
+  """
+  Accept an engine name (see engines.py) or fit function and a record.
+  Smooth it with the core.py pipeline: peak insertion and negative
+  flow cleaning. Return the hourly hydrograph.
+
+  """
+
+  return core.smooth_daily(days[0].ordinal + FAUX_OFFSET, flows, peaks,
+    engine = engine)[0]
+
+def synthetic_record(n_days = 3650, seed = 0, start = "1950-10-01"):
+  """
+  Accept a record length, random seed and start date. Build a daily
+  record with seasonal baseflow, exponentially receding storms, zero
+  flow dry seasons in some years and an 11 AM peak on every storm day.
+  Return days, flows and the peak table.
+
+  """
+
+  rng = np.random.default_rng(seed)
+  days = pd.period_range(start, periods = n_days, freq='D')
+  t = np.arange(n_days)
+  wet = np.isin(days.month, [11, 12, 1, 2, 3, 4])
+  flows = 60 + 45*np.cos(2*np.pi*(t - 120)/365.25)
+
+  storm_days = np.flatnonzero(wet & (rng.random(n_days) < 0.04))
+  amplitudes = rng.lognormal(7, 1, storm_days.size)
+  recessions = rng.uniform(1.5, 6, storm_days.size)
+  for day, amplitude, recession in zip(storm_days, amplitudes, recessions):
+    flows[day:] += amplitude*np.exp(-(t[day:] - day)/recession)
+
+  dry_years = rng.random(days.year.max() - days.year.min() + 1) < 0.3
+  dry = np.isin(days.month, [7, 8, 9]) & dry_years[days.year - days.year.min()]
+  flows[dry] = 0.
+  flows = np.round(flows, 1)
+
+  peaks = core.peak_table(days[storm_days].asi8 + FAUX_OFFSET,
+    np.round(1.6*flows[storm_days], 0), ["2"]*storm_days.size)
+  return days, flows, peaks
+
+def file_record(daily_flow_filename, peaks_file_name = False, start = None,
+  max_days = None):
+  """
+  Accept daily timeseries input filename, (optional) peaks filename, and
+  (optional) first date and number of days to keep. Missing days are set
+  to zero as spline() does. Return days, flows and the peak table (or
+  None).
+
+  """
+
+  timeseries_info, days, flows = read_daily_record(daily_flow_filename)
+  first = 0 if start is None else max((pd.Period(start, freq='D') - days[0]).n, 0)
+  last = days.size if max_days is None else first + max_days
+  days, flows = days[first:last], flows[first:last]
+  flows = np.nan_to_num(flows)
+  peaks = None
+  if peaks_file_name:
+    peaks = core.read_peak_table(peaks_file_name)
+  return days, flows, peaks
+
+def peak_errors(days, hourly_flows, peaks):
+  """
+  Accept days, hour-ending flows from 0100 of the first day and the peak
+  table. Return the relative error of the highest hourly flow on each
+  peak day within the record.
+
+  """
+
+  if peaks is None:
+    return np.array([])
+  first_day = days[0].ordinal + FAUX_OFFSET
+  peaks = core.peaks_in_range(peaks, first_day, first_day + days.size - 1)
+  peaks = peaks[peaks["value"] > 0]
+  errors = []
+  for day, peak_value in zip(peaks["day"] - first_day, peaks["value"]):
+    peak_hours = hourly_flows[24*day:24*(day + 1)]
+    errors.append((np.max(peak_hours) - peak_value) / peak_value)
+  return np.array(errors)
+
+def engine_metrics(engine, days, flows, peaks, measure_memory = True):
+  """
+  Accept an engine name or fit function and a record. Time the engine,
+  then (optionally) rerun it under tracemalloc for its peak allocation.
+  Return a dictionary of runtime, memory, daily volume error, negative
+  hour count and peak fidelity.
+
+  """
+
+  start_timer = time.perf_counter()
+  hydrograph = run_engine(engine, days, flows, peaks)
+  seconds = time.perf_counter() - start_timer
+
+  peak_memory = np.nan
+  if measure_memory:
+    tracemalloc.start()
+    run_engine(engine, days, flows, peaks)
+    peak_memory = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+  hourly_flows = np.asarray(hydrograph, dtype=float)[1:]
+  written = np.where(hourly_flows < 0, 0., hourly_flows)
+  errors = np.abs(daily_volume_errors(flows, written))
+  peak_error = np.abs(peak_errors(days, hourly_flows, peaks))
+
+  return {
+    "seconds": seconds,
+    "memory_mb": peak_memory,
+    "max_daily_error": errors.max(),
+    "mean_daily_error": errors.mean(),
+    "negative_hours": int(np.sum(hourly_flows < -0.01)),
+    "min_flow": hourly_flows.min(),
+    "peaks": peak_error.size,
+    "mean_peak_error": peak_error.mean() if peak_error.size else np.nan,
+    "max_peak_error": peak_error.max() if peak_error.size else np.nan,
+  }
+
+def compare_engines(corpus, engines = None, measure_memory = True):
+  """
+  Accept corpus, a dictionary of record name to (days, flows, peaks),
+  and (optional) engine names or a dictionary of name to fit function
+  (defaults to every registered engine). Run every engine over every
+  record. Return a DataFrame of engine_metrics
+  indexed by record and engine.
+
+  """
+
+  if engines is None:
+    engines = available_engines()
+  if not isinstance(engines, dict):
+    engines = {name: name for name in engines}
+  rows = []
+  for name, (days, flows, peaks) in corpus.items():
+    for engine_name, engine in engines.items():
+      print (f"Running {engine_name} on {name}")
+      metrics = engine_metrics(engine, days, flows, peaks, measure_memory)
+      rows.append(dict(record = name, engine = engine_name, **metrics))
+  return pd.DataFrame(rows).set_index(["record", "engine"])
+
+def default_corpus(years = 10, seeds = (0, 1)):
+  """
+  Accept the record length in years and synthetic seeds. Return the
+  repository sample records (the Deer Creek record from the start of its
+  peaks) plus synthetic records.
+
+  """
+
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  n_days = int(365.25*years)
+  corpus = {
+    "DEER_CR_NR_SMARTVILLE": file_record(
+      os.path.join(root, "USBC_1DAY", "Yuba-Feather", "CVHS",
+      "DEER_CR_NR_SMARTVILLE.txt"),
+      os.path.join(root, "USBC_PEAKS", "DEER_CR_NR_SMARTVILLE.txt"), 
+      "1935-10-01", n_days),
+    "DEER": file_record(os.path.join(root, "USBC_1DAY", "Yuba-Feather",
+      "WCM_Update", "DEER.txt"), max_days = n_days),
+  }
+  for seed in seeds:
+    corpus[f"synthetic_{seed}"] = synthetic_record(n_days, seed)
+  return corpus
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description =
+    "Compare smoothing engines on runtime, memory and accuracy.")
+  parser.add_argument("--years", type = float, default = 10,
+    help = "record length (years) for sample and synthetic records")
+  parser.add_argument("--engines", nargs = "+",
+    help = "engines to compare (default: all registered)")
+  parser.add_argument("--no-memory", action = "store_true",
+    help = "skip the tracemalloc rerun")
+  parser.add_argument("--csv", help = "also write the table to this file")
+  args = parser.parse_args()
+
+  table = compare_engines(default_corpus(args.years), args.engines,
+    measure_memory = not args.no_memory)
+  with pd.option_context("display.width", 200, "display.max_columns", 20,
+    "display.float_format", "{:.4g}".format):
+    print (table)
+  if args.csv:
+    table.to_csv(args.csv)
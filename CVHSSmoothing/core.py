@@ -0,0 +1,1101 @@
+import functools
+import hashlib
+import itertools
+import os
+import numpy as np
+from scipy.interpolate import interp1d
+
+from CVHSSmoothing.engines import get_engine
+from CVHSSmoothing.kernels import (select_knots, hourly_differences,
+  negative_mask, peaks_exceeded)
+
+# Days between the real dates and the faux dates used by Spline.py
+FAUX_OFFSET = 146097
+# Hours evaluated and written at a time
+CHUNK_HOURS = 8760
+# Timelines kept by hour_timeline and day_timeline, shared by records
+# with the same period
+TIMELINE_CACHE_SIZE = 8
+# Days of padding into the neighbouring steady runs when fitting the
+# varying spans of a thinned record, and the relative difference in daily
+# flow still counted as steady
+STEADY_PADDING = 1
+STEADY_TOLERANCE = 1e-9
+
+MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+  "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+# Peak table row: faux day ordinal, peak flow and type (as in the peaks files)
+PEAK_DTYPE = np.dtype([("day", np.int64), ("value", np.float64), ("type", "U1")])
+
+# Peak type -> (hour the peak hour starts, label)
+PEAK_HOURS = {
+  "0": (1, "1 AM"),
+  "1": (0, "12 AM"),
+  "2": (11, "11 AM"),
+  "3": (23, "11 PM"),
+  "4": (22, "10 PM"),
+}
+
+def day_ordinal(raw_date, faux = True):
+  """
+  Accept a DDMMMYYYY date string. Return the day as days since
+  1970-01-01 (the ordinal of a daily pandas Period), moved 400 years
+  forward unless faux is False.
+
+  """
+
+  day = np.datetime64("%04d-%02d-%02d" % (int(raw_date[5:]),
+    MONTHS[raw_date[2:5]], int(raw_date[0:2])), 'D').astype(np.int64)
+  if faux:
+    day += FAUX_OFFSET
+  return int(day)
+
+def day_string(day):
+  """
+  Accept a day ordinal. Return it as YYYY-MM-DD.
+
+  """
+
+  return str(np.datetime64(int(day), 'D'))
+
+@functools.lru_cache(maxsize = TIMELINE_CACHE_SIZE)
+def hour_timeline(first_hour, size):
+  """
+  Accept the hour ordinal of the first hour and the number of hours.
+  Return the hour ordinals of every hour as a read-only array, built
+  once and shared by every record with the same period. It is a view of
+  a read-only array, so its WRITEABLE flag cannot be set again.
+
+  """
+
+  hours = np.arange(first_hour, first_hour + size, dtype=np.int64)
+  hours.setflags(write = False)
+  return hours.view()
+
+@functools.lru_cache(maxsize = TIMELINE_CACHE_SIZE)
+def day_timeline(first_day, days):
+  """
+  Accept the first day ordinal and the number of days. Return the day
+  ordinals as a shared read-only array, as hour_timeline does.
+
+  """
+
+  day_ordinals = np.arange(first_day, first_day + days, dtype=np.int64)
+  day_ordinals.setflags(write = False)
+  return day_ordinals.view()
+
+def report_progress(verbose, message):
+  """
+  Accept a verbose setting (True to print, or a function to call) and a
+  progress message. Report it.
+
+  """
+
+  (verbose if callable(verbose) else print)(message)
+
+def check_interval(interval):
+  """
+  Accept an output interval in minutes. Raise ValueError unless it
+  evenly divides an hour. Return the number of intervals per hour.
+
+  """
+
+  if interval not in (1, 2, 3, 4, 5, 6, 10, 12, 15, 20, 30, 60):
+    raise ValueError(f"Output interval of {interval} minutes does not divide an hour")
+  return 60 // interval
+
+def support_padding(tolerance = 1e-12):
+  """
+  Accept a relative tolerance. The influence of a constraint on an
+  interpolating cubic spline decays by a factor of 2 - sqrt(3) (about
+  0.27) per knot, so a record truncated this many daily knots away from
+  a window reproduces the full-record spline inside the window to within
+  tolerance. Return the padding in days.
+
+  """
+
+  return int(np.ceil(np.log(tolerance) / np.log(2 - np.sqrt(3))))
+
+def parse_daily_block(daily_flow_readlines):
+  """
+  Accept the data lines of a daily timeseries input file (header
+  removed). Parse them all at once: split the block into fields, read
+  the flows with one NumPy conversion and the DDMMMYYYY dates with
+  array arithmetic. Return the faux day ordinals and flows, or None if
+  any line is not exactly "index date flow" with a valid date and flow
+  (read_daily_lines then parses line by line, logging the bad lines).
+
+  """
+
+  fields = "".join(daily_flow_readlines).split()
+  lines = len(daily_flow_readlines)
+  if lines == 0 or len(fields) != 3*lines:
+    return None
+  fields = np.array(fields, dtype=object).reshape(lines, 3)
+  dates = fields[:, 1].astype(str)
+  if np.any(np.char.str_len(dates) != 9):
+    return None
+  try:
+    flows = fields[:, 2].astype(float)
+    dates = dates.astype("S9")
+  except (ValueError, UnicodeEncodeError):
+    return None
+
+  characters = dates.view("S1").reshape(lines, 9)
+  digits = characters[:, [0, 1, 5, 6, 7, 8]].view(np.uint8) - ord("0")
+  names, codes = np.unique(np.ascontiguousarray(characters[:, 2:5]).view(
+    "S3").ravel(), return_inverse = True)
+  if np.any(digits > 9) or any(name.decode() not in MONTHS for name in names):
+    return None
+  months = np.array([MONTHS[name.decode()] for name in names])[codes]
+  years = digits[:, 2:] @ np.array([1000, 100, 10, 1])
+  day_of_month = digits[:, :2] @ np.array([10, 1])
+  month_start = (years - 1970)*12 + months - 1
+  days = month_start.astype("datetime64[M]").astype("datetime64[D]").astype(
+    np.int64) + day_of_month - 1
+  # Reject days past the end of their month (e.g. 31Feb), as day_ordinal
+  # does
+  next_month = (month_start + 1).astype("datetime64[M]").astype(
+    "datetime64[D]").astype(np.int64)
+  if np.any(day_of_month < 1) or np.any(days >= next_month):
+    return None
+  return days + FAUX_OFFSET, flows
+
+def read_daily_lines(daily_flow_readlines, location, missing_log_file):
+  """
+  Accept the data lines of a daily timeseries input file (header
+  removed), gage location name and an open log file. Parse the faux day
+  ordinals and daily flows as read_daily_flows does: unreadable values
+  are logged and set to 0.0, the first knot is the start of the first
+  day with zero flow and each following knot is the end of the day
+  whose flow it carries. Blocks without unreadable lines are parsed at
+  once by parse_daily_block. Return knot_days and flows arrays.
+
+  """
+
+  parsed = parse_daily_block(daily_flow_readlines)
+  if parsed is not None:
+    days, flows = parsed
+    return (np.concatenate((days[:1], days + 1)),
+      np.concatenate(([0.], flows)))
+
+  knot_days = [day_ordinal(daily_flow_readlines[0].strip().split()[1])]
+  flows = [0]
+
+  for line in daily_flow_readlines:
+    try:
+      fields = line.strip().split()
+      knot_days.append(day_ordinal(fields[1]) + 1)
+      flows.append(float(fields[2]))
+    except (IndexError, ValueError):
+      missing_log_file.write("Error: %s \t line: %s" % (location, line))
+      flows.append(0.0)
+
+  return np.array(knot_days, dtype=np.int64), np.array(flows, dtype=float)
+
+def build_knots(knot_days, flows, record_end = True):
+  """
+  Accept sorted knot day ordinals and the flow ending at each knot.
+  Clip negative flows to zero and accumulate them. Place the
+  accumulation on hour 0000 of each knot day, as sorted knots: hour
+  offsets from the first knot and their values. If record_end, the
+  record runs to the end of the last knot day with its last hour pinned
+  to the total volume, otherwise it stops at the last knot. Return
+  daily_accumulation, the knot hours and values, the hour ordinal of
+  the first hour and the number of hours.
+
+  """
+
+  knot_days = np.asarray(knot_days, dtype=np.int64)
+  flows = np.array(flows, dtype=float)
+  flows[flows < 0] = 0
+  daily_accumulation = np.cumsum(flows)
+
+  first_day = knot_days.min()
+  known = ~np.isnan(daily_accumulation)
+  hours, values = insert_knots(np.empty(0, dtype=np.int64), np.empty(0),
+    24*(knot_days[known] - first_day), daily_accumulation[known])
+  size = 24*(knot_days.max() - first_day + 1)
+  if record_end:
+    hours, values = insert_knots(hours, values, [size - 1], [values.max()])
+  else:
+    size = hours[-1] + 1
+
+  return daily_accumulation, hours, values, int(24*first_day), int(size)
+
+def build_accumulation(knot_days, flows, record_end = True):
+  """
+  Accept knot_days and flows as for build_knots. Return
+  daily_accumulation, the hourly accumulation (NaN between knots) and
+  the hour ordinal of its first value.
+
+  """
+
+  daily_accumulation, hours, values, first_hour, size = build_knots(
+    knot_days, flows, record_end)
+  return (daily_accumulation, knot_accumulation(hours, values, size),
+    first_hour)
+
+def accumulation_knots(accumulation):
+  """
+  Accept an hourly accumulation with NaN between knots. Return the knot
+  hour offsets and values.
+
+  """
+
+  hours = select_knots(accumulation)
+  return hours.astype(np.int64), accumulation[hours]
+
+def knot_accumulation(hours, values, size):
+  """
+  Accept knot hour offsets and values and the number of hours. Return
+  the hourly accumulation, NaN between knots.
+
+  """
+
+  accumulation = np.full(size, np.nan)
+  accumulation[hours] = values
+  return accumulation
+
+def insert_knots(hours, values, new_hours, new_values):
+  """
+  Accept sorted knot hour offsets and values and knots to add. Knots at
+  an existing hour replace its value and, as with array assignment,
+  the last value given for an hour wins. The new knots are merged in
+  by binary search. Return the new hours and values.
+
+  """
+
+  new_hours = np.asarray(new_hours, dtype=np.int64)[::-1]
+  new_values = np.asarray(new_values, dtype=float)[::-1]
+  new_hours, last = np.unique(new_hours, return_index=True)
+  new_values = new_values[last]
+
+  positions = np.searchsorted(hours, new_hours)
+  existing = positions < hours.size
+  existing[existing] = hours[positions[existing]] == new_hours[existing]
+  values = values.copy()
+  values[positions[existing]] = new_values[existing]
+  added = ~existing
+  return (np.insert(hours, positions[added], new_hours[added]),
+    np.insert(values, positions[added], new_values[added]))
+
+def peak_table(peak_days, peak_values, peak_types):
+  """
+  Accept matching sequences of faux peak day ordinals, values and types.
+  Return them as a peak table: a PEAK_DTYPE array sorted by day (peaks
+  on the same day keep their order).
+
+  """
+
+  table = np.empty(len(peak_days), dtype=PEAK_DTYPE)
+  table["day"] = peak_days
+  table["value"] = peak_values
+  table["type"] = [str(peak_type) for peak_type in peak_types]
+  return table[np.argsort(table["day"], kind="stable")]
+
+def read_peak_table(peaks_file_name):
+  """
+  Accept the name of a peaks file: seven header lines, then tab separated
+  index, DDMMMYYYY date, peak flow and peak type. Lines without a flow or
+  type are skipped. Return the peak table.
+
+  """
+
+  peak_days, peak_values, peak_types = [], [], []
+  with open(peaks_file_name, "r") as peaks_file:
+    for line in itertools.islice(peaks_file, 7, None):
+      fields = line.rstrip("\n").split("\t")
+      if len(fields) < 4 or not (fields[1].strip() and fields[2].strip() 
+        and fields[3].strip()):
+        continue
+      peak_days.append(day_ordinal(fields[1].strip()))
+      peak_values.append(float(fields[2]))
+      peak_types.append(str(int(float(fields[3]))))
+
+  return peak_table(peak_days, peak_values, peak_types)
+
+def peaks_in_range(peaks, first_day, last_day):
+  """
+  Accept a peak table and the first and last day ordinals of a range.
+  Return the rows within the range (a view), found by binary search.
+
+  """
+
+  first = np.searchsorted(peaks["day"], first_day, side="left")
+  last = np.searchsorted(peaks["day"], last_day, side="right")
+  return peaks[first:last]
+
+def select_peaks(knot_days, peaks):
+  """
+  Accept knot day ordinals and a peak table. Return the peaks whose day
+  lies entirely within the knots.
+
+  """
+
+  peaks = peaks_in_range(peaks, knot_days[0], knot_days[-1] - 1)
+  return peaks[np.isin(peaks["day"], knot_days) &
+    np.isin(peaks["day"] + 1, knot_days)]
+
+def peak_start_volume(beginning, daily_flow, value, peak_type):
+  """
+  Accept the accumulation at the start of the peak day, the day's volume,
+  the peak flow and its type. Return the accumulation at the start of
+  the peak hour: the rest of the day's volume is split around the peak
+  as the insert_peak_* functions of Spline.py do.
+
+  """
+
+  if peak_type == "2":
+    return beginning + (daily_flow - value/24.)*11/23
+  if peak_type == "4":
+    return beginning + (daily_flow - value/24. - value/24.*0.9)
+  if peak_type == "3":
+    return beginning + (daily_flow - value/24. - value/24)
+  if peak_type == "1":
+    return beginning
+  return beginning + value/24.*0.9
+
+def peak_knots(knot_days, daily_accumulation, peaks, peak_log_file = None):
+  """
+  Accept knot_days and daily_accumulation from build_knots and a peak
+  table (see select_peaks). Constrain the accumulation at the start and
+  end of each peak hour given by its type (see PEAK_HOURS), logging each
+  peak if a log file is given. Return the hour offsets and values of
+  the constraints, in order.
+
+  """
+
+  first_day = knot_days[0]
+  hours, values = [], []
+  for peak_day, peak_value, peak_type in peaks.tolist():
+    if peak_type in PEAK_HOURS:
+      hour, hour_label = PEAK_HOURS[peak_type]
+      i, j = np.searchsorted(knot_days, (peak_day, peak_day + 1))
+      beginning = daily_accumulation[i]
+      daily_flow = daily_accumulation[j] - beginning
+      start = 24*(peak_day - first_day) + hour
+      value = peak_start_volume(beginning, daily_flow, peak_value, peak_type)
+      hours += [start, start + 1]
+      values += [value, value + peak_value/24.]
+      if peak_log_file is not None:
+        peak_log_file.write("Inserting peak of %.2f on %s at %s\n" %
+          (peak_value, day_string(peak_day), hour_label))
+
+  return np.array(hours, dtype=np.int64), np.array(values, dtype=float)
+
+def insert_peaks(knot_days, daily_accumulation, accumulation, peaks,
+  peak_log_file = None):
+  """
+  Accept knot_days and daily_accumulation, the hourly accumulation from
+  build_accumulation and a peak table. Set the peak_knots constraints.
+  accumulation is updated in place and returned.
+
+  """
+
+  hours, values = peak_knots(knot_days, daily_accumulation, peaks,
+    peak_log_file)
+  accumulation[hours] = values
+  return accumulation
+
+def fit_knots(hours, values, first_hour, engine = "splrep"):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour and an engine name (see engines.py) or fit function. Fit the
+  engine through the knots with hour ordinals as x. Return the fitted
+  function.
+
+  """
+
+  return get_engine(engine)(first_hour + hours, values)
+
+def fit_accumulation(accumulation, first_hour, engine = "splrep"):
+  """
+  Accept the hourly accumulation, the hour ordinal of its first value
+  and engine. Fit the engine through the specified (non-NaN) values.
+  Return the fitted function.
+
+  """
+
+  return fit_knots(*accumulation_knots(accumulation), first_hour, engine)
+
+def knot_hydrograph(hours, values, first_hour, size, engine = "splrep"):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour, the number of hours and engine. Fit the knots, evaluate the fit
+  at every hour and differentiate, converting cfs-days to cfs. Return
+  the hydrograph, with a leading 0 at the first hour.
+
+  """
+
+  spline_function = fit_knots(hours, values, first_hour, engine)
+  return hourly_differences(spline_function(hour_timeline(first_hour, size)),
+    24)
+
+def generate_hydrograph(accumulation, first_hour, engine = "splrep"):
+  """
+  Accept the hourly accumulation, the hour ordinal of its first value
+  and engine. Return the knot_hydrograph of its knots.
+
+  """
+
+  return knot_hydrograph(*accumulation_knots(accumulation), first_hour,
+    accumulation.size, engine)
+
+def clean_knot_flows(hours, values, first_hour, size, max_iterations = 15,
+  verbose = True, engine = "splrep", zero_tolerance = None,
+  seed_hours = None):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour, the number of hours and engine. Generate the hydrograph and,
+  while it has flows below -0.01 cfs, insert knots at every negative
+  hour from a linear interpolation of the original knots, then
+  recompute; repeat up to max_iterations times, reporting progress if
+  verbose (see report_progress). If zero_tolerance is given, recomputed flows closer than it
+  to zero are set to zero. Hours given as seed_hours (e.g. those a
+  previous run constrained, see constrained_hours) are constrained
+  before the first fit. Return the hydrograph and the final knot hours
+  and values.
+
+  """
+
+  linear_function = interp1d(first_hour + hours, values, kind = 'linear')
+  if seed_hours is not None:
+    seed_hours = np.asarray(seed_hours, dtype=np.int64)
+    seed_hours = seed_hours[(seed_hours > hours[0]) & (seed_hours <= hours[-1])]
+    hours, values = insert_knots(hours, values, seed_hours,
+      linear_function(first_hour + seed_hours))
+  hydrograph = knot_hydrograph(hours, values, first_hour, size, engine)
+  count = 0
+
+  while np.min(hydrograph) <= -0.01 and count < max_iterations:
+    negative = np.flatnonzero(negative_mask(hydrograph))
+    hours, values = insert_knots(hours, values, negative,
+      linear_function(first_hour + negative))
+    hydrograph = knot_hydrograph(hours, values, first_hour, size, engine)
+    if zero_tolerance is not None:
+      hydrograph[np.abs(hydrograph) < zero_tolerance] = 0
+
+    count += 1
+    if verbose:
+      report_progress(verbose,
+        f"{count} iterations completed; min flow = {np.min(hydrograph)}")
+
+  return hydrograph, hours, values
+
+def constrained_hours(hours, values, clean_hours, clean_values):
+  """
+  Accept the knot hours and values before and after cleaning. Return
+  the sorted hours whose knot cleaning added or changed.
+
+  """
+
+  added = ~np.isin(clean_hours, hours)
+  kept = np.flatnonzero(~added)
+  changed = clean_values[kept] != values[np.searchsorted(hours,
+    clean_hours[kept])]
+  return np.sort(np.concatenate((clean_hours[added], clean_hours[kept[changed]])))
+
+def knot_digest(hours, values, size, *settings):
+  """
+  Accept knot hours and values, the number of hours and any settings
+  the cleaning depends on (engine names or functions, numbers). Return
+  a sha256 hex digest identifying them.
+
+  """
+
+  digest = hashlib.sha256()
+  for array in (np.asarray(hours, dtype="<i8"), np.asarray(values, dtype="<f8")):
+    digest.update(array.tobytes())
+  digest.update(" ".join([str(size)] + [str(getattr(setting, "__name__",
+    setting)) for setting in settings]).encode())
+  return digest.hexdigest()
+
+def read_knot_file(knot_file_name):
+  """
+  Accept the name of a file written by write_knot_file. Return a
+  dictionary of its constrained hour ordinals ("hours") and knot
+  digest, or None if there is no readable file.
+
+  """
+
+  try:
+    with np.load(knot_file_name) as saved:
+      return {"hours": saved["hours"], "digest": str(saved["digest"])}
+  except (OSError, KeyError, ValueError):
+    return None
+
+def write_knot_file(knot_file_name, hours, digest):
+  """
+  Accept a file name, the constrained hour ordinals of a cleaning run
+  and the knot_digest of the knots it started from. Write them as .npz
+  under a temporary name and move it into place. Return nothing.
+
+  """
+
+  partial_file_name = knot_file_name + ".part"
+  with open(partial_file_name, "wb") as knot_file:
+    np.savez(knot_file, hours = np.asarray(hours, dtype=np.int64),
+      digest = np.array(digest))
+  os.replace(partial_file_name, knot_file_name)
+
+def clean_negative_flows(accumulation, first_hour, max_iterations = 15,
+  verbose = True, engine = "splrep", zero_tolerance = None):
+  """
+  Accept the hourly accumulation, the hour ordinal of its first value
+  and engine. Clean negative flows as clean_knot_flows does, with the
+  knots added written back to accumulation in place. Return the
+  hydrograph.
+
+  """
+
+  hydrograph, hours, values = clean_knot_flows(
+    *accumulation_knots(accumulation), first_hour, accumulation.size,
+    max_iterations, verbose, engine, zero_tolerance)
+  accumulation[hours] = values
+  return hydrograph
+
+def rebase_accumulation(accumulation, dtype = np.float32):
+  """
+  Accept the hourly accumulation. Split it into the accumulation at
+  0000 of each day (float64 offsets, carried forward over missing days)
+  and the hourly values relative to their day's offset, stored as dtype.
+  The relative values never exceed a day's volume, so float32 keeps
+  them to about 1e-7 of the daily flow. Return offsets and the local
+  values.
+
+  """
+
+  offsets = accumulation[::24].copy()
+  missing = np.isnan(offsets)
+  if missing.any():
+    filled = np.where(missing, 0, np.arange(offsets.size))
+    offsets = np.nan_to_num(offsets[np.maximum.accumulate(filled)])
+  local = accumulation - np.repeat(offsets, 24)[:accumulation.size]
+  return offsets, local.astype(dtype)
+
+def restore_accumulation(offsets, local):
+  """
+  Accept offsets and local values from rebase_accumulation. Return the
+  float64 hourly accumulation.
+
+  """
+
+  return np.repeat(offsets, 24)[:local.size] + local.astype(np.float64)
+
+def rebase_knots(hours, values, size, dtype = np.float32):
+  """
+  Accept knot hour offsets and values and the number of hours. Re-base
+  them as rebase_accumulation does, without building the hourly
+  accumulation. Return the offsets at 0000 of each day and the knots'
+  local values, stored as dtype.
+
+  """
+
+  offsets = np.full(-(-size // 24), np.nan)
+  midnight = hours % 24 == 0
+  offsets[hours[midnight] // 24] = values[midnight]
+  missing = np.isnan(offsets)
+  if missing.any():
+    filled = np.where(missing, 0, np.arange(offsets.size))
+    offsets = np.nan_to_num(offsets[np.maximum.accumulate(filled)])
+  return offsets, (values - offsets[hours // 24]).astype(dtype)
+
+def restore_knots(offsets, hours, local):
+  """
+  Accept offsets from rebase_knots and knot hours and local values.
+  Return the float64 knot values.
+
+  """
+
+  return offsets[hours // 24] + local.astype(np.float64)
+
+def rebased_knot_hydrograph(offsets, hours, local, first_hour, size,
+  engine = "splrep", block_hours = CHUNK_HOURS, padding = None,
+  hydrograph = None, changed = None):
+  """
+  Accept offsets, knot hours and local values from rebase_knots, the
+  hour ordinal of the first hour, the number of hours, engine, block
+  length in hours and padding in days (defaults to support_padding()).
+  Fit each block separately, with padding days of knots on either side,
+  on values re-based to the accumulation at the start of the block, so
+  the fitted values and their hourly differences stay small. Each block
+  fit approximates the whole-record fit of knot_hydrograph, closely
+  away from the block edges but not exactly (see clean_rebased_knot_flows).
+  Given a previous hydrograph and the changed positions, only the
+  blocks whose padded window holds a change are refit, in place. Return
+  the hydrograph (as local's dtype), with a leading 0 at the first hour.
+
+  """
+
+  padding_hours = 24*(support_padding() if padding is None else padding)
+  blocks = np.arange(-(-size // block_hours))
+  if hydrograph is None:
+    hydrograph = np.zeros(size, dtype = local.dtype)
+  elif changed is not None:
+    changed = np.asarray(changed)
+    blocks = np.unique(np.concatenate([
+      np.clip(changed - padding_hours, 0, None) // block_hours,
+      np.clip(changed + padding_hours, None, size - 1) // block_hours]))
+
+  for block in blocks:
+    first, stop, spline_function = rebased_block_fit(offsets, hours, local,
+      first_hour, size, block, engine, block_hours, padding_hours)
+    fitted = spline_function(hour_timeline(first_hour, size)[first:stop])
+    hydrograph[first + 1:stop] = np.diff(fitted)*24
+
+  return hydrograph
+
+def rebased_block_fit(offsets, hours, local, first_hour, size, block,
+  engine, block_hours, padding_hours):
+  """
+  Accept offsets, knot hours and local values from rebase_knots, the
+  hour ordinal of the first hour, the number of hours, a block number,
+  engine, block length and padding in hours. Fit the block's knots and
+  padding_hours of knots on either side, re-based to the accumulation
+  at the start of the block. Return the positions the block's hours run
+  from and to (first, stop: it sets the flows ending after first up to
+  stop - 1) and the fitted function.
+
+  """
+
+  start = block*block_hours
+  stop = min(start + block_hours, size)
+  i, j = np.searchsorted(hours, (max(start - padding_hours, 0),
+    stop + padding_hours))
+  knots = hours[i:j]
+  base = offsets[start // 24]
+  values = (offsets[knots // 24] - base) + local[i:j].astype(np.float64)
+  return (max(start - 1, 0), stop,
+    get_engine(engine)(first_hour + knots, values))
+
+def rebased_knot_chunks(offsets, hours, local, first_hour, size,
+  interval = 60, engine = "splrep", block_hours = CHUNK_HOURS,
+  padding = None):
+  """
+  Accept offsets, knot hours and local values from rebase_knots, the
+  hour ordinal of the first hour, the number of hours, an output
+  interval in minutes and the rebased_knot_hydrograph settings.
+  Evaluate and differentiate each block's own fit at every interval of
+  its hours, so the output matches the hydrograph of
+  rebased_knot_hydrograph rather than the whole-record fit. Yield arrays
+  of flows, one per block, starting with the interval ending one
+  interval after the first hour.
+
+  """
+
+  per_hour = check_interval(interval)
+  padding_hours = 24*(support_padding() if padding is None else padding)
+  for block in range(-(-size // block_hours)):
+    first, stop, spline_function = rebased_block_fit(offsets, hours, local,
+      first_hour, size, block, engine, block_hours, padding_hours)
+    if stop - 1 <= first:
+      continue
+    x = first_hour + first + np.arange((stop - 1 - first)*per_hour + 1) / \
+      per_hour
+    yield hourly_differences(spline_function(x), 24)[1:]*per_hour
+
+def clean_rebased_knot_flows(offsets, hours, local, first_hour, size,
+  max_iterations = 15, verbose = True, engine = "splrep",
+  block_hours = CHUNK_HOURS):
+  """
+  Accept offsets, knot hours and local values from rebase_knots, the
+  hour ordinal of the first hour, the number of hours and engine. Clean
+  negative flows as clean_knot_flows does, with the hydrograph from
+  rebased_knot_hydrograph and only the blocks around each change refit.
+  The block fits differ slightly from the whole-record fit, so the
+  hours found negative, and the knots added there, differ too. Cleaning
+  then ends on different curves. Daily volumes are kept either way,
+  but hourly flows can differ from clean_knot_flows by hundreds of cfs
+  around sharp peaks of records that do not converge (up to about 1000
+  cfs on Deer Creek, 1949-03-02). Return the hydrograph and the final
+  knot hours and local values.
+
+  """
+
+  hydrograph = rebased_knot_hydrograph(offsets, hours, local, first_hour,
+    size, engine, block_hours)
+  linear_function = interp1d(first_hour + hours,
+    restore_knots(offsets, hours, local), kind = 'linear')
+  count = 0
+
+  while np.min(hydrograph) <= -0.01 and count < max_iterations:
+    negative = np.flatnonzero(negative_mask(hydrograph))
+    hours, local = insert_knots(hours, local, negative,
+      linear_function(first_hour + negative) - offsets[negative // 24])
+    rebased_knot_hydrograph(offsets, hours, local, first_hour, size, engine,
+      block_hours, hydrograph = hydrograph, changed = negative)
+
+    count += 1
+    if verbose:
+      report_progress(verbose,
+        f"{count} iterations completed; min flow = {np.min(hydrograph)}")
+
+  return hydrograph, hours, local
+
+def clean_rebased_flows(offsets, local, first_hour, max_iterations = 15,
+  verbose = True, engine = "splrep", block_hours = CHUNK_HOURS):
+  """
+  Accept offsets and local values from rebase_accumulation, the hour
+  ordinal of the first value and engine. Clean negative flows as
+  clean_rebased_knot_flows does, with the knots added written back to
+  local in place. Return the hydrograph.
+
+  """
+
+  knots = select_knots(local)
+  hydrograph, hours, values = clean_rebased_knot_flows(offsets, knots,
+    local[knots], first_hour, local.size, max_iterations, verbose, engine,
+    block_hours)
+  local[hours] = values
+  return hydrograph
+
+def knot_chunks(hours, values, first_hour, size, interval = 60,
+  chunk_hours = CHUNK_HOURS, engine = "splrep", start_hour = 0,
+  end_hour = None):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour, the number of hours, an output interval in minutes, a chunk
+  length in hours and engine. Fit the knots once, then evaluate and
+  differentiate the fit at every interval from position start_hour to
+  end_hour (defaults to the last hour), chunk_hours at a time. Yield
+  arrays of flows, starting with the interval ending one interval after
+  start_hour.
+
+  """
+
+  per_hour = check_interval(interval)
+  spline_function = fit_knots(hours, values, first_hour, engine)
+  if end_hour is None:
+    end_hour = size - 1
+
+  for chunk_start in range(start_hour, end_hour, chunk_hours):
+    chunk_end = min(chunk_start + chunk_hours, end_hour)
+    x = first_hour + chunk_start + \
+      np.arange((chunk_end - chunk_start)*per_hour + 1) / per_hour
+    yield hourly_differences(spline_function(x), 24)[1:]*per_hour
+
+def hydrograph_chunks(accumulation, first_hour, interval = 60,
+  chunk_hours = CHUNK_HOURS, engine = "splrep", start_hour = 0,
+  end_hour = None):
+  """
+  Accept the hourly accumulation, the hour ordinal of its first value
+  and the knot_chunks settings. Yield the knot_chunks of its knots.
+
+  """
+
+  return knot_chunks(*accumulation_knots(accumulation), first_hour,
+    accumulation.size, interval, chunk_hours, engine, start_hour, end_hour)
+
+def steady_spans(hours, values, size, min_days):
+  """
+  Accept knot hour offsets and values, the number of hours and the
+  shortest run of days to thin. Find the runs of at least min_days whole
+  days with knots only at 0000 and the same daily flow (to within
+  STEADY_TOLERANCE), e.g. months of zero flow. Return the spans covering
+  the record in order, as (start, stop, flow) hour offsets: flow is the
+  run's flow in cfs for steady spans and None for the varying spans in
+  between.
+
+  """
+
+  day_knots = np.flatnonzero(hours % 24 == 0)
+  boundaries = hours[day_knots]
+  flows = 24.*np.diff(values[day_knots]) / np.diff(boundaries)
+  # Whole days bounded by consecutive knots, linked to the next day when
+  # both are whole and their flows match
+  whole = (np.diff(boundaries) == 24) & (np.diff(day_knots) == 1)
+  linked = whole[:-1] & whole[1:] & (np.abs(np.diff(flows)) <=
+    STEADY_TOLERANCE*np.maximum(np.abs(flows[1:]), 1))
+  edges = np.diff(np.concatenate(([0], linked.astype(np.int8), [0])))
+
+  spans, position = [], 0
+  for first_day, last_day in zip(np.flatnonzero(edges == 1),
+    np.flatnonzero(edges == -1)):
+    if last_day - first_day + 1 < min_days:
+      continue
+    start, stop = boundaries[first_day], boundaries[last_day + 1]
+    if start > position:
+      spans.append((position, start, None))
+    spans.append((start, stop, 24.*(values[day_knots[last_day + 1]] -
+      values[day_knots[first_day]]) / (stop - start)))
+    position = stop
+  if position < size - 1:
+    spans.append((position, size - 1, None))
+  return spans
+
+def span_window(span, hours, size, padding = STEADY_PADDING,
+  min_knots = 4):
+  """
+  Accept a varying span from steady_spans, the knot hours and the number
+  of hours. Pad the span by padding days into its steady neighbours,
+  and by more while the window holds fewer than min_knots knots (as a
+  cubic fit needs). Return the first and last hour offsets of the
+  window and the index range of its knots.
+
+  """
+
+  start, stop, flow = span
+  while True:
+    first = max(start - 24*padding, 0)
+    last = min(stop + 24*padding, size - 1)
+    i, j = np.searchsorted(hours, (first, last + 1))
+    if j - i >= min_knots or (first == 0 and last == size - 1):
+      return first, last, i, j
+    padding += 1
+
+def clean_thinned_flows(hours, values, first_hour, size, spans,
+  max_iterations = 15, verbose = True, engine = "splrep",
+  zero_tolerance = None, padding = STEADY_PADDING, seed_hours = None):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour, the number of hours and the spans from steady_spans. Set each
+  steady span to its exact flow and fit and clean each varying span
+  separately (see clean_knot_flows), with padding days of the steady
+  spans around it. Daily volumes are kept, since every span starts and
+  ends on a knot. seed_hours are passed on to the spans they fall in.
+  Return the hydrograph, with a leading 0 at the first hour, and the
+  knot hours and values with the knots added by cleaning.
+
+  """
+
+  hydrograph = np.zeros(size)
+  added_hours, added_values = [], []
+  if seed_hours is not None:
+    seed_hours = np.asarray(seed_hours, dtype=np.int64)
+  for span in spans:
+    start, stop, flow = span
+    if flow is not None:
+      hydrograph[start + 1:stop + 1] = flow
+      continue
+    first, last, i, j = span_window(span, hours, size, padding)
+    seeds = None if seed_hours is None else seed_hours[
+      (seed_hours > first) & (seed_hours <= last)] - first
+    local, local_hours, local_values = clean_knot_flows(hours[i:j] - first,
+      values[i:j], first_hour + first, last - first + 1, max_iterations,
+      False, engine, zero_tolerance, seeds)
+    hydrograph[start + 1:stop + 1] = local[start - first + 1:stop - first + 1]
+    added_hours.append(local_hours + first)
+    added_values.append(local_values)
+
+  if verbose:
+    steady = [span for span in spans if span[2] is not None]
+    days = sum(stop - start for start, stop, flow in steady) // 24
+    report_progress(verbose, f"{len(steady)} steady spans ({days} days) "
+      f"set exactly; {len(spans) - len(steady)} varying spans fit; "
+      f"min flow = {np.min(hydrograph)}")
+  if added_hours:
+    hours, values = insert_knots(hours, values, np.concatenate(added_hours),
+      np.concatenate(added_values))
+  return hydrograph, hours, values
+
+def thinned_chunks(hours, values, first_hour, size, spans, interval = 60,
+  engine = "splrep", padding = STEADY_PADDING):
+  """
+  Accept knot hour offsets and values, the hour ordinal of the first
+  hour, the number of hours, the spans from steady_spans, an output
+  interval in minutes and engine. Yield arrays of flows for every
+  interval of the record as clean_thinned_flows splits it: the exact
+  flow over steady spans and knot_chunks of each padded varying span.
+
+  """
+
+  per_hour = check_interval(interval)
+  for span in spans:
+    start, stop, flow = span
+    if flow is not None:
+      yield np.full((stop - start)*per_hour, flow)
+      continue
+    first, last, i, j = span_window(span, hours, size, padding)
+    yield from knot_chunks(hours[i:j] - first, values[i:j], first_hour + first,
+      last - first + 1, interval, engine = engine, start_hour = start - first,
+      end_hour = stop - first)
+
+def check_peaks(hydrograph, first_hour, peaks):
+  """
+  Accept the hydrograph, the hour ordinal of its first value and a peak
+  table of peaks within it. Return the peak days on which a flow from
+  0000 to 2400 exceeds the peak by more than 1 cfs.
+
+  """
+
+  if peaks.size == 0:
+    return []
+  exceeded = peaks_exceeded(hydrograph, 24*peaks["day"] - first_hour,
+    peaks["value"] + 1)
+  return peaks["day"][exceeded].tolist()
+
+def window_knots(knots, first_day, first, last):
+  """
+  Accept the sorted knot positions of an accumulation, the day ordinal
+  of its first value and the first and last day ordinals of a window.
+  Return the positions of the nearest knots at or outside the window.
+
+  """
+
+  start = np.searchsorted(knots, 24*(first - first_day), "right") - 1
+  stop = np.searchsorted(knots, 24*(last + 1 - first_day))
+  return knots[max(start, 0)], knots[min(stop, knots.size - 1)]
+
+def peak_excess(hydrograph, peak_starts, peak_values):
+  """
+  Accept hydrograph values, the position of 0000 on each peak day and
+  the peak values. Return how far the highest flow from 0000 to 2400 of
+  each peak day is above its peak, 0 where it is not.
+
+  """
+
+  return np.array([max(np.max(hydrograph[peak_start:peak_start + 25]) -
+    peak_value, 0.) for peak_start, peak_value in zip(peak_starts,
+    peak_values)])
+
+def correct_peaks(accumulation, first_hour, hydrograph, peaks,
+  overestimated, engine = "splrep", window_days = 2, padding = 6,
+  max_iterations = 10, windows = None):
+  """
+  Accept the hourly accumulation, the hour ordinal of its first value,
+  the hydrograph generated from it, the peak table, the overestimated
+  peak days from check_peaks and engine. Correct only windows of
+  window_days on either side of those days (overlapping windows are
+  merged), refitting each with padding days more on either side. Wherever
+  an hour exceeds a peak in the window by more than 1 cfs, cap the flows
+  between the knots around it at the peak, spread the excess volume over
+  the hours below the peak and constrain the accumulation at each of
+  those hours; clean negative flows and repeat, up to max_iterations
+  times, until no peak in the window is exceeded. The refit is spliced
+  back into the hydrograph, and its knots into the accumulation, only
+  if no peak in the window ends up further above its peak and at least
+  one ends up closer; otherwise the window is left as it was. Existing
+  knots are never moved, so daily volumes are kept. accumulation and
+  hydrograph are updated in place, and each window spliced is appended
+  to windows, if given, for splice_chunks. Return the peak days still
+  overestimated.
+
+  """
+
+  knots = select_knots(accumulation)
+  first_day = first_hour // 24
+  days = np.unique(overestimated)
+  # Merge the windows of days closer than two windows apart
+  breaks = np.flatnonzero(np.diff(days) > 2*window_days) + 1
+  for group in np.split(days, breaks) if days.size else []:
+    start, stop = window_knots(knots, first_day,
+      group[0] - window_days - padding, group[-1] + window_days + padding)
+    splice_start, splice_stop = window_knots(knots, first_day,
+      group[0] - window_days, group[-1] + window_days)
+    fit = accumulation[start:stop + 1].copy()
+    # Every peak whose hours lie within the spliced window is checked
+    window_peaks = peaks_in_range(peaks, first_day + splice_start//24 + 1,
+      first_day + (splice_stop - 24)//24)
+    peak_starts = 24*(window_peaks["day"] - first_day) - start
+
+    local = clean_negative_flows(fit, first_hour + start, verbose = False,
+      engine = engine)
+    for iteration in range(max_iterations):
+      exceeded = peaks_exceeded(local, peak_starts, window_peaks["value"] + 1)
+      constrained = False
+      knot_positions = select_knots(fit)
+      for peak_start, peak_value in zip(peak_starts[exceeded],
+        window_peaks["value"][exceeded]):
+        hours = peak_start + np.flatnonzero(
+          local[peak_start:peak_start + 25] > peak_value + 1)
+        for hour in hours:
+          if not (np.isnan(fit[hour - 1]) or np.isnan(fit[hour])):
+            continue
+          # Cap the flows between the knots around the hour at the peak
+          # and spread the excess over the rest of them
+          i = np.searchsorted(knot_positions, hour)
+          low, high = knot_positions[i - 1], knot_positions[i]
+          flows = np.minimum(local[low + 1:high + 1], peak_value)
+          excess = np.sum(local[low + 1:high + 1]) - np.sum(flows)
+          headroom = peak_value - flows
+          if np.sum(headroom) < excess:
+            continue
+          flows += headroom*excess/np.sum(headroom)
+          fit[low + 1:high] = fit[low] + np.cumsum(flows)[:-1]/24.
+          constrained = True
+      if not constrained:
+        break
+      local = clean_negative_flows(fit, first_hour + start, verbose = False,
+        engine = engine)
+
+    before = peak_excess(hydrograph, peak_starts + start, window_peaks["value"])
+    after = peak_excess(local, peak_starts, window_peaks["value"])
+    if np.any(after > before) or not np.any(after < before):
+      continue
+    hydrograph[splice_start + 1:splice_stop + 1] = \
+      local[splice_start - start + 1:splice_stop - start + 1]
+    accumulation[splice_start:splice_stop + 1] = \
+      fit[splice_start - start:splice_stop - start + 1]
+    if windows is not None:
+      fit_hours = select_knots(fit)
+      windows.append((splice_start, splice_stop, start, fit_hours,
+        fit[fit_hours], fit.size))
+
+  return check_peaks(hydrograph, first_hour, peaks)
+
+def splice_chunks(chunks, windows, first_hour, interval = 60,
+  engine = "splrep"):
+  """
+  Accept arrays of flows for every interval of a record from its first
+  hour (e.g. knot_chunks), the hour ordinal of that hour, the windows
+  correct_peaks spliced, the output interval in minutes and engine.
+  Yield the arrays with the intervals of each window replaced by those
+  of its own refit, as correct_peaks splices the hourly hydrograph.
+
+  """
+
+  per_hour = check_interval(interval)
+  spliced = []
+  for splice_start, splice_stop, start, hours, values, size in windows:
+    spliced.append((splice_start*per_hour, np.concatenate(list(knot_chunks(
+      hours, values, first_hour + start, size, interval, engine = engine,
+      start_hour = splice_start - start, end_hour = splice_stop - start)))))
+
+  position = 0
+  for chunk in chunks:
+    chunk_end = position + chunk.size
+    for first, flows in spliced:
+      low, high = max(first, position), min(first + flows.size, chunk_end)
+      if low < high:
+        chunk = np.array(chunk)
+        chunk[low - position:high - position] = flows[low - first:high - first]
+    yield chunk
+    position = chunk_end
+
+def smooth_daily(first_day, flows, peaks = None, record_end = True,
+  engine = "splrep", verbose = False, peak_log_file = None,
+  correct_overestimated = False, dtype = None):
+  """
+  Accept the faux day ordinal of the first day, the daily flows of a
+  continuous record and (optional) peak table. Build the accumulation,
+  insert the peaks within the record and clean negative flows; if
+  correct_overestimated, correct the overestimated peaks with
+  correct_peaks. If dtype is given, the accumulation is re-based (see
+  rebase_accumulation) and stored as dtype while negative flows are
+  cleaned. Return the hourly hydrograph (first value at 0000 of the
+  first day), the accumulation and the hour ordinal of its first value.
+
+  """
+
+  knot_days = day_timeline(first_day, np.size(flows) + 1)
+  daily_accumulation, accumulation, first_hour = build_accumulation(
+    knot_days, np.concatenate(([0.], flows)), record_end)
+  if peaks is not None:
+    peaks = select_peaks(knot_days, peaks)
+    insert_peaks(knot_days, daily_accumulation, accumulation, peaks,
+      peak_log_file)
+  if dtype is None:
+    hydrograph = clean_negative_flows(accumulation, first_hour,
+      verbose = verbose, engine = engine)
+  else:
+    offsets, local = rebase_accumulation(accumulation, dtype)
+    del accumulation
+    hydrograph = clean_rebased_flows(offsets, local, first_hour,
+      verbose = verbose, engine = engine)
+    accumulation = restore_accumulation(offsets, local)
+  if peaks is not None and correct_overestimated:
+    correct_peaks(accumulation, first_hour, hydrograph, peaks,
+      check_peaks(hydrograph, first_hour, peaks), engine)
+  return hydrograph, accumulation, first_hour
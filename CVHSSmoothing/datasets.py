@@ -0,0 +1,289 @@
+import collections
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from CVHSSmoothing import core
+from CVHSSmoothing.core import CHUNK_HOURS, FAUX_OFFSET, check_interval
+from CVHSSmoothing.segments import (fill_short_gaps, find_segments,
+  read_daily_record, smooth_segment)
+from CVHSSmoothing.Spline import period_index
+
+# Stations read, smoothed and written per chunk
+STATION_CHUNK = 16
+
+def is_zarr(path):
+  """
+  Accept a dataset path. Return True if it names a Zarr store (ends in
+  .zarr), False for NetCDF.
+
+  """
+
+  return str(path).rstrip("/\\").endswith(".zarr")
+
+def open_daily_dataset(path):
+  """
+  Accept the path of a NetCDF file or Zarr store (ending in .zarr).
+  Open it lazily with xarray, so variables are only read a chunk at a
+  time. Return the xarray Dataset.
+
+  """
+
+  import xarray as xr
+  if is_zarr(path):
+    return xr.open_zarr(path)
+  return xr.open_dataset(path)
+
+def dataset_days(times):
+  """
+  Accept the datetime64 time coordinate of a daily dataset. Return the
+  faux day ordinals; raise ValueError if the days are not consecutive.
+
+  """
+
+  days = np.asarray(times).astype("datetime64[D]").astype(np.int64)
+  if days.size == 0 or np.any(np.diff(days) != 1):
+    raise ValueError("The time coordinate is not a continuous daily record")
+  return days + FAUX_OFFSET
+
+def iter_station_chunks(dataset, variable = "flow", station_dim = "station",
+  time_dim = "time", station_chunk = STATION_CHUNK):
+  """
+  Accept a daily Dataset, the flow variable and dimension names, and the
+  stations per chunk. Read the variable one chunk of stations at a time
+  and yield (start, stop) station indices with the (days, stations)
+  flows array.
+
+  """
+
+  flows = dataset[variable].transpose(time_dim, station_dim)
+  stations = dataset.sizes[station_dim]
+  for start in range(0, stations, station_chunk):
+    stop = min(start + station_chunk, stations)
+    yield start, stop, np.asarray(flows.isel({station_dim: slice(start, stop)}).values,
+      dtype = float)
+
+def smooth_station(first_day, flows, peaks = None, interval = 60,
+  engine = "splrep", max_fill_days = 2):
+  """
+  Accept the faux day ordinal of the first day, the daily flows of one
+  station (NaN for missing days), its peak table (or None), the output
+  interval in minutes, engine and the longest gap in days to
+  interpolate across. Fill short gaps and smooth each contiguous segment
+  as spline_segments() does. Return the flows for every interval ending
+  within the record, negative flows set to 0 and gaps left as NaN.
+
+  """
+
+  per_day = 24*check_interval(interval)
+  flows = fill_short_gaps(flows, max_fill_days)
+  days = period_index(first_day - FAUX_OFFSET, flows.size, "D")
+  values = np.full(flows.size*per_day, np.nan)
+  for start, stop in zip(*find_segments(flows)):
+    segment = smooth_segment(days[start:stop], flows[start:stop], peaks,
+      stop == flows.size, interval, engine)
+    segment = segment[:(stop - start)*per_day]
+    values[start*per_day:start*per_day + segment.size] = segment
+  return np.where(values < 0, 0., values)
+
+def smooth_station_chunk(first_day, flows, peaks, interval = 60,
+  engine = "splrep", max_fill_days = 2):
+  """
+  Accept the faux day ordinal of the first day, a (days, stations) flows
+  array, a list of peak tables (or None) per station and the
+  smooth_station settings. Return the (intervals, stations) smoothed
+  flows.
+
+  """
+
+  return np.column_stack([smooth_station(first_day, flows[:, i], peaks[i],
+    interval, engine, max_fill_days) for i in range(flows.shape[1])])
+
+def create_hourly_file(out_path, first_day, stations, intervals,
+  interval = 60, variable = "flow", station_dim = "station",
+  time_dim = "time", station_chunk = STATION_CHUNK, attrs = None):
+  """
+  Accept the output NetCDF path, the faux day ordinal of the first day,
+  the station names, the number of output intervals, the interval in
+  minutes, variable and dimension names, stations per chunk and
+  (optional) variable attributes. Create the file with an empty
+  (time, station) variable chunked to match the station chunks, so each
+  chunk of results is written as whole file chunks. Return the open
+  netCDF4 Dataset.
+
+  """
+
+  import netCDF4
+  per_hour = check_interval(interval)
+  out = netCDF4.Dataset(out_path, "w")
+  out.createDimension(time_dim, intervals)
+  out.createDimension(station_dim, len(stations))
+
+  # Period ending times, from 0000 of the first day plus one interval
+  times = out.createVariable(time_dim, "i8", (time_dim,))
+  times.units = "minutes since 1970-01-01 00:00:00"
+  times.calendar = "proleptic_gregorian"
+  times[:] = output_times(first_day, intervals, interval)
+  names = out.createVariable(station_dim, str, (station_dim,))
+  names[:] = np.array([str(station) for station in stations], dtype = object)
+
+  values = out.createVariable(variable, "f8", (time_dim, station_dim),
+    chunksizes = (min(intervals, CHUNK_HOURS*per_hour),
+    min(station_chunk, len(stations))), zlib = True, fill_value = np.nan)
+  values.setncatts(dict(attrs or {}))
+  values.cell_methods = f"{time_dim}: mean (interval: {interval} minutes)"
+  return out
+
+def output_times(first_day, intervals, interval = 60):
+  """
+  Accept the faux day ordinal of the first day, the number of output
+  intervals and the interval in minutes. Return the period ending times
+  from 0000 of the first day plus one interval, in minutes since
+  1970-01-01.
+
+  """
+
+  return (first_day - FAUX_OFFSET)*1440 + interval*np.arange(1,
+    intervals + 1, dtype = np.int64)
+
+def create_hourly_store(out_path, first_day, stations, intervals,
+  interval = 60, variable = "flow", station_dim = "station",
+  time_dim = "time", station_chunk = STATION_CHUNK, attrs = None):
+  """
+  Accept the output Zarr store path and the create_hourly_file settings.
+  Create the store as create_hourly_file does, with xarray's dimension
+  and time attributes and one Zarr chunk per CHUNK_HOURS by station
+  chunk, so each chunk of results is written as whole Zarr chunks and
+  workers never write the same chunk. Return the open Zarr group.
+
+  """
+
+  import zarr
+  per_hour = check_interval(interval)
+  out = zarr.open_group(str(out_path), mode = "w")
+
+  times = out.create_dataset(time_dim, data = output_times(first_day,
+    intervals, interval), chunks = (intervals,))
+  times.attrs.update({"_ARRAY_DIMENSIONS": [time_dim],
+    "units": "minutes since 1970-01-01 00:00:00",
+    "calendar": "proleptic_gregorian"})
+  names = [str(station) for station in stations]
+  out.create_dataset(station_dim, data = np.array(names, dtype = "U%d"
+    % max(len(name) for name in names))).attrs["_ARRAY_DIMENSIONS"] = [station_dim]
+
+  values = out.create_dataset(variable, shape = (intervals, len(stations)),
+    chunks = (min(intervals, CHUNK_HOURS*per_hour),
+    min(station_chunk, len(stations))), dtype = "f8", fill_value = np.nan)
+  values.attrs.update(dict(attrs or {}))
+  values.attrs.update({"_ARRAY_DIMENSIONS": [time_dim, station_dim],
+    "cell_methods": f"{time_dim}: mean (interval: {interval} minutes)"})
+  return out
+
+def close_hourly_output(out):
+  """
+  Accept the output from create_hourly_file or create_hourly_store.
+  Close the NetCDF file, or consolidate the Zarr store's metadata so
+  xarray opens it in one read.
+
+  """
+
+  if hasattr(out, "close"):
+    out.close()
+  else:
+    import zarr
+    zarr.consolidate_metadata(out.store)
+
+def smooth_dataset(in_path, out_path, variable = "flow",
+  station_dim = "station", time_dim = "time", peaks_files = None,
+  interval = 60, engine = "splrep", workers = 1,
+  station_chunk = STATION_CHUNK, max_fill_days = 2):
+  """
+  Accept a daily (time, station) NetCDF or Zarr input path, the NetCDF
+  or Zarr (ending in .zarr) output path, flow variable and dimension names, (optional) dictionary
+  of station name to peaks file name, output interval in minutes,
+  engine (a registered name when workers > 1), number of worker
+  processes, stations per chunk and the longest gap in days to
+  interpolate across. Read, smooth and write the stations one chunk at a
+  time, with up to 2*workers chunks in flight, so memory use depends on
+  the chunk size rather than the basin size. Write the smoothed flows
+  with a period ending time coordinate. Return the number of stations.
+
+  """
+
+  start_timer = time.time()
+  per_day = 24*check_interval(interval)
+  peaks_files = peaks_files or {}
+
+  dataset = open_daily_dataset(in_path)
+  first_day = dataset_days(dataset[time_dim].values)[0]
+  stations = [str(station) for station in dataset[station_dim].values]
+  create_output = create_hourly_store if is_zarr(out_path) else \
+    create_hourly_file
+  out = create_output(out_path, first_day, stations,
+    dataset.sizes[time_dim]*per_day, interval, variable, station_dim,
+    time_dim, station_chunk, dataset[variable].attrs)
+
+  def chunk_args(start, stop, flows):
+    peaks = [core.read_peak_table(peaks_files[station])
+      if station in peaks_files else None for station in stations[start:stop]]
+    return first_day, flows, peaks, interval, engine, max_fill_days
+
+  print (f"Smoothing {len(stations)} stations in chunks of {station_chunk}")
+
+  chunks = iter_station_chunks(dataset, variable, station_dim, time_dim,
+    station_chunk)
+  try:
+    if workers > 1:
+      with ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = collections.deque()
+        for start, stop, flows in chunks:
+          pending.append((start, stop, executor.submit(smooth_station_chunk,
+            *chunk_args(start, stop, flows))))
+          if len(pending) >= 2*workers:
+            start, stop, future = pending.popleft()
+            out[variable][:, start:stop] = future.result()
+        for start, stop, future in pending:
+          out[variable][:, start:stop] = future.result()
+    else:
+      for start, stop, flows in chunks:
+        out[variable][:, start:stop] = smooth_station_chunk(*chunk_args(start,
+          stop, flows))
+  finally:
+    close_hourly_output(out)
+    dataset.close()
+
+  end_timer = time.time()
+  compute_time = (end_timer-start_timer)/60
+  print( f"Compute time: {compute_time:.2f} minutes")
+
+  return len(stations)
+
+def daily_dataset_from_files(daily_flow_filenames, out_path,
+  variable = "flow", station_dim = "station", time_dim = "time"):
+  """
+  Accept a dictionary of station name to daily timeseries input
+  filename and an output NetCDF path. Read each file as
+  spline_segments() does and write them as one daily (time, station)
+  dataset over the union of their days, missing days as NaN. Return the
+  xarray Dataset.
+
+  """
+
+  import xarray as xr
+  records = {station: read_daily_record(filename)
+    for station, filename in daily_flow_filenames.items()}
+  first = min(days[0] for info, days, flows in records.values())
+  last = max(days[-1] for info, days, flows in records.values())
+  days = pd.period_range(first, last, freq = "D")
+  flows = np.full((days.size, len(records)), np.nan)
+  for i, (info, record_days, record_flows) in enumerate(records.values()):
+    start = record_days[0].ordinal - first.ordinal
+    flows[start:start + record_flows.size, i] = record_flows
+
+  units = next(iter(records.values()))[0].get("units")
+  dataset = xr.Dataset({variable: ((time_dim, station_dim), flows,
+    {"units": units} if units else {})},
+    coords = {time_dim: days.to_timestamp(), station_dim: list(records)})
+  dataset.to_netcdf(out_path)
+  return dataset
@@ -0,0 +1,204 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from CVHSSmoothing import core
+from CVHSSmoothing.core import FAUX_OFFSET, CHUNK_HOURS
+from CVHSSmoothing.datasets import smooth_station
+from CVHSSmoothing.segments import read_daily_record
+from CVHSSmoothing.Spline import hourly_series, write_smooth_output
+
+def smooth_gauge(daily_flow_filename, peaks_file_name = False,
+  engine = "splrep", max_fill_days = 2):
+  """
+  Accept daily timeseries input filename, (optional) filename for
+  irregular time series of peaks, engine and the longest gap in days to
+  interpolate across. Smooth the record as spline_segments() does.
+  Return the hour ordinal (since 1970-01-01) of the end of the first
+  hour (0100 of the first day) and the hourly flows, negative flows set
+  to 0 and gaps left as NaN.
+
+  """
+
+  timeseries_info, days, flows = read_daily_record(daily_flow_filename)
+  peaks = core.read_peak_table(peaks_file_name) if peaks_file_name else None
+  return 24*days[0].ordinal + 1, smooth_station(days[0].ordinal + FAUX_OFFSET,
+    flows, peaks, engine = engine, max_fill_days = max_fill_days)
+
+def align(operands):
+  """
+  Accept a list of (first hour, values) pairs and numbers. Trim the
+  series to the hours they all cover. Return the first hour (None if
+  there are only numbers) and the list of trimmed arrays and numbers.
+
+  """
+
+  series = [operand for operand in operands if isinstance(operand, tuple)]
+  if not series:
+    return None, list(operands)
+  first = max(first_hour for first_hour, values in series)
+  last = min(first_hour + values.size for first_hour, values in series)
+  if last <= first:
+    raise ValueError("The series in the expression do not overlap")
+  return first, [operand[1][first - operand[0]:last - operand[0]]
+    if isinstance(operand, tuple) else operand for operand in operands]
+
+class Node(object):
+  """
+  A series in a derived-series graph. Adding, subtracting, negating or
+  scaling nodes (and numbers) builds new nodes; nothing is read or
+  smoothed until evaluate().
+
+  """
+
+  def __add__(self, other):
+    return Combination(np.add, "+", self, other)
+
+  def __radd__(self, other):
+    return Combination(np.add, "+", other, self)
+
+  def __sub__(self, other):
+    return Combination(np.subtract, "-", self, other)
+
+  def __rsub__(self, other):
+    return Combination(np.subtract, "-", other, self)
+
+  def __mul__(self, other):
+    return Combination(np.multiply, "*", self, other)
+
+  def __rmul__(self, other):
+    return Combination(np.multiply, "*", other, self)
+
+  def __neg__(self):
+    return Combination(np.multiply, "*", -1., self)
+
+  def gauges(self):
+    """
+    Yield the gauges the node depends on.
+
+    """
+
+    for operand in getattr(self, "operands", ()):
+      if isinstance(operand, Node):
+        yield from operand.gauges()
+
+class Gauge(Node):
+  """
+  A smoothed gauge record: the leaf of a derived-series graph. Gauges
+  with the same files and settings share one smoothing.
+
+  """
+
+  def __init__(self, daily_flow_filename, peaks_file_name = False,
+    engine = "splrep", max_fill_days = 2, name = None):
+    self.daily_flow_filename = daily_flow_filename
+    self.peaks_file_name = peaks_file_name
+    self.engine = engine
+    self.max_fill_days = max_fill_days
+    self.name = name or os.path.splitext(os.path.basename(daily_flow_filename))[0]
+
+  @property
+  def key(self):
+    return (os.path.abspath(self.daily_flow_filename),
+      os.path.abspath(self.peaks_file_name) if self.peaks_file_name else False,
+      self.engine, self.max_fill_days)
+
+  def gauges(self):
+    yield self
+
+  def compute(self, smoothed, memo):
+    return smoothed[self.key]
+
+  def __repr__(self):
+    return self.name
+
+class Combination(Node):
+  """
+  An arithmetic combination of two nodes or numbers, over the hours
+  covered by every series in it.
+
+  """
+
+  def __init__(self, operator, symbol, *operands):
+    self.operator = operator
+    self.symbol = symbol
+    self.operands = operands
+
+  def compute(self, smoothed, memo):
+    if id(self) not in memo:
+      operands = [operand.compute(smoothed, memo) if isinstance(operand, Node)
+        else float(operand) for operand in self.operands]
+      first_hour, values = align(operands)
+      memo[id(self)] = (first_hour, self.operator(*values))
+    return memo[id(self)]
+
+  def __repr__(self):
+    return "(%r %s %r)" % (self.operands[0], self.symbol, self.operands[1])
+
+def smooth_gauges(gauges, smoothed = None, workers = 1):
+  """
+  Accept gauges, a dictionary of gauge key to smooth_gauge result for
+  the gauges already smoothed (the memo) and the number of worker
+  processes. Smooth each gauge not yet in the memo once, in parallel
+  when workers > 1 (with registered engine names). Return the memo.
+
+  """
+
+  smoothed = {} if smoothed is None else smoothed
+  pending = {}
+  for gauge in gauges:
+    if gauge.key not in smoothed:
+      pending.setdefault(gauge.key, gauge)
+  if not pending:
+    return smoothed
+
+  print (f"Smoothing {len(pending)} gauges")
+  args = [(gauge.daily_flow_filename, gauge.peaks_file_name, gauge.engine,
+    gauge.max_fill_days) for gauge in pending.values()]
+  if workers > 1 and len(pending) > 1:
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+      results = list(executor.map(smooth_gauge, *zip(*args)))
+  else:
+    results = [smooth_gauge(*arg) for arg in args]
+  smoothed.update(zip(pending, results))
+  return smoothed
+
+def evaluate(expressions, smoothed = None, workers = 1):
+  """
+  Accept a dictionary of name to node (e.g. local = downstream -
+  upstream_a - upstream_b), (optional) memo of smoothed gauges to reuse
+  across calls and the number of worker processes. Smooth every gauge
+  the expressions depend on once, however many expressions share it,
+  then evaluate the expressions, each shared sub-expression once.
+  Return a dictionary of name to hourly Series (on an hourly
+  PeriodIndex labelled with the end of each hour, as in the output
+  files; NaN where any input is missing).
+
+  """
+
+  smoothed = smooth_gauges([gauge for node in expressions.values()
+    for gauge in node.gauges()], smoothed, workers)
+  memo = {}
+  series = {}
+  for name, node in expressions.items():
+    first_hour, values = node.compute(smoothed, memo)
+    if first_hour is None:
+      raise ValueError(f"{name} does not depend on any gauge")
+    series[name] = hourly_series(values, first_hour)
+  return series
+
+def write_series(output_file_name, series, timeseries_info):
+  """
+  Accept output_file_name, an hourly Series from evaluate() starting
+  with the hour ending 0100 of a day and timeseries_info (e.g. from
+  read_timeseries_info, with the B-part renamed). Write it as spline()
+  does. Return nothing.
+
+  """
+
+  if series.index[0].hour != 1:
+    raise ValueError("The series must start with the hour ending 0100 of a day")
+  values = series.to_numpy(dtype = float)
+  chunks = (values[i:i + CHUNK_HOURS] for i in range(0, values.size, CHUNK_HOURS))
+  write_smooth_output(output_file_name, dict(timeseries_info),
+    series.index[0].strftime("%d%b%Y"), chunks)
@@ -1,49 +1,43 @@
-from pydsstools.heclib.dss import HecDss
-import pandas as pd
-from pydsstools.core import TimeSeriesContainer
+from CVHSSmoothing.dss_writer import DssWriter
 
 
-def import_smooth_ts(outfile, out_dss, out_dss_path=None, day_offset = None):
+def import_smooth_ts(outfile, out_dss, out_dss_path=None, day_offset = None, backend='dss'):
     """
     DSS import helper function.  Imports smoothed time series as regular time series.
+    The interval is taken from the E-part written to the output file; the E-part of
+    out_dss_path is replaced to match it.
 
     Args:
         outfile ([str]): [file path to output file from spline interpolation]
         out_dss ([type]): [dss output file path.  Can exist or be a new file]
         out_dss_path ([str], optional): [dss path name for output record]. Defaults to line 1 of output file.
         day_offset ([int], optional): [day shift for output time series]. Defaults to None.
+        backend ([str], optional): [storage backend registered in dss_writer.py]. Defaults to 'dss'.
     """
 
-    #TODO make cleaner input output path handling
-    df = pd.read_csv(outfile)
-
-    if day_offset is None:
-        start_date = df.iloc[2][0]
-    else:
-        start_date = (pd.to_datetime(df.iloc[2][0], format = '%d%b%Y %H%M') + pd.DateOffset(days=day_offset)).strftime('%d%b%Y %H:00')
-
-    if out_dss_path is None:
-        out_dss_path = df.columns[0]
-    else:
-        pass
-
-    data = df.iloc[3:-2]
-
-    data.columns = ['flow']
-    data.flow = data.flow.astype(float)
+    with DssWriter(backend) as writer:
+        writer.queue(outfile, out_dss, out_dss_path, day_offset)
 
 
+def import_smooth_batch(outfiles, out_dss, out_dss_paths=None, day_offset=None, backend='dss'):
+    """
+    Batched DSS import helper function. Imports many smoothed time series into one
+    file, keeping it open for the whole batch and writing large records in chunks.
 
-    tsc = TimeSeriesContainer()
-    tsc.pathname = out_dss_path
-    tsc.startDateTime = start_date
-    tsc.numberValues = data.shape[0]
-    tsc.units = "cfs"
-    tsc.type = "PER-AVER"
-    tsc.interval = 1
-    tsc.values = data[data.columns[0]].values
+    Args:
+        outfiles ([list]): [file paths to output files from spline interpolation]
+        out_dss ([str]): [dss output file path.  Can exist or be a new file]
+        out_dss_paths ([list], optional): [dss path names for the output records]. Defaults to line 1 of each output file.
+        day_offset ([int], optional): [day shift for output time series]. Defaults to None.
+        backend ([str], optional): [storage backend registered in dss_writer.py]. Defaults to 'dss'.
 
+    Returns:
+        [int]: [number of records written]
+    """
 
-    with HecDss.Open(out_dss) as fid:
-        fid.put_ts(tsc)
-        fid.close()
\ No newline at end of file
+    if out_dss_paths is None:
+        out_dss_paths = [None] * len(outfiles)
+    with DssWriter(backend) as writer:
+        for outfile, out_dss_path in zip(outfiles, out_dss_paths):
+            writer.queue(outfile, out_dss, out_dss_path, day_offset)
+    return len(outfiles)
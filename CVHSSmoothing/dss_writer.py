@@ -0,0 +1,299 @@
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import numpy as np
+
+from CVHSSmoothing.Spline import epart_interval
+
+# Values written per put by the backends
+CHUNK_VALUES = 87840
+
+# Registered backends: name -> class taking the output path
+_backends = {}
+
+
+def register_backend(name, backend=None):
+    """Register a storage backend class. Can be used as a decorator.
+
+    A backend is constructed with the output path, which it opens (and
+    keeps open), and must provide put_record(pathname, start, interval,
+    chunks, units, data_type) and close().
+
+    Args:
+        name (str): backend name
+        backend (type, optional): backend class. Defaults to None (decorator use).
+
+    Returns:
+        type: backend
+    """
+
+    if backend is None:
+        return lambda backend: register_backend(name, backend)
+    _backends[name] = backend
+    return backend
+
+
+def get_backend(backend):
+    """Look up a storage backend.
+
+    Args:
+        backend (str or type): backend name or class
+
+    Returns:
+        type: backend class
+    """
+
+    if isinstance(backend, type):
+        return backend
+    try:
+        return _backends[backend]
+    except KeyError:
+        raise ValueError(f"Unknown backend {backend!r}; available backends are {sorted(_backends)}")
+
+
+def read_smooth_header(outfile):
+    """Read the pathname and start of an output file written by spline().
+
+    Args:
+        outfile (str): file path to output file from spline interpolation
+
+    Returns:
+        tuple: pathname (str), start (datetime) and interval in minutes (int)
+    """
+
+    with open(outfile, 'r') as f:
+        header = [line.strip() for line in itertools.islice(f, 4)]
+    start = datetime.datetime.strptime(header[3], '%d%b%Y %H%M')
+    return header[0], start, epart_interval(header[0].split('/')[5])
+
+
+def iter_smooth_values(outfile, chunk_values=CHUNK_VALUES):
+    """Read the values of an output file written by spline() in chunks.
+
+    Args:
+        outfile (str): file path to output file from spline interpolation
+        chunk_values (int, optional): values per chunk. Defaults to CHUNK_VALUES.
+
+    Yields:
+        np.ndarray: up to chunk_values consecutive values
+    """
+
+    with open(outfile, 'r') as f:
+        lines = itertools.takewhile(lambda line: not line.startswith('END'),
+                                    itertools.islice(f, 4, None))
+        while True:
+            chunk = np.array(list(itertools.islice(lines, chunk_values)), dtype=float)
+            if chunk.size == 0:
+                return
+            yield chunk
+
+
+def record_path(pathname, out_dss_path=None):
+    """Resolve the pathname a record is written to.
+
+    Args:
+        pathname (str): pathname from the output file
+        out_dss_path (str, optional): requested pathname; its E-part is replaced
+            when the interval differs from the output file. Defaults to pathname.
+
+    Returns:
+        str: pathname
+    """
+
+    if out_dss_path is None:
+        return pathname
+    epart = pathname.split('/')[5]
+    parts = out_dss_path.split('/')
+    if epart_interval(parts[5]) != epart_interval(epart):
+        parts[5] = epart.upper()
+    return '/'.join(parts)
+
+
+@register_backend('dss')
+class DssBackend(object):
+
+    def __init__(self, out_dss):
+        """Open a HEC-DSS file with pydsstools and keep it open.
+
+        Args:
+            out_dss (str): dss output file path. Can exist or be a new file
+        """
+
+        from pydsstools.heclib.dss import HecDss
+        self.fid = HecDss.Open(out_dss)
+
+    def put_record(self, pathname, start, interval, chunks, units, data_type):
+        """Write a regular time series, one put_ts per chunk.
+
+        Args:
+            pathname (str): dss path name for output record
+            start (datetime): end of the first interval
+            interval (int): interval in minutes
+            chunks (iterable): arrays of consecutive values
+            units (str): units
+            data_type (str): data type, e.g. PER-AVER
+        """
+
+        from pydsstools.core import TimeSeriesContainer
+        position = 0
+        for chunk in chunks:
+            tsc = TimeSeriesContainer()
+            tsc.pathname = pathname
+            tsc.startDateTime = (start + datetime.timedelta(minutes=interval*position)).strftime('%d%b%Y %H:%M')
+            tsc.numberValues = chunk.size
+            tsc.units = units
+            tsc.type = data_type
+            tsc.interval = 1
+            tsc.values = chunk
+            self.fid.put_ts(tsc)
+            position += chunk.size
+
+    def close(self):
+        self.fid.close()
+
+
+@register_backend('local')
+class LocalBackend(object):
+
+    def __init__(self, out_dss):
+        """Open a directory that stands in for a DSS file: one raw float64 file
+        per record and an index.json of pathname to record information.
+
+        Args:
+            out_dss (str): directory path. Can exist or be new
+        """
+
+        self.directory = out_dss
+        os.makedirs(out_dss, exist_ok=True)
+        self.index = read_local_index(out_dss)
+
+    def put_record(self, pathname, start, interval, chunks, units, data_type):
+        """Write a regular time series, appending each chunk to the record file.
+
+        Args:
+            pathname (str): path name for output record
+            start (datetime): end of the first interval
+            interval (int): interval in minutes
+            chunks (iterable): arrays of consecutive values
+            units (str): units
+            data_type (str): data type, e.g. PER-AVER
+        """
+
+        file_name = hashlib.sha1(pathname.encode()).hexdigest()[:16] + '.f8'
+        count = 0
+        with open(os.path.join(self.directory, file_name), 'wb') as f:
+            for chunk in chunks:
+                np.asarray(chunk, dtype='<f8').tofile(f)
+                count += chunk.size
+        self.index[pathname] = {'file': file_name, 'start': start.strftime('%d%b%Y %H:%M'),
+                                'interval': interval, 'values': count, 'units': units,
+                                'type': data_type}
+
+    def close(self):
+        descriptor, temporary_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(temporary_name, os.path.join(self.directory, 'index.json'))
+
+
+def read_local_index(out_dss):
+    """Read the index of a LocalBackend directory.
+
+    Args:
+        out_dss (str): directory path
+
+    Returns:
+        dict: pathname to record information; empty if there is no index
+    """
+
+    index_file = os.path.join(out_dss, 'index.json')
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file, 'r') as f:
+        return json.load(f)
+
+
+def read_local_record(out_dss, pathname):
+    """Read a record written by LocalBackend.
+
+    Args:
+        out_dss (str): directory path
+        pathname (str): record path name
+
+    Returns:
+        tuple: record information (dict) and values (np.ndarray, memory mapped)
+    """
+
+    info = read_local_index(out_dss)[pathname]
+    values = np.memmap(os.path.join(out_dss, info['file']), dtype='<f8', mode='r')
+    return info, values
+
+
+class DssWriter(object):
+
+    def __init__(self, backend='dss', chunk_values=CHUNK_VALUES, max_queued=100):
+        """Queue smoothed output files and write them as records, keeping one
+        backend handle open per output file until close().
+
+        Args:
+            backend (str or type, optional): registered backend name or class. Defaults to 'dss'.
+            chunk_values (int, optional): values read and written at a time. Defaults to CHUNK_VALUES.
+            max_queued (int, optional): queued records that trigger a flush. Defaults to 100.
+        """
+
+        self.backend = get_backend(backend)
+        self.chunk_values = chunk_values
+        self.max_queued = max_queued
+        self.handles = {}
+        self.queued = []
+
+    def queue(self, outfile, out_dss, out_dss_path=None, day_offset=None):
+        """Queue an output file for writing, as import_smooth_ts does.
+
+        Args:
+            outfile (str): file path to output file from spline interpolation
+            out_dss (str): output file path for the backend
+            out_dss_path (str, optional): path name for output record. Defaults to line 1 of output file.
+            day_offset (int, optional): day shift for output time series. Defaults to None.
+        """
+
+        self.queued.append((outfile, out_dss, out_dss_path, day_offset))
+        if len(self.queued) >= self.max_queued:
+            self.flush()
+
+    def flush(self):
+        """Write the queued records, grouped by output file.
+
+        Returns:
+            int: number of records written
+        """
+
+        queued = sorted(self.queued, key=lambda record: record[1])
+        self.queued = []
+        for outfile, out_dss, out_dss_path, day_offset in queued:
+            if out_dss not in self.handles:
+                self.handles[out_dss] = self.backend(out_dss)
+            pathname, start, interval = read_smooth_header(outfile)
+            if day_offset is not None:
+                start += datetime.timedelta(days=day_offset)
+            self.handles[out_dss].put_record(record_path(pathname, out_dss_path), start, interval,
+                                             iter_smooth_values(outfile, self.chunk_values),
+                                             'cfs', 'PER-AVER')
+        return len(queued)
+
+    def close(self):
+        """Flush the queue and close every backend handle."""
+
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
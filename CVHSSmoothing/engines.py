@@ -0,0 +1,75 @@
+import numpy as np
+from scipy import interpolate
+
+from CVHSSmoothing.kernels import pchip_slopes
+
+# Registered engines: name -> fit(x, y) returning an evaluate(x) function
+_engines = {}
+
+def register_engine(name, fit = None):
+  """
+  Accept an engine name and a fit function. fit(x, y) receives the
+  sorted knot hours and accumulation values and must return a function
+  that evaluates the fitted curve at an array of hours. Can be used as a
+  decorator. Return fit.
+
+  """
+
+  if fit is None:
+    return lambda fit: register_engine(name, fit)
+  _engines[name] = fit
+  return fit
+
+def get_engine(engine):
+  """
+  Accept an engine name or a fit function. Return the fit function.
+
+  """
+
+  if callable(engine):
+    return engine
+  try:
+    return _engines[engine]
+  except KeyError:
+    raise ValueError(f"Unknown engine {engine!r}; available engines are {available_engines()}")
+
+def available_engines():
+  """
+  Return the names of the registered engines.
+
+  """
+
+  return sorted(_engines)
+
+@register_engine("splrep")
+def fit_splrep(x, y):
+  """
+  Interpolating cubic B-spline (FITPACK splrep/splev), as used by
+  Spline.py since the start.
+
+  """
+
+  spline_function = interpolate.splrep(x, y, s=0)
+  return lambda x_new: interpolate.splev(x_new, spline_function, der=0)
+
+@register_engine("pchip")
+def fit_pchip(x, y):
+  """
+  Monotone piecewise cubic Hermite interpolation; never produces
+  negative flows from a non-decreasing accumulation. The slopes come
+  from kernels.py and match scipy's PchipInterpolator.
+
+  """
+
+  x = np.asarray(x, dtype=float)
+  return interpolate.CubicHermiteSpline(x, y, pchip_slopes(x, y))
+
+@register_engine("akima")
+def fit_akima(x, y):
+  """
+  Akima piecewise cubic interpolation; local like PCHIP but not
+  monotone.
+
+  """
+
+  return interpolate.Akima1DInterpolator(x, y)
@@ -1,71 +1,73 @@
 import pandas as pd
-from scipy.interpolate import , splev
-import numpy as np
-import numpy.ma as ma
-from scipy import interpolate
+
+from CVHSSmoothing import core
+from CVHSSmoothing.core import FAUX_OFFSET
+from CVHSSmoothing.Spline import build_hourly_accumulation, clean_negative_flows
 
 class HydroSpline(object):
 
-    def __init__(self, daily_dates, daily_flows, peaks_dates = None, peak_values =None, method = 'pchip'):
-        """_summary_
+    def __init__(self, daily_dates, daily_flows, peaks_dates = None, peak_values =None, method = 'pchip', peak_types = None):
+        """Smooth a daily hydrograph held in memory to hourly.
 
         Args:
-            daily_dates (_type_): _description_
-            daily_flows (_type_): _description_
-            peaks (_type_, optional): _description_. Defaults to None.
+            daily_dates (array-like): dates of the daily average flows
+            daily_flows (array-like): daily average flows
+            peaks_dates (array-like, optional): dates of instantaneous peaks. Defaults to None.
+            peak_values (array-like, optional): peak flows. Defaults to None.
+            method (str, optional): interpolation engine registered in engines.py. Defaults to 'pchip'.
+            peak_types (array-like, optional): peak hour codes as in the peaks files. Defaults to "2" (11 AM).
         """
         self.daily_dates = daily_dates
         self.daily_flows = daily_flows
         self.peak_dates = peaks_dates
         self.peak_values = peak_values
-        if not self.peak_values is None and self.peak_dates is None:
+        self.peak_df = None
+        self.peaks = None
+        if self.peak_values is not None and self.peak_dates is not None:
 
             assert len(self.peak_dates) == len(self.peak_values), 'Peak Dates and Peak Values are of different length'
-            self.peak_df = pd.DataFame(index = pd.Index(self.peak_dates, name = 'date'), data = {'flow':self.peak_values})
-        self.df = pd.DataFame(index = pd.Index(self.daily_dates, name = 'date'), data = {'flow':self.daily_flows})
+            if peak_types is None:
+                peak_types = ['2'] * len(self.peak_values)
+            self.peak_df = pd.DataFrame(index = pd.PeriodIndex(self.peak_dates, freq = 'D', name = 'date'),
+                                        data = {'flow':self.peak_values, 'type':[str(t) for t in peak_types]})
+            self.peaks = core.peak_table(self.peak_df.index.asi8 + FAUX_OFFSET, self.peak_df.flow.values,
+                                         self.peak_df.type.values)
+        self.df = pd.DataFrame(index = pd.PeriodIndex(self.daily_dates, freq = 'D', name = 'date'),
+                               data = {'flow':self.daily_flows})
 
         self.method = method
 
     def spline(self):
+        """Build the accumulation curve, insert the peaks and generate the cleaned hourly hydrograph.
 
-        self.daily_hydrograph = self.df.set_index('date').squeeze()
-        self.daily_hydrograph.index = pd.PeriodIndex(self.daily_hydrograph.index, freq='H')
-        self.daily_accumulation = self.daily_hydrograph.cumsum()
-        self.daily_accumulation = self.daily_accumulation.asfreq('H', how='start')
-
-
-        targ_idx = pd.period_range(self.df.date.min(), self.df.date.max(), freq = 'H')
-        hourly_accumulation = self.daily_accumulation.reindex(targ_idx)
-        
-
-        hourly_hydrograph = self.generate_hydrograph(hourly_accumulation)
-
-    def generate_hydrograph(self):
-        self.masked_dates = ma.array(self.hourly_accumulation.index.view('int64'),
-                            mask = self.hourly_accumulation.isna()) 
-        self.masked_flows = ma.array(self.hourly_accumulation.values,
-                                mask = self.hourly_accumulation.isna) 
-
-        if self.method == 'pchip':
-
-            spline_function = interpolate.PchipInterpolator(self.masked_dates.compressed(),
-                                                self.hourly_accumulation.dropna().values, s=0)
-        else: 
-            spline_function = interpolate.PchipInterpolator(self.masked_dates.compressed(),
-                                                self.hourly_accumulation.dropna().values, s=0)
+        Returns:
+            pd.Series: hour-ending flows on real dates, starting at 0000 of the first day
+        """
 
-        y_spline = interpolate.splev(self.hourly_accumulation.index.view('int64'),
-                                    spline_function, der=0)      
-        self.y_hourly_hydrograph_temp = np.diff(y_spline)*24
-        self.y_hourly_hydrograph = np.zeros(np.size(self.hourly_accumulation))
-        for i in range(1, np.size(self.hourly_accumulation)):
-            self.y_hourly_hydrograph[i] =  self.y_hourly_hydrograph_temp[i-1]
-        hydrologic_timeseries = pd.Series(self.y_hourly_hydrograph, 
-        index = self.hourly_accumulation.index)  
+        first_date = self.df.index[0] + FAUX_OFFSET
+        dates = [first_date] + list(self.df.index + FAUX_OFFSET + 1)
+        self.daily_accumulation, self.hourly_accumulation = build_hourly_accumulation(
+            dates, [0] + list(self.df.flow.values))
 
+        if self.peaks is not None:
+            knot_days = self.daily_accumulation.index.asi8
+            accumulation = self.hourly_accumulation.to_numpy(copy = True)
+            core.insert_peaks(knot_days, self.daily_accumulation.values, accumulation,
+                              core.select_peaks(knot_days, self.peaks))
+            self.hourly_accumulation[:] = accumulation
 
+        hydrologic_timeseries = self.generate_hydrograph()
+        hydrologic_timeseries.index = pd.period_range(self.df.index[0].asfreq('H', how = 'start'),
+                                                      periods = hydrologic_timeseries.size, freq = 'H')
+        self.hourly_hydrograph = hydrologic_timeseries
 
+        return hydrologic_timeseries
 
+    def generate_hydrograph(self):
+        """Fit the accumulation curve with the selected engine, cleaning negative flows.
 
-        
+        Returns:
+            pd.Series: hourly hydrograph on faux dates
+        """
 
+        return clean_negative_flows(self.hourly_accumulation, verbose = False, engine = self.method)
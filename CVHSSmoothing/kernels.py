@@ -0,0 +1,213 @@
+import os
+import numpy as np
+
+# Numba is optional; set CVHS_DISABLE_JIT=1 to force the NumPy kernels
+try:
+  if os.environ.get("CVHS_DISABLE_JIT"):
+    raise ImportError
+  import numba
+except ImportError:
+  numba = None
+
+ACCELERATED = numba is not None
+
+def _select_knots_numpy(values):
+  return np.flatnonzero(~np.isnan(values))
+
+def _select_knots_loop(values):
+  count = 0
+  for i in range(values.size):
+    if not np.isnan(values[i]):
+      count += 1
+  knots = np.empty(count, dtype=np.int64)
+  count = 0
+  for i in range(values.size):
+    if not np.isnan(values[i]):
+      knots[count] = i
+      count += 1
+  return knots
+
+def _differences_numpy(y, scale):
+  return np.hstack((0, np.diff(y)*scale))
+
+def _differences_loop(y, scale):
+  out = np.empty(y.size)
+  out[0] = 0.
+  for i in range(1, y.size):
+    out[i] = (y[i] - y[i-1])*scale
+  return out
+
+def _negative_mask_numpy(hydrograph):
+  negative = hydrograph < 0
+  mask = negative.copy()
+  mask[1:] |= negative[:-1]
+  return mask
+
+def _negative_mask_loop(hydrograph):
+  mask = np.zeros(hydrograph.size, dtype=np.bool_)
+  for i in range(hydrograph.size):
+    if hydrograph[i] < 0:
+      mask[i] = True
+      if i + 1 < hydrograph.size:
+        mask[i+1] = True
+  return mask
+
+def _clip_negative_numpy(values, missing):
+  clipped = np.where(values >= 0, values, 0.)
+  clipped[np.isnan(values)] = missing
+  return clipped
+
+def _clip_negative_loop(values, missing):
+  clipped = np.empty(values.size)
+  for i in range(values.size):
+    if values[i] >= 0:
+      clipped[i] = values[i]
+    elif np.isnan(values[i]):
+      clipped[i] = missing
+    else:
+      clipped[i] = 0.
+  return clipped
+
+def _peaks_exceeded_numpy(hydrograph, first_hours, limits):
+  hours = first_hours[:, None] + np.arange(25)
+  return np.any(hydrograph[hours] > limits[:, None], axis=1)
+
+def _peaks_exceeded_loop(hydrograph, first_hours, limits):
+  exceeded = np.zeros(first_hours.size, dtype=np.bool_)
+  for i in range(first_hours.size):
+    for hour in range(first_hours[i], first_hours[i] + 25):
+      if hydrograph[hour] > limits[i]:
+        exceeded[i] = True
+        break
+  return exceeded
+
+# Scalar code, shared by both slope kernels (and compiled with them)
+def _pchip_edge(h0, h1, m0, m1):
+  d = ((2*h0 + h1)*m0 - h0*m1) / (h0 + h1)
+  if np.sign(d) != np.sign(m0):
+    return 0.
+  if np.sign(m0) != np.sign(m1) and np.abs(d) > 3.*np.abs(m0):
+    return 3.*m0
+  return d
+
+def _pchip_slopes_numpy(x, y):
+  hk = x[1:] - x[:-1]
+  mk = (y[1:] - y[:-1]) / hk
+  if y.size == 2:
+    return np.array([mk[0], mk[0]])
+  smk = np.sign(mk)
+  condition = (smk[1:] != smk[:-1]) | (mk[1:] == 0) | (mk[:-1] == 0)
+  w1 = 2*hk[1:] + hk[:-1]
+  w2 = hk[1:] + 2*hk[:-1]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    whmean = (w1/mk[:-1] + w2/mk[1:]) / (w1 + w2)
+  dk = np.zeros_like(y)
+  dk[1:-1][~condition] = 1.0 / whmean[~condition]
+  dk[0] = _pchip_edge(hk[0], hk[1], mk[0], mk[1])
+  dk[-1] = _pchip_edge(hk[-1], hk[-2], mk[-1], mk[-2])
+  return dk
+
+def _pchip_slopes_loop(x, y):
+  n = y.size
+  dk = np.zeros(n)
+  if n == 2:
+    m = (y[1] - y[0]) / (x[1] - x[0])
+    dk[0] = m
+    dk[1] = m
+    return dk
+  for k in range(1, n - 1):
+    h0 = x[k] - x[k-1]
+    h1 = x[k+1] - x[k]
+    m0 = (y[k] - y[k-1]) / h0
+    m1 = (y[k+1] - y[k]) / h1
+    if np.sign(m1) != np.sign(m0) or m1 == 0 or m0 == 0:
+      continue
+    w1 = 2*h1 + h0
+    w2 = h1 + 2*h0
+    dk[k] = 1.0 / ((w1/m0 + w2/m1) / (w1 + w2))
+  h0 = x[1] - x[0]
+  h1 = x[2] - x[1]
+  dk[0] = _pchip_edge(h0, h1, (y[1] - y[0]) / h0, (y[2] - y[1]) / h1)
+  h0 = x[n-1] - x[n-2]
+  h1 = x[n-2] - x[n-3]
+  dk[n-1] = _pchip_edge(h0, h1, (y[n-1] - y[n-2]) / h0,
+    (y[n-2] - y[n-3]) / h1)
+  return dk
+
+if ACCELERATED:
+  _jit = numba.njit(cache=True)
+  _select_knots = _jit(_select_knots_loop)
+  _differences = _jit(_differences_loop)
+  _negative_mask = _jit(_negative_mask_loop)
+  _clip_negative = _jit(_clip_negative_loop)
+  _peaks_exceeded = _jit(_peaks_exceeded_loop)
+  _pchip_edge = _jit(_pchip_edge)
+  _pchip_slopes = _jit(_pchip_slopes_loop)
+else:
+  _select_knots = _select_knots_numpy
+  _differences = _differences_numpy
+  _negative_mask = _negative_mask_numpy
+  _clip_negative = _clip_negative_numpy
+  _peaks_exceeded = _peaks_exceeded_numpy
+  _pchip_slopes = _pchip_slopes_numpy
+
+def select_knots(values):
+  """
+  Accept an accumulation array with NaN between knots. Return the
+  indices of the knots.
+
+  """
+
+  return _select_knots(np.ascontiguousarray(values, dtype=np.float64))
+
+def hourly_differences(y_spline, scale = 24.):
+  """
+  Accept evaluated accumulation values and a scale (intervals per day).
+  Return the scaled differences with a leading zero, the same length as
+  y_spline.
+
+  """
+
+  return _differences(np.ascontiguousarray(y_spline, dtype=np.float64),
+    float(scale))
+
+def negative_mask(hydrograph):
+  """
+  Accept hydrograph values. Return a boolean mask of every negative
+  value and the value following it.
+
+  """
+
+  return _negative_mask(np.ascontiguousarray(hydrograph, dtype=np.float64))
+
+def clip_negative(values, missing):
+  """
+  Accept flow values and the missing value flag. Return the values with
+  negatives set to zero and NaN set to missing, as they are written.
+
+  """
+
+  return _clip_negative(np.ascontiguousarray(values, dtype=np.float64),
+    float(missing))
+
+def peaks_exceeded(hydrograph, first_hours, limits):
+  """
+  Accept hydrograph values, the position of 0000 on each peak day and
+  the flow limit for each peak. Return a boolean array, True where any
+  flow from 0000 to 2400 of the peak day exceeds its limit.
+
+  """
+
+  return _peaks_exceeded(np.ascontiguousarray(hydrograph, dtype=np.float64),
+    np.ascontiguousarray(first_hours, dtype=np.int64),
+    np.ascontiguousarray(limits, dtype=np.float64))
+
+def pchip_slopes(x, y):
+  """
+  Accept knot positions and values. Return the PCHIP (Fritsch-Carlson)
+  derivatives at the knots, computed as scipy's PchipInterpolator does.
+
+  """
+
+  return _pchip_slopes(np.ascontiguousarray(x, dtype=np.float64),
+    np.ascontiguousarray(y, dtype=np.float64))
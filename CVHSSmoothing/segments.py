@@ -0,0 +1,174 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from CVHSSmoothing import core
+from CVHSSmoothing.core import CHUNK_HOURS, FAUX_OFFSET, check_interval
+from CVHSSmoothing.Spline import (period_index, read_timeseries_info,
+  write_smooth_output)
+
+def read_daily_record(daily_flow_filename):
+  """
+  Accept daily timeseries input filename. Parse the whole record at once
+  and place it on a continuous daily index, so blank, unparseable and
+  absent days are all NaN. Return timeseries_info, the daily PeriodIndex
+  and the flows array.
+
+  """
+
+  with open(daily_flow_filename, "r") as daily_flow_file:
+    timeseries_info = read_timeseries_info(daily_flow_file.readlines()[0:7])
+
+  tmp = pd.read_csv(daily_flow_filename, sep='\t', skiprows=7, header=None,
+    usecols=[1,2], names=['date','flow'], dtype=str)
+  tmp['date'] = pd.to_datetime(tmp.date, format='%d%b%Y', errors='coerce')
+  tmp = tmp.dropna(subset=['date'])
+  flows = pd.to_numeric(tmp.flow, errors='coerce')
+  flows.index = pd.PeriodIndex(tmp.date, freq='D')
+  flows = flows[~flows.index.duplicated()]
+  first, last = flows.index.min(), flows.index.max()
+  days = period_index(first.ordinal, last.ordinal - first.ordinal + 1, 'D')
+
+  return timeseries_info, days, flows.reindex(days).values
+
+def find_runs(mask):
+  """
+  Accept a boolean mask. Return (start, stop) index arrays of the runs
+  of True values.
+
+  """
+
+  edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+  return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def fill_short_gaps(flows, max_fill_days = 2):
+  """
+  Accept daily flows with NaN for missing days. Linearly interpolate the
+  gaps of up to max_fill_days days that have data on both sides; longer
+  gaps are left as NaN. Return the filled copy.
+
+  """
+
+  flows = np.array(flows, dtype=float)
+  missing = np.isnan(flows)
+  if not missing.any() or missing.all():
+    return flows
+  starts, stops = find_runs(missing)
+  fillable = ((stops - starts) <= max_fill_days) & (starts > 0) & \
+    (stops < flows.size)
+  fill = np.zeros(flows.size, dtype=bool)
+  for start, stop in zip(starts[fillable], stops[fillable]):
+    fill[start:stop] = True
+  valid = np.flatnonzero(~missing)
+  flows[fill] = np.interp(np.flatnonzero(fill), valid, flows[valid])
+  return flows
+
+def find_segments(flows):
+  """
+  Accept daily flows with NaN gaps. Return (start, stop) index arrays of
+  the contiguous runs of valid days.
+
+  """
+
+  return find_runs(~np.isnan(flows))
+
+def smooth_segment(days, flows, peaks, record_end = False, interval = 60,
+  engine = "splrep"):
+  """
+  Accept the daily PeriodIndex and flows of one contiguous segment, the
+  peak table for the record (or None), the output interval in minutes
+  and engine. Smooth the segment as its own record, inserting
+  the peaks that fall inside it. Segments of fewer than three days are
+  spread evenly over each day. Return the flows for the intervals ending
+  within the segment.
+
+  """
+
+  flows = np.clip(flows, 0, None)
+  per_hour = check_interval(interval)
+
+  if flows.size < 3:
+    return np.repeat(flows, 24*per_hour)
+
+  hydrograph, accumulation, first_hour = core.smooth_daily(
+    days[0].ordinal + FAUX_OFFSET, flows, peaks, record_end, engine)
+
+  if interval == 60:
+    return hydrograph[1:]
+  return np.concatenate(list(core.hydrograph_chunks(accumulation, 
+    first_hour, interval, engine = engine)))
+
+def spline_segments(daily_flow_filename, location, peaks_file_name = False,
+  max_fill_days = 2, workers = 1, interval = 60, engine = "splrep"):
+  """
+  Accept daily timeseries input filename, gage location name,
+  (optional) filename for irregular time series of peaks, the longest
+  gap in days to interpolate across, the number of worker processes, the
+  output interval in minutes and engine (a registered name when
+  workers > 1). Fill short gaps, split the record into
+  contiguous segments at the remaining gaps and smooth each segment
+  independently (in parallel when workers > 1). Write the hydrograph to
+  a text file in dssts compatible format as spline() does, with the gaps
+  written as missing values. Return the segment (start, stop) day
+  indices.
+
+  """
+
+  start_timer = time.time()
+  per_day = 24*check_interval(interval)
+
+  print (f"Reading input timeseries for {location}")
+
+  timeseries_info, days, raw_flows = read_daily_record(daily_flow_filename)
+  flows = fill_short_gaps(raw_flows, max_fill_days)
+  starts, stops = find_segments(flows)
+
+  missing_log_file = open(location + "_missing.log", "w")
+  filled = np.isnan(raw_flows) & ~np.isnan(flows)
+  for i in np.flatnonzero(filled):
+    missing_log_file.write("Filled: %s \t %s\n" % (location, days[i]))
+  gap_starts, gap_stops = find_runs(np.isnan(flows))
+  for start, stop in zip(gap_starts, gap_stops):
+    missing_log_file.write("Gap: %s \t %s to %s (%d days)\n" % (location,
+      days[start], days[stop-1], stop-start))
+  missing_log_file.close()
+
+  peaks = None
+  if peaks_file_name:
+    peaks = core.read_peak_table(peaks_file_name)
+
+  print (f"Smoothing {len(starts)} segments")
+
+  args = [(days[start:stop], flows[start:stop], peaks, stop == flows.size,
+    interval, engine) for start, stop in zip(starts, stops)]
+  if workers > 1:
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+      segments = list(executor.map(smooth_segment, *zip(*args)))
+  else:
+    segments = [smooth_segment(*arg) for arg in args]
+
+  def chunks():
+    position = 0
+    for start, segment in zip(starts, segments):
+      gap = start*per_day - position
+      for i in range(0, gap, CHUNK_HOURS):
+        yield np.full(min(CHUNK_HOURS, gap - i), np.nan)
+      yield segment
+      position = start*per_day + segment.size
+    # A trailing gap runs to the end of the record; a last segment that
+    # ends the record already runs on through the following day
+    gap = days.size*per_day - position
+    if gap > 0:
+      yield np.full(gap, np.nan)
+
+  print ("Writing results to file")
+
+  write_smooth_output(location, timeseries_info,
+    days[0].strftime('%d%b%Y'), chunks(), interval)
+
+  end_timer = time.time()
+  compute_time = (end_timer-start_timer)/60
+  print( f"Compute time: {compute_time:.2f} minutes")
+
+  return starts, stops
@@ -0,0 +1,463 @@
+import argparse
+import collections
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+from CVHSSmoothing import core
+
+# Requests smoothed per worker task, and how long to wait for more (seconds)
+MAX_BATCH = 32
+BATCH_WAIT = 0.005
+# Latencies kept for the percentiles reported by /metrics
+LATENCY_WINDOW = 1000
+# Content type of Arrow IPC stream requests and responses
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+def request_day(date):
+  """
+  Accept a date as DDMMMYYYY or YYYY-MM-DD. Return its faux day ordinal.
+
+  """
+
+  if "-" in date:
+    return int(np.datetime64(date, 'D').astype(np.int64)) + core.FAUX_OFFSET
+  return core.day_ordinal(date)
+
+def request_values(request):
+  """
+  Accept a request dictionary: "start" (first day), "flows" (daily
+  flows), and optional "peaks" (list of {"date", "value", "type"}),
+  "engine" and "interval" (minutes). Smooth it as spline() does. Return
+  the interval and the period-ending flows from start 0000 plus one
+  interval, before negative flows are set to 0; raise on a bad request.
+
+  """
+
+  flows = np.array(request["flows"], dtype=float)
+  if flows.size < 3 or not np.all(np.isfinite(flows)):
+    raise ValueError("flows must be at least three finite numbers")
+  interval = int(request.get("interval", 60))
+  engine = request.get("engine", "splrep")
+  core.check_interval(interval)
+  peaks = None
+  if request.get("peaks"):
+    peaks = core.peak_table(
+      [request_day(peak["date"]) for peak in request["peaks"]],
+      [float(peak["value"]) for peak in request["peaks"]],
+      [str(peak.get("type") or "2") for peak in request["peaks"]])
+
+  hydrograph, accumulation, first_hour = core.smooth_daily(
+    request_day(request["start"]), flows, peaks, engine = engine)
+  if interval == 60:
+    return interval, hydrograph[1:]
+  return interval, np.concatenate(list(core.hydrograph_chunks(accumulation,
+    first_hour, interval, engine = engine)))
+
+def smooth_requests(requests):
+  """
+  Accept a list of requests (see request_values). Only the transport
+  is batched: one worker task runs the whole batch, but each request is
+  smoothed (fit and cleaned) on its own, one after another, exactly as a
+  batch of one would be. Only the clipping and rounding of the batch's
+  flows is done in one pass. Return a list of dictionaries with the
+  start, interval and "flows" (negative flows written as 0), or an
+  "error", in request order.
+
+  """
+
+  results = []
+  for request in requests:
+    try:
+      results.append((request["start"],) + request_values(request))
+    except Exception as error:
+      results.append(f"{type(error).__name__}: {error}")
+
+  smoothed = [result for result in results if isinstance(result, tuple)]
+  if smoothed:
+    values = np.concatenate([result[2] for result in smoothed])
+    values = np.round(np.where(values >= 0, values, 0.), 2)
+    flows = iter(np.split(values,
+      np.cumsum([result[2].size for result in smoothed])[:-1]))
+  return [{"start": result[0], "interval": result[1],
+    "flows": next(flows).tolist()} if isinstance(result, tuple)
+    else {"error": result} for result in results]
+
+def smooth_request(request):
+  """
+  Accept a request dictionary (see request_values). Return its
+  smooth_requests result.
+
+  """
+
+  return smooth_requests([request])[0]
+
+def read_arrow_requests(data):
+  """
+  Accept an Arrow IPC stream of requests: one row per request, with the
+  request_values fields as columns ("flows" a list of doubles, "peaks"
+  a list of structs). Return the requests as dictionaries. Needs
+  pyarrow.
+
+  """
+
+  import pyarrow as pa
+  table = pa.ipc.open_stream(data).read_all()
+  return [{key: value for key, value in row.items() if value is not None}
+    for row in table.to_pylist()]
+
+def write_arrow_results(results):
+  """
+  Accept a list of smooth_requests results. Return them as an Arrow IPC
+  stream with columns start, interval, flows (a list of doubles) and
+  error, one row per result and null where a result has no such field.
+  Needs pyarrow.
+
+  """
+
+  import pyarrow as pa
+  schema = pa.schema([("start", pa.string()), ("interval", pa.int32()),
+    ("flows", pa.list_(pa.float64())), ("error", pa.string())])
+  table = pa.Table.from_pylist([{name: result.get(name)
+    for name in schema.names} for result in results], schema = schema)
+  sink = pa.BufferOutputStream()
+  with pa.ipc.new_stream(sink, schema) as writer:
+    writer.write_table(table)
+  return sink.getvalue().to_pybytes()
+
+def warm_worker():
+  """
+  Run a small request in a new worker so its imports (and any JIT
+  compilation) are done before the first real request.
+
+  """
+
+  smooth_request({"start": "01Oct2000", "flows": [1., 5., 2., 1., 0.]})
+
+class Metrics(object):
+  """
+  Thread-safe request, error, batch and latency counters.
+
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = time.time()
+    self.requests = 0
+    self.errors = 0
+    self.batches = 0
+    self.batched_requests = 0
+    self.latencies = collections.deque(maxlen = LATENCY_WINDOW)
+    self.finished = collections.deque(maxlen = LATENCY_WINDOW)
+
+  def record_request(self, seconds, error):
+    with self.lock:
+      self.requests += 1
+      self.errors += bool(error)
+      self.latencies.append(seconds)
+      self.finished.append(time.time())
+
+  def record_batch(self, size):
+    with self.lock:
+      self.batches += 1
+      self.batched_requests += size
+
+  def report(self):
+    """
+    Return the counters, latency percentiles (ms) over the last
+    LATENCY_WINDOW requests and throughput (requests/s) since start and
+    over those requests.
+
+    """
+
+    with self.lock:
+      now = time.time()
+      latencies = np.array(self.latencies)*1000
+      report = {
+        "uptime_s": now - self.started,
+        "requests": self.requests,
+        "errors": self.errors,
+        "batches": self.batches,
+        "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.,
+        "throughput_rps": self.requests / (now - self.started),
+      }
+      if latencies.size:
+        report.update({
+          "latency_p50_ms": float(np.percentile(latencies, 50)),
+          "latency_p95_ms": float(np.percentile(latencies, 95)),
+          "latency_p99_ms": float(np.percentile(latencies, 99)),
+          "latency_max_ms": float(latencies.max()),
+        })
+      if len(self.finished) > 1 and self.finished[-1] > self.finished[0]:
+        report["recent_throughput_rps"] = (len(self.finished) - 1) / \
+          (self.finished[-1] - self.finished[0])
+    return report
+
+def start_pool(workers):
+  """
+  Accept the number of worker processes. Start a process pool and run
+  warm_worker in each worker before returning the pool.
+
+  """
+
+  executor = ProcessPoolExecutor(max_workers = workers,
+    initializer = warm_worker)
+  # Start every worker now rather than on the first requests
+  for future in [executor.submit(time.sleep, 0.1) for i in range(workers)]:
+    future.result()
+  return executor
+
+class Batcher(object):
+  """
+  Collect concurrent requests into batches of up to max_batch, waiting
+  at most batch_wait seconds for more, and smooth each batch as one task
+  on a pool from start_pool(workers); the requests in a batch are still
+  fit one at a time (see smooth_requests). A pool that breaks (e.g. a worker
+  killed for running out of memory) fails the batches it was running
+  and is replaced by a new one.
+
+  """
+
+  def __init__(self, workers, metrics, max_batch = MAX_BATCH,
+    batch_wait = BATCH_WAIT):
+    self.workers = workers
+    self.executor = start_pool(workers)
+    self.metrics = metrics
+    self.max_batch = max_batch
+    self.batch_wait = batch_wait
+    self.closed = False
+    self.pending = queue.Queue()
+    self.thread = threading.Thread(target = self.run, daemon = True)
+    self.thread.start()
+
+  def close(self):
+    """
+    Stop accepting batches and shut down the worker pool.
+
+    """
+
+    self.closed = True
+    self.executor.shutdown()
+
+  def submit(self, request):
+    """
+    Accept a request. Return a Future for its result.
+
+    """
+
+    future = Future()
+    self.pending.put((request, future))
+    return future
+
+  def run(self):
+    while True:
+      batch = [self.pending.get()]
+      deadline = time.monotonic() + self.batch_wait
+      while len(batch) < self.max_batch:
+        try:
+          batch.append(self.pending.get(timeout = max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+          break
+      self.metrics.record_batch(len(batch))
+      try:
+        task = self.submit_batch(batch)
+      except Exception as error:
+        self.fail(batch, error)
+        continue
+      task.add_done_callback(lambda task, batch = batch: self.finish(task, batch))
+
+  def submit_batch(self, batch):
+    """
+    Accept a batch of (request, future) pairs. Submit it to the pool,
+    first replacing the pool if it is broken. Return the task Future.
+
+    """
+
+    requests = [request for request, future in batch]
+    try:
+      return self.executor.submit(smooth_requests, requests)
+    except (BrokenProcessPool, RuntimeError):
+      if self.closed:
+        raise
+    print ("Worker pool broken; starting a new one")
+    self.executor.shutdown(wait = False)
+    self.executor = start_pool(self.workers)
+    return self.executor.submit(smooth_requests, requests)
+
+  def fail(self, batch, error):
+    for request, future in batch:
+      future.set_result({"error": f"{type(error).__name__}: {error}"})
+
+  def finish(self, task, batch):
+    try:
+      results = task.result()
+    except Exception as error:
+      self.fail(batch, error)
+      return
+    for (request, future), result in zip(batch, results):
+      future.set_result(result)
+
+class SmoothingHandler(BaseHTTPRequestHandler):
+  """
+  POST /smooth with a request (or a list of requests) as JSON returns
+  the result (or list of results); with an Arrow IPC stream body (see
+  read_arrow_requests) it returns an Arrow stream of results. GET
+  /metrics and GET /health report on the service.
+
+  """
+
+  def do_GET(self):
+    if self.path == "/metrics":
+      self.send_json(200, self.server.metrics.report())
+    elif self.path == "/health":
+      if self.server.batcher.thread.is_alive():
+        self.send_json(200, {"status": "ok"})
+      else:
+        self.send_json(503, {"status": "batcher stopped"})
+    else:
+      self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+  def do_POST(self):
+    if self.path != "/smooth":
+      self.send_json(404, {"error": f"Unknown path {self.path}"})
+      return
+    start_timer = time.perf_counter()
+    data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+    arrow = self.headers.get("Content-Type", "").startswith(ARROW_TYPE)
+    try:
+      body = read_arrow_requests(data) if arrow else json.loads(data)
+    except ImportError:
+      self.send_json(415, {"error": "Arrow requests need pyarrow"})
+      return
+    except Exception as error:
+      self.send_json(400, {"error": f"Invalid {'Arrow' if arrow else 'JSON'}: {error}"})
+      return
+    requests = body if isinstance(body, list) else [body]
+    futures = [self.server.batcher.submit(request) for request in requests]
+    results = [future.result() for future in futures]
+    seconds = time.perf_counter() - start_timer
+    for result in results:
+      self.server.metrics.record_request(seconds, "error" in result)
+    if arrow:
+      self.send_data(200, write_arrow_results(results), ARROW_TYPE)
+    else:
+      self.send_json(200, results if isinstance(body, list) else results[0])
+
+  def send_json(self, status, content):
+    self.send_data(status, json.dumps(content).encode(), "application/json")
+
+  def send_data(self, status, data, content_type):
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def address_string(self):
+    return str(self.client_address[0]) if self.client_address else "unix"
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+def make_server(port = 8765, socket_path = None, workers = None,
+  max_batch = MAX_BATCH, batch_wait = BATCH_WAIT, verbose = False):
+  """
+  Accept a localhost port (or a Unix socket path), the number of worker
+  processes (defaults to the CPU count) and batching settings. Start a
+  warm worker pool and return the (not yet serving) server; call
+  serve_forever() on it and shutdown_server() when done.
+
+  """
+
+  if socket_path:
+    if os.path.exists(socket_path):
+      os.remove(socket_path)
+    server = UnixHTTPServer(socket_path, SmoothingHandler)
+  else:
+    server = ThreadingHTTPServer(("127.0.0.1", port), SmoothingHandler)
+  server.verbose = verbose
+  server.metrics = Metrics()
+  server.batcher = Batcher(workers or os.cpu_count(), server.metrics,
+    max_batch, batch_wait)
+  return server
+
+def shutdown_server(server):
+  """
+  Accept a server from make_server. Stop serving and shut down its
+  worker pool.
+
+  """
+
+  server.shutdown()
+  server.server_close()
+  server.batcher.close()
+
+def smooth_remote(start, flows, peaks = None, engine = "splrep",
+  interval = 60, url = "http://127.0.0.1:8765"):
+  """
+  Accept the first day, daily flows and (optional) peaks, engine and
+  interval as for smooth_request, and the service URL. Post the request.
+  Return the result dictionary.
+
+  """
+
+  request = {"start": start, "flows": [float(flow) for flow in flows],
+    "engine": engine, "interval": interval}
+  if peaks:
+    request["peaks"] = peaks
+  http_request = urllib.request.Request(url + "/smooth",
+    data = json.dumps(request).encode(),
+    headers = {"Content-Type": "application/json"})
+  with urllib.request.urlopen(http_request) as response:
+    return json.loads(response.read())
+
+def smooth_remote_arrow(table, url = "http://127.0.0.1:8765"):
+  """
+  Accept a pyarrow Table of requests (see read_arrow_requests) and the
+  service URL. Post it as an Arrow stream. Return the results as a
+  pyarrow Table (see write_arrow_results).
+
+  """
+
+  import pyarrow as pa
+  sink = pa.BufferOutputStream()
+  with pa.ipc.new_stream(sink, table.schema) as writer:
+    writer.write_table(table)
+  http_request = urllib.request.Request(url + "/smooth",
+    data = sink.getvalue().to_pybytes(), headers = {"Content-Type": ARROW_TYPE})
+  with urllib.request.urlopen(http_request) as response:
+    return pa.ipc.open_stream(response.read()).read_all()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description =
+    "Serve the smoother on localhost with a warm worker pool.")
+  parser.add_argument("--port", type = int, default = 8765)
+  parser.add_argument("--socket", help = "serve on this Unix socket instead")
+  parser.add_argument("--workers", type = int, help = "worker processes")
+  parser.add_argument("--max-batch", type = int, default = MAX_BATCH)
+  parser.add_argument("--batch-wait", type = float, default = BATCH_WAIT,
+    help = "seconds to wait for more requests to batch")
+  parser.add_argument("--verbose", action = "store_true", help = "log requests")
+  args = parser.parse_args()
+
+  server = make_server(args.port, args.socket, args.workers, args.max_batch,
+    args.batch_wait, args.verbose)
+  print (f"Serving on {args.socket or f'http://127.0.0.1:{args.port}'}")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    shutdown_server(server)
@@ -0,0 +1,106 @@
+import numpy as np
+
+from CVHSSmoothing.Spline import MISSING, check_interval, epart_interval
+from CVHSSmoothing.segments import read_daily_record
+
+def daily_volume_errors(daily_flows, hourly_flows, per_day = 24):
+  """
+  Accept daily average flows, period-ending flows starting with the
+  period ending one interval after 0000 of the first day, and the number
+  of periods per day (24 for hourly). Reshape the flows to (days,
+  per_day) and return the difference between each day's mean flow and
+  its daily flow. Days without a full set of periods are dropped.
+
+  """
+
+  days = min(np.size(daily_flows), np.size(hourly_flows) // per_day)
+  daily_means = np.reshape(hourly_flows[:days*per_day], 
+    (days, per_day)).mean(axis=1)
+  return daily_means - daily_flows[:days]
+
+def volume_report(days, daily_flows, hourly_flows, worst = 5, per_day = 24):
+  """
+  Accept the daily PeriodIndex, daily average flows and flows as for
+  daily_volume_errors. Return a dictionary with the number of days
+  compared, the maximum and mean absolute daily error (cfs), the
+  relative error in total volume and the worst days. Days with missing
+  input or output are skipped.
+
+  """
+
+  errors = daily_volume_errors(daily_flows, hourly_flows, per_day)
+  abs_errors = np.abs(errors)
+  valid = ~np.isnan(abs_errors)
+  compared = int(valid.sum())
+  if compared == 0:
+    return {"days": 0, "max_error": None, "mean_error": None,
+      "volume_error": None, "worst_days": []}
+
+  ranked = np.where(valid, abs_errors, -1.)
+  worst_idx = np.argsort(ranked)[::-1][:min(worst, compared)]
+  total_volume = np.sum(daily_flows[:errors.size][valid])
+
+  return {
+    "days": compared,
+    "max_error": float(abs_errors[valid].max()),
+    "mean_error": float(abs_errors[valid].mean()),
+    "volume_error": float(np.sum(errors[valid]) / total_volume)
+      if total_volume else 0.,
+    "worst_days": [{"date": str(days[i]), "input": float(daily_flows[i]),
+      "output": float(daily_flows[i] + errors[i]), "error": float(errors[i])}
+      for i in worst_idx],
+  }
+
+def validate_hydrograph(days, daily_flows, hourly_hydrograph, clip = True,
+  worst = 5, interval = 60):
+  """
+  Accept the daily PeriodIndex and flows of the input and the hydrograph
+  returned by the smoothing functions (first value at 0000 of the first
+  day) with its interval in minutes. Negative flows are clipped to zero,
+  as they are when written, unless clip is False. Return
+  volume_report().
+
+  """
+
+  hourly_flows = np.asarray(hourly_hydrograph, dtype=float)[1:]
+  if clip:
+    hourly_flows = np.where(hourly_flows < 0, 0., hourly_flows)
+  return volume_report(days, np.asarray(daily_flows, dtype=float),
+    hourly_flows, worst, 24*check_interval(interval))
+
+def read_output_values(output_file_name):
+  """
+  Accept the name of a dssts output file written by spline(). Return the
+  values as an array, with missing values as NaN, and the interval in 
+  minutes from the pathname E-part.
+
+  """
+
+  with open(output_file_name, "r") as output_file:
+    lines = output_file.read().split("\n")
+  interval = epart_interval(lines[0].split("/")[5])
+  values = np.array(lines[4:-2], dtype=float)
+  values[values == MISSING] = np.nan
+  return values, interval
+
+def validate_output_file(output_file_name, daily_flow_filename, worst = 5,
+  hydrograph = None):
+  """
+  Accept the output file name, the daily timeseries input filename
+  it was smoothed from and (optional) the hourly hydrograph spline()
+  returned for it. Compare the written values with the daily input.
+  Return volume_report(); given the hydrograph, its unclipped
+  validate_hydrograph() report is added as "unclipped", so errors of the
+  smoothing itself can be told from those of clipping negative flows to
+  0 when writing.
+
+  """
+
+  timeseries_info, days, daily_flows = read_daily_record(daily_flow_filename)
+  values, interval = read_output_values(output_file_name)
+  report = volume_report(days, daily_flows, values, worst, 
+    24*check_interval(interval))
+  if hydrograph is not None:
+    report["unclipped"] = validate_hydrograph(days, daily_flows, hydrograph,
+      False, worst)
+  return report
@@ -0,0 +1,194 @@
+import argparse
+import os
+import time
+
+from CVHSSmoothing.batch import read_journal, run_batch
+from CVHSSmoothing.dss_writer import DssWriter
+
+# Seconds between directory scans, and of quiet after the last change
+# before the affected gauges are smoothed
+POLL_INTERVAL = 2.
+DEBOUNCE = 5.
+
+def snapshot(directories, suffix = ".txt"):
+  """
+  Accept directories. Return a dictionary of the path of every file
+  ending in suffix below them to its (modification time, size).
+
+  """
+
+  files = {}
+  for directory in directories:
+    for root, dirs, names in os.walk(directory):
+      for name in names:
+        if name.endswith(suffix):
+          path = os.path.join(root, name)
+          try:
+            stat = os.stat(path)
+          except FileNotFoundError:
+            continue
+          files[path] = (stat.st_mtime_ns, stat.st_size)
+  return files
+
+def changed_files(before, after):
+  """
+  Accept two snapshots. Return the set of paths added, removed or
+  modified between them.
+
+  """
+
+  return {path for path in before.keys() | after.keys()
+    if before.get(path) != after.get(path)}
+
+def discover_jobs(daily_dir, peaks_dir, output_dir):
+  """
+  Accept the daily input, peaks and output directories. Pair every daily
+  timeseries file with the peaks file of the same name (anywhere below
+  peaks_dir), if there is one, and an output file at the same relative
+  path below output_dir with a .out extension. Return run_batch jobs.
+
+  """
+
+  peaks_files = {os.path.basename(path): path
+    for path in sorted(snapshot([peaks_dir]))} if peaks_dir else {}
+  jobs = []
+  for path in sorted(snapshot([daily_dir])):
+    relative = os.path.splitext(os.path.relpath(path, daily_dir))[0]
+    jobs.append((path, os.path.join(output_dir, relative + ".out"),
+      peaks_files.get(os.path.basename(path), False)))
+  return jobs
+
+def dependencies(jobs):
+  """
+  Accept run_batch jobs. Return a dictionary of each input file (daily
+  or peaks) to the outputs that depend on it.
+
+  """
+
+  depends = {}
+  for job in jobs:
+    for path in job[0], job[2]:
+      if path:
+        depends.setdefault(path, set()).add(job[1])
+  return depends
+
+def affected_jobs(jobs, changed, previous_jobs = ()):
+  """
+  Accept the current jobs, the changed paths and the jobs before the
+  change. Return the current jobs whose daily or peaks file changed,
+  including gauges whose peaks file was added or removed.
+
+  """
+
+  outputs = set()
+  for depends in dependencies(jobs), dependencies(previous_jobs):
+    for path in changed:
+      outputs |= depends.get(path, set())
+  previous = {job[1]: job for job in previous_jobs}
+  outputs |= {job[1] for job in jobs if previous.get(job[1], job) != job}
+  return [job for job in jobs if job[1] in outputs]
+
+def smooth_jobs(jobs, journal_file_name, workers = 1, out_dss = None,
+  backend = "dss", options = None):
+  """
+  Accept jobs, the journal file name, number of worker processes,
+  (optional) output DSS file and backend, and spline() keyword arguments
+  for every job. Smooth the jobs with run_batch, which skips unchanged
+  gauges, and write the records of the outputs that were rewritten to
+  out_dss. Return the rewritten output files.
+
+  """
+
+  if options:
+    jobs = [job[:3] + (options,) for job in jobs]
+  before = read_journal(journal_file_name)["completed"]
+  journal = run_batch(jobs, journal_file_name, workers = workers)
+  written = [job[1] for job in jobs if job[1] in journal["completed"] and
+    journal["completed"][job[1]] != before.get(job[1])]
+  if out_dss and written:
+    with DssWriter(backend) as writer:
+      for output_file_name in written:
+        writer.queue(output_file_name, out_dss)
+  return written
+
+def watch(daily_dir, peaks_dir, output_dir, journal_file_name = None,
+  workers = 1, out_dss = None, backend = "dss", options = None,
+  poll_interval = POLL_INTERVAL, debounce = DEBOUNCE, max_cycles = None):
+  """
+  Accept the daily input, peaks and output directories, (optional)
+  journal file name (defaults to watch_journal.json in output_dir),
+  number of worker processes, output DSS file and backend, and spline()
+  keyword arguments. Bring every gauge up to date, then poll the input
+  directories every poll_interval seconds. Once no file has changed for
+  debounce seconds, re-smooth only the gauges whose daily or peaks file
+  changed. Outputs are written atomically by spline() and their DSS
+  records once they are finished. Stop after max_cycles smoothing
+  cycles, if given (otherwise on KeyboardInterrupt). Return the outputs
+  written by the last cycle.
+
+  """
+
+  if journal_file_name is None:
+    journal_file_name = os.path.join(output_dir, "watch_journal.json")
+  os.makedirs(output_dir, exist_ok = True)
+  directories = [directory for directory in (daily_dir, peaks_dir) if directory]
+
+  def prepare(jobs):
+    for job in jobs:
+      os.makedirs(os.path.dirname(job[1]) or ".", exist_ok = True)
+    return jobs
+
+  jobs = prepare(discover_jobs(daily_dir, peaks_dir, output_dir))
+  files = snapshot(directories)
+  print (f"Watching {len(jobs)} gauges in {', '.join(directories)}")
+  written = smooth_jobs(jobs, journal_file_name, workers, out_dss, backend,
+    options)
+  cycles = 1
+  changed, last_change = set(), None
+
+  try:
+    while max_cycles is None or cycles < max_cycles:
+      time.sleep(poll_interval)
+      current = snapshot(directories)
+      if current != files:
+        changed |= changed_files(files, current)
+        files, last_change = current, time.monotonic()
+        continue
+      if not changed or time.monotonic() - last_change < debounce:
+        continue
+
+      previous_jobs = jobs
+      jobs = prepare(discover_jobs(daily_dir, peaks_dir, output_dir))
+      affected = affected_jobs(jobs, changed, previous_jobs)
+      print (f"{len(changed)} files changed; smoothing {len(affected)} gauges")
+      changed = set()
+      written = smooth_jobs(affected, journal_file_name, workers, out_dss,
+        backend, options)
+      cycles += 1
+  except KeyboardInterrupt:
+    pass
+
+  return written
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description =
+    "Re-smooth gauges whenever their daily or peaks files change.")
+  parser.add_argument("--daily-dir", default = "USBC_1DAY")
+  parser.add_argument("--peaks-dir", default = "USBC_PEAKS")
+  parser.add_argument("--output-dir", default = "OUTFILES")
+  parser.add_argument("--journal", help = "progress journal file")
+  parser.add_argument("--workers", type = int, default = 1)
+  parser.add_argument("--dss", help = "also write the records to this DSS file")
+  parser.add_argument("--backend", default = "dss",
+    help = "DSS writer backend (see dss_writer.py)")
+  parser.add_argument("--engine", help = "interpolation engine")
+  parser.add_argument("--poll-interval", type = float, default = POLL_INTERVAL)
+  parser.add_argument("--debounce", type = float, default = DEBOUNCE)
+  parser.add_argument("--once", action = "store_true",
+    help = "bring every gauge up to date and exit")
+  args = parser.parse_args()
+
+  watch(args.daily_dir, args.peaks_dir, args.output_dir, args.journal,
+    args.workers, args.dss, args.backend,
+    {"engine": args.engine} if args.engine else None, args.poll_interval,
+    args.debounce, 1 if args.once else None)
@@ -21,6 +21,8 @@ setup(
  license='MIT',
  version=myVersion,
  install_requires = ['numpy','pandas','scipy'],
+ extras_require = {'jit': ['numba'], 'netcdf': ['xarray', 'netCDF4'],
+  'zarr': ['xarray', 'netCDF4', 'zarr>=2.11,<3']},
  classifiers=[
     "Development Status :: 4 - Beta",
     'Intended Audience :: Developers',
@@ -0,0 +1,28 @@
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEER = os.path.join(ROOT, "USBC_1DAY", "Yuba-Feather", "WCM_Update", "DEER.txt")
+DEER_CREEK = os.path.join(ROOT, "USBC_1DAY", "Yuba-Feather", "CVHS",
+  "DEER_CR_NR_SMARTVILLE.txt")
+DEER_CREEK_PEAKS = os.path.join(ROOT, "USBC_PEAKS", "DEER_CR_NR_SMARTVILLE.txt")
+
+@pytest.fixture
+def excerpt(tmp_path):
+  """
+  Return a function that accepts a daily timeseries input filename, the
+  number of days to keep, (optional) first day and file name, writes
+  that excerpt of the record (with its header) below tmp_path and
+  returns its path.
+
+  """
+
+  def write(daily_flow_filename, days, first_day = 0, name = "gauge.txt"):
+    with open(daily_flow_filename, "r") as daily_flow_file:
+      lines = daily_flow_file.readlines()
+    path = tmp_path / name
+    path.parent.mkdir(parents = True, exist_ok = True)
+    path.write_text("".join(lines[:7] + lines[7 + first_day:7 + first_day + days]))
+    return str(path)
+
+  return write
@@ -0,0 +1,88 @@
+import json
+import numpy as np
+import pytest
+
+from CVHSSmoothing.batch import file_hash, read_journal, run_batch
+from CVHSSmoothing.Spline import spline
+from conftest import DEER
+
+def corrupting_spline(daily_flow_filename, location, peaks_file_name = False,
+  **options):
+  """
+  Write the output with spline(); for outputs named bad*, then clobber
+  a line in the middle, as a damaged copy would.
+
+  """
+
+  spline(daily_flow_filename, location, peaks_file_name, **options)
+  if "bad" in location:
+    with open(location, "r") as output_file:
+      lines = output_file.readlines()
+    with open(location, "w") as output_file:
+      output_file.writelines(lines[:len(lines)//2] + ["\0\0\0\n"] +
+        lines[len(lines)//2 + 1:])
+
+def test_completed_jobs_are_skipped(excerpt, tmp_path):
+  daily = excerpt(DEER, 400, 100)
+  output = str(tmp_path / "gauge.out")
+  journal_file_name = str(tmp_path / "journal.json")
+
+  journal = run_batch([(daily, output, False)], journal_file_name)
+  entry = journal["completed"][output]
+  assert entry["output"] == file_hash(output)
+  assert entry["inputs"]["daily"] == file_hash(daily)
+  assert entry["volume"]["max_error"] < 1.
+
+  run_batch([(daily, output, False)], journal_file_name,
+    smoother = pytest.fail)
+  assert read_journal(journal_file_name)["completed"][output] == entry
+
+def test_failed_job_is_retried_once_its_input_changes(excerpt, tmp_path):
+  daily = excerpt(DEER, 400, 100)
+  with open(daily, "r") as daily_file:
+    lines = daily_file.readlines()
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines[:4])
+  output = str(tmp_path / "gauge.out")
+  journal_file_name = str(tmp_path / "journal.json")
+
+  for attempt in range(3):
+    journal = run_batch([(daily, output, False)], journal_file_name,
+      max_attempts = 2)
+  assert journal["failed"][output]["attempts"] == 2
+  assert journal["failed"][output]["inputs"]["daily"] == file_hash(daily)
+
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines)
+  journal = run_batch([(daily, output, False)], journal_file_name,
+    max_attempts = 2)
+  assert output in journal["completed"]
+  assert output not in journal["failed"]
+
+def test_validation_error_is_recorded_as_failure(excerpt, tmp_path):
+  good = excerpt(DEER, 400, 100, "good.txt")
+  bad = excerpt(DEER, 400, 100, "bad.txt")
+  jobs = [(bad, str(tmp_path / "bad.out"), False),
+    (good, str(tmp_path / "good.out"), False)]
+  journal_file_name = str(tmp_path / "journal.json")
+
+  run_batch(jobs, journal_file_name, smoother = corrupting_spline)
+  journal = read_journal(journal_file_name)
+  assert journal["failed"][jobs[0][1]]["attempts"] == 1
+  assert jobs[1][1] in journal["completed"]
+
+def test_options_are_stored_as_json(excerpt, tmp_path):
+  daily = excerpt(DEER, 400, 100)
+  output = str(tmp_path / "gauge.out")
+  journal_file_name = str(tmp_path / "journal.json")
+
+  with pytest.raises(TypeError):
+    run_batch([(daily, output, False, {"engine": lambda x, y: None})],
+      journal_file_name)
+  assert not (tmp_path / "gauge.out").exists()
+
+  run_batch([(daily, output, False, {"dtype": np.float32})], journal_file_name)
+  with open(journal_file_name, "r") as f:
+    assert json.load(f)["completed"][output]["options"] == {"dtype": "float32"}
+  run_batch([(daily, output, False, {"dtype": np.float32})], journal_file_name,
+    smoother = pytest.fail)
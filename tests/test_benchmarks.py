@@ -0,0 +1,73 @@
+import copy
+import json
+import pytest
+
+from CVHSSmoothing import benchmarks
+
+@pytest.fixture(scope = "module")
+def results():
+  """
+  Return run_benchmarks results for the read_peaks case, the one quick
+  enough to rerun in the test suite.
+
+  """
+
+  return benchmarks.run_benchmarks(["read_peaks"], repeat = 1)
+
+def statuses(report):
+  return dict(zip(report.check, report.status))
+
+def test_baseline_case_passes(results):
+  baseline = benchmarks.read_baseline()
+  assert set(benchmarks.BENCHMARK_CASES) <= set(baseline["cases"])
+  report = benchmarks.compare_results(results, baseline)
+  assert report.case.unique().tolist() == ["read_peaks"]
+  assert set(report.status) == {"ok"}
+  assert results["cases"]["read_peaks"]["output"] == \
+    baseline["cases"]["read_peaks"]["output"]
+  assert benchmarks.format_report(report, baseline, results).endswith(
+    "All 1 cases within thresholds")
+
+def test_regressions_fail(results):
+  baseline = copy.deepcopy(benchmarks.read_baseline())
+  stored = baseline["cases"]["read_peaks"]
+  stored["seconds"] /= 1000
+  stored["memory_mb"] += 10
+  result = copy.deepcopy(results)
+  result["cases"]["read_peaks"]["seconds"] += 1
+  result["cases"]["read_peaks"]["output"]["max"] += 1
+  report = statuses(benchmarks.compare_results(result, baseline))
+  assert report["seconds"] == "FAIL" and report["output max"] == "FAIL"
+  assert report["memory_mb"] == "ok" and report["output min"] == "ok"
+
+  # A drift within tolerance changes only the checksum
+  stored = copy.deepcopy(results)["cases"]["read_peaks"]
+  stored["output"]["sum"] += 1e-9
+  stored["output"]["sha256"] = "0"*64
+  report = statuses(benchmarks.compare_results(results,
+    {"cases": {"read_peaks": stored}}))
+  assert report["output sum"] == "ok"
+  assert report["output sha256"] == "changed"
+
+  assert benchmarks.compare_results(results, {"cases": {}}).status.tolist() \
+    == ["new"]
+
+def test_main_exit_status(tmp_path):
+  baseline_file = str(tmp_path / "baseline.json")
+  arguments = ["--cases", "read_peaks", "--repeat", "1", "--baseline",
+    baseline_file]
+  assert benchmarks.main(arguments) == 0
+  assert benchmarks.main(arguments) == 0
+
+  with open(baseline_file, "r") as f:
+    baseline = json.load(f)
+  baseline["cases"]["read_peaks"]["output"]["values"] += 1
+  baseline["cases"]["other"] = {"seconds": 1.}
+  with open(baseline_file, "w") as f:
+    json.dump(baseline, f)
+  assert benchmarks.main(arguments) == 1
+
+  assert benchmarks.main(arguments + ["--update"]) == 0
+  stored = benchmarks.read_baseline(baseline_file)["cases"]
+  assert stored["other"] == {"seconds": 1.}
+  assert benchmarks.main(arguments) == 0
@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pytest
+
+from CVHSSmoothing.catalog import Catalog, minute_ordinal, read_output_header
+from CVHSSmoothing.Spline import spline
+from CVHSSmoothing.validation import read_output_values
+from conftest import DEER
+
+INFO = {"apart": "A", "bpart": "B", "cpart": "FLOW", "epart": "1HOUR",
+  "fpart": "SYNTHETIC", "units": "CFS", "type": "PER-AVER"}
+
+def append_gauge(directory, gauge, size):
+  with Catalog(directory) as catalog:
+    return catalog.append(gauge, INFO, minute_ordinal("01Jan2000 0100"), 60,
+      np.arange(size, dtype=float) + 1000*int(gauge[1:]))
+
+@pytest.mark.parametrize("interval", [60, 15])
+def test_read_matches_output_file(excerpt, tmp_path, interval):
+  daily = excerpt(DEER, 200, 100)
+  output = str(tmp_path / "DEER.out")
+  hydrograph = spline(daily, output, False, interval)
+  values, file_interval = read_output_values(output)
+  info, first_end = read_output_header(output)
+
+  with Catalog(str(tmp_path / "catalog")) as catalog:
+    catalog.add_output(output)
+    series = catalog.read("DEER")
+  np.testing.assert_array_equal(series.to_numpy(), values)
+  assert series.index[0].to_timestamp() == pd.Timestamp(first_end*60, unit = "s")
+  assert series.index[1] - series.index[0] == series.index.freq
+  if interval == 60:
+    # spline() returns the same period-ending labels, after its leading 0
+    returned = hydrograph.iloc[1:1 + values.size]
+    assert series.index.equals(returned.index)
+    np.testing.assert_allclose(series.to_numpy(), np.round(np.where(
+      returned > 0, returned, 0.), 2), atol = 0.005)
+
+def test_read_date_range(excerpt, tmp_path):
+  daily = excerpt(DEER, 200, 100)
+  output = str(tmp_path / "DEER.out")
+  spline(daily, output)
+  with Catalog(str(tmp_path / "catalog")) as catalog:
+    catalog.add_output(output)
+    whole = catalog.read("DEER")
+    day = catalog.read("DEER", "2006-02-01", "2006-02-01")
+  assert len(day) == 24
+  assert str(day.index[0]) == "2006-02-01 01:00"
+  assert str(day.index[-1]) == "2006-02-02 00:00"
+  pd.testing.assert_series_equal(day, whole.loc[day.index])
+
+def test_concurrent_appends_and_compact(tmp_path):
+  directory = str(tmp_path / "catalog")
+  gauges = [f"G{i}" for i in range(8)]
+  with ProcessPoolExecutor(max_workers = 4) as executor:
+    list(executor.map(append_gauge, [directory]*8, gauges, [100 + i for i in range(8)]))
+  append_gauge(directory, "G3", 50)
+
+  with Catalog(directory) as catalog:
+    assert sorted(catalog.records().gauge) == gauges
+    assert catalog.compact() == sum(100 + i for i in range(8) if i != 3) + 50
+    for i, gauge in enumerate(gauges):
+      series = catalog.read(gauge)
+      size = 50 if gauge == "G3" else 100 + i
+      np.testing.assert_array_equal(series.to_numpy(),
+        np.arange(size) + 1000*i)
+      assert str(series.index[0]) == "2000-01-01 01:00"
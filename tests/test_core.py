@@ -0,0 +1,154 @@
+import io
+import numpy as np
+import pytest
+
+from CVHSSmoothing import core
+from conftest import DEER_CREEK
+
+@pytest.fixture(scope = "module")
+def knots():
+  """
+  Return the knot hours and values, first hour and number of hours of
+  ten years of Deer Creek.
+
+  """
+
+  with open(DEER_CREEK, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7 + 20000:7 + 23650]
+  knot_days, flows = core.read_daily_lines(lines, "", io.StringIO())
+  daily_accumulation, hours, values, first_hour, size = core.build_knots(
+    knot_days, flows)
+  return hours, values, first_hour, size
+
+def test_rebased_knots_match_hourly_rebasing(knots):
+  hours, values, first_hour, size = knots
+  accumulation = core.knot_accumulation(hours, values, size)
+  offsets, local = core.rebase_accumulation(accumulation)
+  knot_offsets, knot_local = core.rebase_knots(hours, values, size)
+  np.testing.assert_array_equal(knot_offsets, offsets)
+  np.testing.assert_array_equal(knot_local, local[hours])
+
+  hydrograph = core.clean_rebased_flows(offsets, local, first_hour,
+    verbose = False)
+  knot_hydrograph, clean_hours, clean_local = core.clean_rebased_knot_flows(
+    knot_offsets, hours, knot_local, first_hour, size, verbose = False)
+  np.testing.assert_array_equal(knot_hydrograph, hydrograph)
+  np.testing.assert_array_equal(clean_hours, core.select_knots(local))
+  np.testing.assert_array_equal(core.restore_knots(knot_offsets, clean_hours,
+    clean_local), core.restore_accumulation(offsets, local)[clean_hours])
+
+def test_block_fits_match_whole_record_fit(knots):
+  hours, values, first_hour, size = knots
+  offsets, local = core.rebase_knots(hours, values, size, np.float64)
+  np.testing.assert_allclose(core.rebased_knot_hydrograph(offsets, hours,
+    local, first_hour, size), core.knot_hydrograph(hours, values, first_hour,
+    size), atol = 1e-5)
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_rebased_cleaning_keeps_daily_volumes(knots, dtype):
+  hours, values, first_hour, size = knots
+  offsets, local = core.rebase_knots(hours, values, size, dtype)
+  hydrograph, clean_hours, clean_local = core.clean_rebased_knot_flows(
+    offsets, hours, local, first_hour, size, verbose = False)
+  default = core.clean_knot_flows(hours, values, first_hour, size,
+    verbose = False)[0]
+  days = (size - 1) // 24
+  np.testing.assert_allclose(hydrograph[1:1 + 24*days].reshape(days, 24).sum(1),
+    default[1:1 + 24*days].reshape(days, 24).sum(1), atol = 0.05)
+  assert hydrograph.dtype == dtype
+
+def test_block_parse_matches_line_parse():
+  with open(DEER_CREEK, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7:]
+  days, flows = core.parse_daily_block(lines)
+  assert days.tolist() == [core.day_ordinal(line.split()[1]) for line in lines]
+  assert flows.tolist() == [float(line.split()[2]) for line in lines]
+
+  knot_days, knot_flows = core.read_daily_lines(lines, "", io.StringIO())
+  np.testing.assert_array_equal(knot_days[1:], days + 1)
+  assert knot_days[0] == days[0] and knot_flows[0] == 0
+
+@pytest.mark.parametrize("line", ["9\t31Feb2000\t3\n", "9\t01Jan2000\tabc\n",
+  "9\t01Jan2000\n", "9\t01Jan2000\t1.2.3\n"])
+def test_unreadable_lines_are_logged(line):
+  with open(DEER_CREEK, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7:12] + [line]
+  assert core.parse_daily_block(lines) is None
+  log = io.StringIO()
+  knot_days, flows = core.read_daily_lines(lines, "GAUGE", log)
+  assert log.getvalue() == "Error: GAUGE \t line: %s" % line
+  assert flows[-1] == 0.
+
+def test_inserted_knots_match_array_assignment():
+  rng = np.random.default_rng(45)
+  hours = np.sort(rng.choice(1000, 50, replace = False)).astype(np.int64)
+  values = rng.random(50)
+  new_hours = np.concatenate((rng.choice(1000, 30), hours[:5], [hours[0]]))
+  new_values = rng.random(new_hours.size)
+
+  accumulation = core.knot_accumulation(hours, values, 1000)
+  accumulation[new_hours] = new_values
+  knot_hours, knot_values = core.insert_knots(hours, values, new_hours,
+    new_values)
+  np.testing.assert_array_equal(knot_hours, core.select_knots(accumulation))
+  np.testing.assert_array_equal(knot_values, accumulation[knot_hours])
+  assert knot_values[np.searchsorted(knot_hours, hours[0])] == new_values[-1]
+
+def test_knots_sit_on_day_starts(knots):
+  hours, values, first_hour, size = knots
+  assert hours[0] == 0 and hours[-1] == size - 1
+  np.testing.assert_array_equal(hours[:-1] % 24, 0)
+  assert values[-1] == values.max() and first_hour % 24 == 0
+  assert np.all(np.diff(values) >= 0)
+
+def test_chunks_match_whole_hydrograph(knots):
+  hours, values, first_hour, size = knots
+  hydrograph = core.knot_hydrograph(hours, values, first_hour, size)
+  chunks = list(core.knot_chunks(hours, values, first_hour, size,
+    chunk_hours = 1000))
+  assert len(chunks) == -(-(size - 1) // 1000)
+  np.testing.assert_allclose(np.concatenate(chunks), hydrograph[1:],
+    atol = 1e-9)
+
+def test_hourly_cleaning_writes_knots_back(knots):
+  hours, values, first_hour, size = knots
+  hydrograph, clean_hours, clean_values = core.clean_knot_flows(hours, values,
+    first_hour, size, verbose = False)
+  accumulation = core.knot_accumulation(hours, values, size)
+  np.testing.assert_array_equal(core.clean_negative_flows(accumulation,
+    first_hour, verbose = False), hydrograph)
+  np.testing.assert_array_equal(core.select_knots(accumulation), clean_hours)
+  np.testing.assert_array_equal(accumulation[clean_hours], clean_values)
+  assert clean_hours.size > hours.size
+
+@pytest.mark.parametrize("interval", [60, 15])
+def test_rebased_chunks_match_block_fits(knots, interval):
+  hours, values, first_hour, size = knots
+  offsets, local = core.rebase_knots(hours, values, size, np.float64)
+  hydrograph = core.rebased_knot_hydrograph(offsets, hours, local, first_hour,
+    size, block_hours = 2000)
+  flows = np.concatenate(list(core.rebased_knot_chunks(offsets, hours, local,
+    first_hour, size, interval, block_hours = 2000)))
+  per_hour = 60 // interval
+  assert flows.size == (size - 1)*per_hour
+  np.testing.assert_allclose(flows.reshape(-1, per_hour).mean(1),
+    hydrograph[1:], atol = 1e-6)
+
+@pytest.mark.parametrize("timeline", [core.hour_timeline, core.day_timeline])
+def test_cached_timelines_cannot_be_changed(timeline):
+  first = timeline(1000, 48)
+  assert timeline(1000, 48) is first
+  with pytest.raises(ValueError):
+    first[0] = -1
+  with pytest.raises(ValueError):
+    first[10:][0] = -1
+  with pytest.raises(ValueError):
+    first.setflags(write = True)
+  with pytest.raises(ValueError):
+    np.add(first, 1, out = first)
+  # Arithmetic and copies give new writable arrays
+  shifted = first - 1000
+  shifted[0] = -1
+  copied = first.copy()
+  copied += 1
+  np.testing.assert_array_equal(timeline(1000, 48), np.arange(1000, 1048))
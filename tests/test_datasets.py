@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+xr = pytest.importorskip("xarray")
+pytest.importorskip("netCDF4")
+
+from CVHSSmoothing.core import FAUX_OFFSET
+from CVHSSmoothing.datasets import (daily_dataset_from_files, smooth_dataset,
+  smooth_station)
+from CVHSSmoothing.segments import read_daily_record
+from conftest import DEER
+
+@pytest.fixture
+def daily_dataset(excerpt, tmp_path):
+  files = {"EARLY": excerpt(DEER, 120, 100, "early.txt"),
+    "LATE": excerpt(DEER, 120, 150, "late.txt"),
+    "SHORT": excerpt(DEER, 40, 130, "short.txt")}
+  path = str(tmp_path / "daily.nc")
+  daily_dataset_from_files(files, path)
+  return path, files
+
+@pytest.mark.parametrize("out_name, workers", [("hourly.nc", 1),
+  ("hourly.zarr", 1), ("hourly.zarr", 2)])
+def test_smooth_dataset(daily_dataset, tmp_path, out_name, workers):
+  if out_name.endswith(".zarr"):
+    pytest.importorskip("zarr")
+  in_path, files = daily_dataset
+  out_path = str(tmp_path / out_name)
+  assert smooth_dataset(in_path, out_path, workers = workers,
+    station_chunk = 2) == 3
+
+  with xr.open_dataset(in_path) as daily:
+    first_day = int(daily.time.values[0].astype("datetime64[D]").astype(
+      np.int64)) + FAUX_OFFSET
+    flows = daily.flow.values
+  opened = xr.open_zarr(out_path) if out_name.endswith(".zarr") else \
+    xr.open_dataset(out_path)
+  with opened as hourly:
+    assert list(hourly.station.values) == list(files)
+    # Period ending times from 0100 of the first day
+    assert hourly.time.values[0] == np.datetime64("2006-01-09T01:00")
+    assert np.all(np.diff(hourly.time.values) == np.timedelta64(1, "h"))
+    for i, station in enumerate(files):
+      np.testing.assert_array_equal(hourly.flow.values[:, i],
+        smooth_station(first_day, flows[:, i]))
+
+def test_daily_dataset_from_files(daily_dataset):
+  in_path, files = daily_dataset
+  with xr.open_dataset(in_path) as daily:
+    info, days, flows = read_daily_record(files["LATE"])
+    late = daily.flow.sel(station = "LATE").values
+    np.testing.assert_array_equal(late[50:], flows)
+    assert np.isnan(late[:50]).all()
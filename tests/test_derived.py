@@ -0,0 +1,42 @@
+import numpy as np
+
+from CVHSSmoothing.catalog import read_output_header, minute_ordinal
+from CVHSSmoothing.derived import Gauge, evaluate, smooth_gauge, write_series
+from CVHSSmoothing.segments import read_daily_record, spline_segments
+from CVHSSmoothing.validation import read_output_values
+from conftest import DEER
+
+def test_series_match_spline_segments_output(excerpt, tmp_path):
+  daily = excerpt(DEER, 200, 100)
+  output = str(tmp_path / "gauge.out")
+  spline_segments(daily, output)
+  values, interval = read_output_values(output)
+  info, first_end = read_output_header(output)
+
+  gauge = Gauge(daily)
+  series = evaluate({"gauge": gauge, "half": gauge - 0.5*gauge})
+  assert series["gauge"].index[0].to_timestamp().value == first_end*60*10**9
+  np.testing.assert_allclose(series["gauge"].to_numpy(), values[:series["gauge"].size],
+    atol = 0.005)
+  np.testing.assert_allclose(series["half"], 0.5*series["gauge"])
+
+def test_write_series_round_trip(excerpt, tmp_path):
+  daily = excerpt(DEER, 200, 100)
+  timeseries_info = read_daily_record(daily)[0]
+  series = evaluate({"gauge": Gauge(daily)})["gauge"]
+  output = str(tmp_path / "derived.out")
+  write_series(output, series, timeseries_info)
+
+  info, first_end = read_output_header(output)
+  assert first_end == minute_ordinal(series.index[0].strftime("%d%b%Y %H%M"))
+  np.testing.assert_allclose(read_output_values(output)[0][:-1],
+    np.round(series.to_numpy()[:-1], 2), atol = 0.005)
+
+def test_overlapping_hours(excerpt):
+  early = excerpt(DEER, 100, 100, "early.txt")
+  late = excerpt(DEER, 100, 150, "late.txt")
+  series = evaluate({"sum": Gauge(early) + Gauge(late)})["sum"]
+  late_hour, late_values = smooth_gauge(late)
+  early_hour, early_values = smooth_gauge(early)
+  assert series.index[0].ordinal == late_hour
+  assert series.size == early_hour + early_values.size - late_hour
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from CVHSSmoothing.dss_util import import_smooth_batch, import_smooth_ts
+from CVHSSmoothing.dss_writer import read_local_index, read_local_record, \
+  read_smooth_header
+from CVHSSmoothing.Spline import epart_interval, interval_epart, spline
+from CVHSSmoothing.validation import read_output_values
+from conftest import DEER
+
+@pytest.mark.parametrize("interval", [1, 2, 3, 4, 5, 6, 10, 12, 15, 20, 30, 60])
+def test_epart_round_trip(interval):
+  epart = interval_epart(interval)
+  assert epart_interval(epart) == interval
+  assert epart_interval(epart.lower()) == interval
+
+def test_epart_names():
+  assert interval_epart(60) == "1hour" and interval_epart(15) == "15MIN"
+  with pytest.raises(ValueError):
+    interval_epart(7)
+  with pytest.raises(ValueError):
+    epart_interval("1DAY")
+
+def test_import_intervals(excerpt, tmp_path):
+  daily = excerpt(DEER, 100, 100)
+  outputs = []
+  for interval in (60, 15):
+    outputs.append(str(tmp_path / f"gauge{interval}.out"))
+    spline(daily, outputs[-1], False, interval)
+  assert [read_smooth_header(output)[2] for output in outputs] == [60, 15]
+  out_dss = str(tmp_path / "local.dss")
+
+  # A requested E-part that does not match the output interval is replaced
+  assert import_smooth_batch(outputs, out_dss, ["/A/B/FLOW//1HOUR/H/",
+    "/A/B/FLOW//1HOUR/Q/"], backend = "local") == 2
+  import_smooth_ts(outputs[1], out_dss, "/A/B/FLOW//15MIN/SHIFTED/", 10,
+    backend = "local")
+  assert sorted(read_local_index(out_dss)) == ["/A/B/FLOW//15MIN/Q/",
+    "/A/B/FLOW//15MIN/SHIFTED/", "/A/B/FLOW//1HOUR/H/"]
+
+  for pathname, output, start in (("/A/B/FLOW//1HOUR/H/", outputs[0],
+    "09Jan2006 01:00"), ("/A/B/FLOW//15MIN/Q/", outputs[1], "09Jan2006 00:15"),
+    ("/A/B/FLOW//15MIN/SHIFTED/", outputs[1], "19Jan2006 00:15")):
+    info, values = read_local_record(out_dss, pathname)
+    assert info["start"] == start
+    assert info["interval"] == epart_interval(pathname.split("/")[5])
+    np.testing.assert_array_equal(values, read_output_values(output)[0])
@@ -0,0 +1,47 @@
+import datetime
+import numpy as np
+import pytest
+
+from CVHSSmoothing.dss_writer import (DssWriter, get_backend, read_local_index,
+  read_local_record, record_path)
+from CVHSSmoothing.Spline import spline
+from CVHSSmoothing.validation import read_output_values
+from conftest import DEER
+
+@pytest.mark.parametrize("interval, epart", [(60, "1HOUR"), (15, "15MIN")])
+def test_local_round_trip(excerpt, tmp_path, interval, epart):
+  daily = excerpt(DEER, 200, 100)
+  output = str(tmp_path / "gauge.out")
+  spline(daily, output, False, interval)
+  values = read_output_values(output)[0]
+  with open(output, "r") as output_file:
+    pathname = output_file.readline().strip()
+  assert pathname.upper() == f"/DEER/SMARTSVILLE/FLOW-UNREG//{epart}/SYNTHETIC/"
+  out_dss = str(tmp_path / "local.dss")
+
+  with DssWriter("local", chunk_values = 1000) as writer:
+    writer.queue(output, out_dss)
+    writer.queue(output, out_dss, "/A/B/FLOW/01JAN2000/1HOUR/SHIFTED/", 365)
+
+  assert sorted(read_local_index(out_dss)) == sorted([pathname,
+    f"/A/B/FLOW/01JAN2000/{epart}/SHIFTED/"])
+  first_end = datetime.datetime(2006, 1, 9) + \
+    datetime.timedelta(minutes = interval)
+  for record_name, start in ((pathname, first_end),
+    (f"/A/B/FLOW/01JAN2000/{epart}/SHIFTED/",
+    first_end + datetime.timedelta(days = 365))):
+    info, record = read_local_record(out_dss, record_name)
+    assert info["start"] == start.strftime("%d%b%Y %H:%M")
+    assert info["interval"] == interval and info["values"] == values.size
+    assert (info["units"], info["type"]) == ("cfs", "PER-AVER")
+    np.testing.assert_array_equal(record, values)
+
+def test_record_path_keeps_requested_parts():
+  pathname = "/DEER/SMARTSVILLE/FLOW-UNREG//15MIN/SYNTHETIC/"
+  assert record_path(pathname) == pathname
+  assert record_path(pathname, "/A/B/C//15MIN/F/") == "/A/B/C//15MIN/F/"
+  assert record_path(pathname, "/A/B/C//1HOUR/F/") == "/A/B/C//15MIN/F/"
+
+def test_unknown_backend():
+  with pytest.raises(ValueError, match = "available backends"):
+    get_backend("nope")
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from scipy import interpolate
+
+from CVHSSmoothing import core, engines, Spline, Spline_PCHIP
+from CVHSSmoothing.compare_engines import (compare_engines, file_record,
+  run_engine, synthetic_record)
+from conftest import DEER, DEER_CREEK, DEER_CREEK_PEAKS
+
+def test_unknown_engine():
+  with pytest.raises(ValueError, match = "available engines are"):
+    engines.get_engine("cubic")
+  with pytest.raises(ValueError, match = "Unknown engine 'cubic'"):
+    run_engine("cubic", *synthetic_record(100))
+
+def test_registered_and_callable_engines():
+  assert {"splrep", "pchip", "akima"} <= set(engines.available_engines())
+  linear = lambda x, y: interpolate.interp1d(x, y)
+  assert engines.get_engine(linear) is linear
+  try:
+    assert engines.register_engine("linear")(linear) is linear
+    assert engines.get_engine("linear") is linear
+    assert "linear" in engines.available_engines()
+  finally:
+    engines._engines.pop("linear", None)
+
+def test_engines_keep_shape_and_daily_volumes():
+  days, flows, peaks = synthetic_record(1000, 1)
+  splrep = run_engine("splrep", days, flows, peaks)
+  for engine in ("pchip", "akima"):
+    hydrograph = run_engine(engine, days, flows, peaks)
+    assert hydrograph.shape == splrep.shape and hydrograph[0] == 0
+    np.testing.assert_allclose(hydrograph[1:24*flows.size + 1].reshape(-1,
+      24).mean(1), flows, atol = 1e-6)
+
+def test_pchip_is_monotone():
+  days, flows, peaks = synthetic_record(365, 2)
+  knot_days = np.arange(flows.size + 1) + days[0].ordinal + core.FAUX_OFFSET
+  daily_accumulation, hours, values, first_hour, size = core.build_knots(
+    knot_days, np.concatenate(([0.], flows)))
+  assert core.knot_hydrograph(hours, values, first_hour, size,
+    "pchip").min() >= 0
+  assert core.knot_hydrograph(hours, values, first_hour, size).min() < 0
+
+def test_pchip_module_wraps_spline(excerpt, tmp_path):
+  daily = excerpt(DEER, 200, 100)
+  hydrograph = Spline_PCHIP.spline(daily, str(tmp_path / "pchip.out"))
+  expected = Spline.spline(daily, str(tmp_path / "engine.out"),
+    engine = "pchip")
+  assert hydrograph.equals(expected)
+  with open(tmp_path / "pchip.out") as pchip, \
+    open(tmp_path / "engine.out") as engine:
+    assert pchip.read() == engine.read()
+  assert Spline_PCHIP.read_date is Spline.read_date
+
+def test_compare_engines_report(excerpt):
+  # Two years of Deer Creek from 1935-07-24, holding two table peaks
+  daily = excerpt(DEER_CREEK, 730, 16000)
+  corpus = {"deer": file_record(daily, DEER_CREEK_PEAKS),
+    "synthetic": synthetic_record(365, 4)}
+  report = compare_engines(corpus, ["splrep", "pchip"])
+  assert report.index.names == ["record", "engine"]
+  assert report.index.tolist() == [("deer", "splrep"), ("deer", "pchip"),
+    ("synthetic", "splrep"), ("synthetic", "pchip")]
+  assert report.columns.tolist() == ["seconds", "memory_mb",
+    "max_daily_error", "mean_daily_error", "negative_hours", "min_flow",
+    "peaks", "mean_peak_error", "max_peak_error"]
+  assert report.loc["deer", "peaks"].tolist() == [2, 2]
+  assert (report["seconds"] > 0).all() and (report["memory_mb"] > 0).all()
+  assert (report["max_daily_error"] < 0.05).all()
+  assert (report["max_peak_error"] < 1e-6).all()
+  assert (report.loc[(slice(None), "pchip"), "negative_hours"] == 0).all()
+
+  unmeasured = compare_engines({"deer": corpus["deer"]}, {"fit": "splrep"},
+    measure_memory = False)
+  assert unmeasured.index.tolist() == [("deer", "fit")]
+  assert np.isnan(unmeasured["memory_mb"]).all()
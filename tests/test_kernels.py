@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from scipy import interpolate
+
+from CVHSSmoothing import kernels
+from CVHSSmoothing.compare_engines import run_engine, synthetic_record
+from conftest import ROOT
+
+NUMPY_RUN = """
+import sys
+import numpy as np
+from CVHSSmoothing import kernels
+from CVHSSmoothing.compare_engines import run_engine, synthetic_record
+assert not kernels.ACCELERATED
+days, flows, peaks = synthetic_record(1000, 3)
+np.savez(sys.argv[1], **{engine: run_engine(engine, days, flows, peaks)
+  for engine in ("splrep", "pchip")})
+"""
+
+def test_kernels_match_numpy_versions():
+  rng = np.random.default_rng(33)
+  values = rng.normal(size = 500)
+  values[rng.random(500) < 0.3] = np.nan
+  np.testing.assert_array_equal(kernels._select_knots(values),
+    kernels._select_knots_numpy(values))
+  np.testing.assert_array_equal(kernels._differences(values, 24.),
+    kernels._differences_numpy(values, 24.))
+  np.testing.assert_array_equal(kernels._negative_mask(values),
+    kernels._negative_mask_numpy(values))
+  np.testing.assert_array_equal(kernels._clip_negative(values, -901.),
+    kernels._clip_negative_numpy(values, -901.))
+  hydrograph = rng.normal(size = 500)
+  first_hours = np.arange(0, 475, 24)
+  limits = np.full(first_hours.size, 1.5)
+  np.testing.assert_array_equal(
+    kernels._peaks_exceeded(hydrograph, first_hours, limits),
+    kernels._peaks_exceeded_numpy(hydrograph, first_hours, limits))
+
+@pytest.mark.parametrize("size", [2, 3, 200])
+def test_pchip_slopes_match_scipy(size):
+  rng = np.random.default_rng(size)
+  x = np.cumsum(rng.uniform(0.5, 2, size))
+  y = np.round(rng.normal(size = size), 1)
+  slopes = interpolate.PchipInterpolator(x, y).derivative()(x)
+  np.testing.assert_allclose(kernels.pchip_slopes(x, y), slopes, atol = 1e-12)
+  np.testing.assert_allclose(kernels._pchip_slopes_numpy(x, y), slopes,
+    atol = 1e-12)
+
+def test_disabled_jit_gives_identical_output(tmp_path):
+  output = str(tmp_path / "numpy.npz")
+  environment = dict(os.environ, CVHS_DISABLE_JIT = "1",
+    PYTHONPATH = os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+  subprocess.run([sys.executable, "-W", "ignore", "-c", NUMPY_RUN, output],
+    env = environment, check = True)
+
+  days, flows, peaks = synthetic_record(1000, 3)
+  with np.load(output) as numpy_run:
+    for engine in ("splrep", "pchip"):
+      np.testing.assert_array_equal(run_engine(engine, days, flows, peaks),
+        numpy_run[engine])
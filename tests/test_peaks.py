@@ -0,0 +1,111 @@
+import io
+import numpy as np
+import pytest
+
+from CVHSSmoothing import core
+from CVHSSmoothing.Spline import smooth_record
+from conftest import DEER_CREEK
+
+@pytest.fixture(scope = "module")
+def record():
+  """
+  Return the data lines of ten years of Deer Creek and a peak table of
+  its twenty highest days, each peak 10% above the day's flow.
+
+  """
+
+  with open(DEER_CREEK, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7 + 20000:7 + 23650]
+  days = np.array([core.day_ordinal(line.split()[1]) for line in lines])
+  flows = np.array([float(line.split()[2]) for line in lines])
+  top = np.argsort(flows)[::-1][:20]
+  return lines, core.peak_table(days[top], 1.1*flows[top], ["2"]*top.size)
+
+def excess(result, peaks):
+  return core.peak_excess(result["hydrograph"],
+    24*peaks["day"] - result["first_hour"], peaks["value"])
+
+def daily_volumes(hydrograph):
+  days = (hydrograph.size - 1) // 24
+  return hydrograph[1:1 + 24*days].reshape(days, 24).sum(1)
+
+def test_corrected_peaks_keep_daily_volumes(record):
+  lines, peaks = record
+  plain = smooth_record(lines, peaks = peaks)
+  corrected = smooth_record(lines, peaks = peaks, correct_overestimated = True)
+  assert len(corrected["corrected"]) > 0
+  assert sorted(corrected["corrected"] + corrected["overestimated"]) == \
+    sorted(plain["overestimated"])
+  assert np.all(excess(corrected, peaks) <= excess(plain, peaks))
+  np.testing.assert_allclose(daily_volumes(corrected["hydrograph"]),
+    daily_volumes(plain["hydrograph"]), atol = 1e-6)
+
+def test_unimproved_windows_are_left_alone(record):
+  lines, peaks = record
+  # No flows on a day can average below a peak under its daily flow
+  low = core.peak_table(peaks["day"][:1], [0.5*peaks["value"][0]], ["2"])
+  result = smooth_record(lines, peaks = low)
+  hydrograph = result["hydrograph"].copy()
+  knot_days, flows = core.read_daily_lines(lines, "", io.StringIO())
+  daily_accumulation, hours, values, first_hour, size = core.build_knots(
+    knot_days, flows)
+  hours, values = core.insert_knots(hours, values, *core.peak_knots(
+    knot_days, daily_accumulation, core.select_peaks(knot_days, low)))
+  y, hours, values = core.clean_knot_flows(hours, values, first_hour, size,
+    verbose = False)
+  accumulation = core.knot_accumulation(hours, values, size)
+  windows = []
+  assert core.correct_peaks(accumulation, first_hour, y, low,
+    core.check_peaks(y, first_hour, low), windows = windows) == \
+    low["day"].tolist()
+  np.testing.assert_array_equal(y, hydrograph)
+  np.testing.assert_array_equal(accumulation,
+    core.knot_accumulation(hours, values, size))
+  assert windows == []
+
+def test_sub_hourly_output_keeps_corrections(record):
+  lines, peaks = record
+  result = smooth_record(lines, peaks = peaks, interval = 15,
+    correct_overestimated = True)
+  flows = np.concatenate(list(result["chunks"]))
+  hydrograph = result["hydrograph"][1:]
+  np.testing.assert_allclose(flows.reshape(-1, 4).mean(1), hydrograph,
+    atol = 1e-6)
+
+# Ten knot days: the accumulation at the start of days 100 to 110
+KNOT_DAYS = np.arange(100, 111)
+
+def test_peaks_in_range_keeps_both_ends():
+  peaks = core.peak_table([95, 100, 100, 105, 110, 120], [1, 2, 3, 4, 5, 6],
+    ["2"]*6)
+  assert core.peaks_in_range(peaks, 100, 110)["value"].tolist() == \
+    [2, 3, 4, 5]
+  assert core.peaks_in_range(peaks, 101, 109)["value"].tolist() == [4]
+  assert core.peaks_in_range(peaks, 111, 119).size == 0
+  assert core.peaks_in_range(peaks, 0, 90).size == 0
+  assert core.peaks_in_range(peaks[:0], 0, 200).size == 0
+
+def test_select_peaks_needs_the_whole_day():
+  # Day 110 starts on the last knot but has no end, 99 and 111 are outside
+  peaks = core.peak_table([99, 100, 104, 109, 110, 111], [1, 2, 3, 4, 5, 6],
+    ["2"]*6)
+  assert core.select_peaks(KNOT_DAYS, peaks)["day"].tolist() == \
+    [100, 104, 109]
+  # A day whose end is not a knot (a gap in the record) is left out
+  gappy = np.delete(KNOT_DAYS, 5)
+  assert core.select_peaks(gappy, peaks)["day"].tolist() == [100, 109]
+  assert core.select_peaks(KNOT_DAYS, peaks[:0]).size == 0
+
+def test_unknown_peak_types_are_skipped():
+  daily_accumulation = np.arange(KNOT_DAYS.size)*100.
+  peaks = core.peak_table([100, 101, 109, 109], [240, 480, 240, 480],
+    ["1", "7", "3", ""])
+  log = io.StringIO()
+  hours, values = core.peak_knots(KNOT_DAYS, daily_accumulation,
+    core.select_peaks(KNOT_DAYS, peaks), log)
+  # The first and last hours of the record take the boundary peaks
+  assert hours.tolist() == [0, 1, 24*9 + 23, 24*10]
+  np.testing.assert_allclose(values, [0, 10, 980, 990])
+  assert log.getvalue().splitlines() == [
+    "Inserting peak of 240.00 on 1970-04-11 at 12 AM",
+    "Inserting peak of 240.00 on 1970-04-20 at 11 PM"]
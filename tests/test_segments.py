@@ -0,0 +1,78 @@
+import warnings
+import numpy as np
+import pytest
+
+from CVHSSmoothing.segments import (fill_short_gaps, find_segments,
+  read_daily_record, smooth_segment, spline_segments)
+from CVHSSmoothing.validation import read_output_values
+from conftest import DEER
+
+@pytest.fixture
+def gappy(excerpt):
+  """
+  Return the path of 300 days of DEER with a blank flow on day 50 and
+  days 150 to 154 left out.
+
+  """
+
+  daily = excerpt(DEER, 300, 100)
+  with open(daily, "r") as daily_file:
+    lines = daily_file.readlines()
+  fields = lines[7 + 50].split("\t")
+  lines[7 + 50] = "\t".join(fields[:2] + ["\n"])
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines[:7 + 150] + lines[7 + 155:])
+  return daily
+
+def test_fill_short_gaps():
+  flows = np.array([np.nan, 1, np.nan, 3, np.nan, np.nan, np.nan, 7, 8,
+    np.nan])
+  filled = fill_short_gaps(flows, max_fill_days = 2)
+  np.testing.assert_array_equal(filled, [np.nan, 1, 2, 3, np.nan, np.nan,
+    np.nan, 7, 8, np.nan])
+  np.testing.assert_array_equal(fill_short_gaps(flows, 3)[4:7], [4, 5, 6])
+  starts, stops = find_segments(filled)
+  assert starts.tolist() == [1, 7] and stops.tolist() == [4, 9]
+
+def test_read_daily_record(gappy):
+  with warnings.catch_warnings():
+    warnings.simplefilter("error")
+    timeseries_info, days, flows = read_daily_record(gappy)
+  assert days.size == 300 and str(days[0]) == "2006-01-09"
+  missing = np.flatnonzero(np.isnan(flows))
+  assert missing.tolist() == [50, 150, 151, 152, 153, 154]
+
+@pytest.mark.parametrize("interval", [60, 15])
+def test_gaps_are_filled_or_split(gappy, tmp_path, interval):
+  output = str(tmp_path / "gauge.out")
+  starts, stops = spline_segments(gappy, output, interval = interval)
+  assert starts.tolist() == [0, 155] and stops.tolist() == [150, 300]
+
+  per_day = 24*60 // interval
+  values, file_interval = read_output_values(output)
+  assert file_interval == interval
+  # As in spline() output, the record runs on to 2300 of the following day
+  assert values.size == 301*per_day - 60 // interval
+  np.testing.assert_array_equal(np.flatnonzero(np.isnan(values)),
+    np.arange(150*per_day, 155*per_day))
+
+  timeseries_info, days, flows = read_daily_record(gappy)
+  flows = fill_short_gaps(flows)
+  valid = ~np.isnan(flows)
+  means = values[:300*per_day].reshape(300, per_day).mean(1)
+  np.testing.assert_allclose(means[valid], flows[valid], atol = 0.05)
+  assert flows[50] == pytest.approx((flows[49] + flows[51]) / 2)
+
+  with open(output + "_missing.log", "r") as log_file:
+    log = log_file.read().splitlines()
+  assert log == [f"Filled: {output} \t 2006-02-28",
+    f"Gap: {output} \t 2006-06-08 to 2006-06-12 (5 days)"]
+
+def test_sub_hourly_segments_average_to_hourly(gappy):
+  timeseries_info, days, flows = read_daily_record(gappy)
+  hourly = smooth_segment(days[:150], flows[:150], None)
+  quarter_hourly = smooth_segment(days[:150], flows[:150], None,
+    interval = 15)
+  assert quarter_hourly.size == 4*hourly.size
+  np.testing.assert_allclose(quarter_hourly.reshape(-1, 4).mean(1), hourly,
+    atol = 1e-6)
@@ -0,0 +1,74 @@
+import os
+import signal
+import threading
+import time
+import numpy as np
+import pytest
+
+from CVHSSmoothing import core
+from CVHSSmoothing.segments import read_daily_record
+from CVHSSmoothing.service import (make_server, shutdown_server, smooth_remote,
+  smooth_remote_arrow, smooth_request, smooth_requests)
+from conftest import DEER
+
+@pytest.fixture(scope = "module")
+def record():
+  timeseries_info, days, flows = read_daily_record(DEER)
+  return days[120].strftime("%d%b%Y"), flows[120:300]
+
+@pytest.fixture(scope = "module")
+def url():
+  server = make_server(port = 0, workers = 1)
+  threading.Thread(target = server.serve_forever, daemon = True).start()
+  yield f"http://127.0.0.1:{server.server_address[1]}", server
+  shutdown_server(server)
+
+def test_batch_matches_single_requests(record):
+  start, flows = record
+  requests = [{"start": start, "flows": flows.tolist()},
+    {"start": start, "flows": [1.]},
+    {"start": start, "flows": flows[:90].tolist(), "interval": 15}]
+
+  results = smooth_requests(requests)
+  assert "error" in results[1]
+  assert results[2]["interval"] == 15
+  assert len(results[2]["flows"]) == 4*len(smooth_request({"start": start,
+    "flows": flows[:90].tolist()})["flows"])
+  hydrograph, accumulation, first_hour = core.smooth_daily(
+    core.day_ordinal(start), flows)
+  assert results[0]["flows"] == np.round(np.where(hydrograph[1:] >= 0,
+    hydrograph[1:], 0.), 2).tolist()
+  for request, result in zip(requests, results):
+    assert smooth_request(request) == result
+
+def test_json_request(url, record):
+  start, flows = record
+  result = smooth_remote(start, flows, url = url[0])
+  assert result == smooth_request({"start": start, "flows": flows.tolist()})
+
+def test_arrow_request(url, record):
+  pa = pytest.importorskip("pyarrow")
+  start, flows = record
+  table = pa.Table.from_pylist([
+    {"start": start, "flows": flows.tolist(), "interval": 30,
+      "peaks": [{"date": start, "value": 2000., "type": "2"}]},
+    {"start": start, "flows": [1., np.nan, 2.]}])
+
+  results = smooth_remote_arrow(table, url = url[0]).to_pylist()
+  expected = smooth_requests([{key: value for key, value in row.items()
+    if value is not None} for row in table.to_pylist()])
+  assert results[0]["flows"] == expected[0]["flows"]
+  assert results[0]["interval"] == 30 and results[0]["error"] is None
+  assert results[1]["flows"] is None and results[1]["error"] == expected[1]["error"]
+
+def test_broken_pool_is_replaced(url, record):
+  start, flows = record
+  batcher = url[1].batcher
+  for pid in list(batcher.executor._processes):
+    os.kill(pid, signal.SIGKILL)
+  time.sleep(0.5)
+
+  smooth_remote(start, flows[:30], url = url[0])
+  result = smooth_remote(start, flows, url = url[0])
+  assert "error" not in result
+  assert batcher.thread.is_alive()
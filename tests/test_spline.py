@@ -0,0 +1,108 @@
+import filecmp
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from CVHSSmoothing import core
+from CVHSSmoothing.catalog import Catalog
+from CVHSSmoothing.Spline import smooth_record, smooth_window, spline
+from conftest import DEER, DEER_CREEK, DEER_CREEK_PEAKS
+
+def daily_lines(daily_flow_filename):
+  with open(daily_flow_filename, "r") as daily_flow_file:
+    return daily_flow_file.readlines()[7:]
+
+def test_warm_start_repeats_cold_output(excerpt, tmp_path, capsys):
+  daily = excerpt(DEER, 400, 100)
+  cold = spline(daily, str(tmp_path / "cold"))
+  warm = str(tmp_path / "warm")
+  assert spline(daily, warm, warm_start = True).equals(cold)
+  saved = core.read_knot_file(warm + "_knots.npz")
+  assert saved["hours"].size > 0
+
+  capsys.readouterr()
+  assert spline(daily, warm, warm_start = True).equals(cold)
+  assert "iterations completed" not in capsys.readouterr().out
+  assert filecmp.cmp(str(tmp_path / "cold"), warm, shallow = False)
+  assert os.path.exists(warm + "_knots.npz")
+
+def test_warm_start_cleans_changed_records(excerpt):
+  saved = smooth_record(daily_lines(excerpt(DEER, 400, 100)),
+    warm_start = True)
+  saved = {"hours": saved["constrained_hours"], "digest": saved["digest"]}
+
+  lines = daily_lines(excerpt(DEER, 410, 100))
+  cold = smooth_record(lines)
+  warm = smooth_record(lines, warm_start = True, saved_knots = saved)
+  assert warm["digest"] != saved["digest"]
+  days = (cold["hydrograph"].size - 1) // 24
+  np.testing.assert_allclose(
+    warm["hydrograph"][1:1 + 24*days].reshape(days, 24).sum(1),
+    cold["hydrograph"][1:1 + 24*days].reshape(days, 24).sum(1), atol = 0.05)
+
+@pytest.mark.parametrize("start, end", [("2006-02-01", "2006-02-03"),
+  ("2005-10-01", "2005-10-02")])
+def test_window_matches_spline_and_catalog(excerpt, tmp_path, start, end):
+  daily = excerpt(DEER, 400)
+  output = str(tmp_path / "DEER.out")
+  hydrograph = spline(daily, output)
+  window = smooth_window(daily, start, end)
+  assert len(window) == 24*((pd.Period(end, "D") - pd.Period(start, "D")).n + 1)
+  assert str(window.index[0]) == start + " 01:00"
+  pd.testing.assert_series_equal(window, hydrograph.loc[window.index],
+    atol = 1e-6, check_freq = False)
+
+  with Catalog(str(tmp_path / "catalog")) as catalog:
+    catalog.add_output(output)
+    series = catalog.read("DEER", start, end)
+  assert series.index.equals(window.index)
+  np.testing.assert_allclose(series.to_numpy(), np.round(window.clip(0), 2),
+    atol = 0.005)
+  days = np.asarray(window).reshape(-1, 24).mean(1)
+  flows = [float(line.split()[2]) for line in daily_lines(daily)[
+    (pd.Period(start, "D") - pd.Period("2005-10-01", "D")).n:][:days.size]]
+  np.testing.assert_allclose(days, flows, atol = 0.01)
+
+@pytest.mark.parametrize("with_peaks", [True, False])
+def test_record_logs_match_spline_logs(excerpt, tmp_path, with_peaks):
+  # Two years of Deer Creek from 1935-07-24 with 1 Nov 1935 left blank
+  daily = excerpt(DEER_CREEK, 730, 16000)
+  with open(daily, "r") as daily_file:
+    lines = daily_file.readlines()
+  lines[7 + 100] = "16101\t01Nov1935\t\n"
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines)
+  peaks_file_name = False
+  if with_peaks:
+    # The table peaks, one below its day's flow of 96 cfs, one without a
+    # flow and one of an unknown type
+    with open(DEER_CREEK_PEAKS, "r") as peaks_file:
+      header = peaks_file.readlines()[:7]
+    peaks_file_name = str(tmp_path / "peaks.txt")
+    with open(peaks_file_name, "w") as peaks_file:
+      peaks_file.writelines(header + ["1\t29Dec1935\t50.0\t2\n",
+        "2\t05Jan1936\t\t\n", "3\t21Feb1936\t6260.0\t2\n",
+        "4\t03Mar1936\t900.0\t7\n", "5\t04Feb1937\t7520.0\t2\n"])
+
+  output = str(tmp_path / "gauge.out")
+  spline(daily, output, peaks_file_name)
+  result = smooth_record(lines[7:], output, core.read_peak_table(
+    peaks_file_name) if with_peaks else None)
+  for suffix, log in (("_missing.log", result["missing_log"]),
+    ("_peaks.log", result["peak_log"])):
+    with open(output + suffix, "r") as log_file:
+      assert log_file.read() == "".join(log)
+
+  assert result["missing_log"] == \
+    [f"Error: {output} \t line: 16101\t01Nov1935\t\n"]
+  if with_peaks:
+    # Peak insertions are logged on faux dates, as they always were
+    assert result["peak_log"] == [
+      "Inserting peak of 50.00 on 2335-12-29 at 11 AM\n",
+      "Inserting peak of 6260.00 on 2336-02-21 at 11 AM\n",
+      "Inserting peak of 7520.00 on 2337-02-04 at 11 AM\n",
+      "Peak on Date: 1935-12-29 is being overestimated\n"]
+    assert result["overestimated"] == ["1935-12-29"]
+  else:
+    assert result["peak_log"] == ["No peaks specified"]
@@ -0,0 +1,39 @@
+import numpy as np
+
+from CVHSSmoothing import core
+from CVHSSmoothing.Spline import smooth_record
+from CVHSSmoothing.streaming import stream_hydrograph
+from conftest import DEER_CREEK, DEER_CREEK_PEAKS
+
+def test_stream_matches_spline_outside_cleaned_spans():
+  # 800 days around the 1949 storms, streamed in 100 day blocks
+  with open(DEER_CREEK, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7 + 20519:7 + 21319]
+  peaks = core.read_peak_table(DEER_CREEK_PEAKS)
+  result = smooth_record(lines, peaks = peaks, warm_start = True)
+  hydrograph = result["hydrograph"][1:]
+  flows = [float(line.split()[2]) for line in lines]
+  streamed = np.concatenate(list(stream_hydrograph(flows,
+    core.day_ordinal(lines[0].split()[1]), peaks, block_days = 100)))
+  assert streamed.size == hydrograph.size
+
+  # Days within reach of any hour the whole-record cleaning constrained
+  reach = core.support_padding(1e-9)
+  cleaned = np.zeros(hydrograph.size // 24 + 1, dtype=bool)
+  for day in np.unique((result["constrained_hours"] -
+    result["first_hour"] - 1) // 24):
+    cleaned[max(day - reach, 0):day + reach + 1] = True
+  compared = ~cleaned[np.arange(hydrograph.size) // 24]
+  np.testing.assert_allclose(streamed[compared], hydrograph[compared],
+    atol = 1e-4)
+
+  padding = core.support_padding()
+  block_edges = 24*np.arange(100, 800, 100)
+  assert compared[block_edges].sum() >= 2
+  assert compared[block_edges + 24*padding].sum() >= 2
+  assert compared[block_edges - 24*padding].sum() >= 2
+  # The cleaning differs within the spans
+  assert np.abs(streamed - hydrograph).max() > 1
+  days = hydrograph.size // 24
+  np.testing.assert_allclose(streamed[:24*days].reshape(days, 24).sum(1),
+    hydrograph[:24*days].reshape(days, 24).sum(1), atol = 1e-3)
@@ -0,0 +1,82 @@
+import io
+import numpy as np
+import pytest
+
+from CVHSSmoothing import core
+from CVHSSmoothing.Spline import smooth_record
+from conftest import DEER
+
+@pytest.fixture(scope = "module")
+def record():
+  """
+  Return the first five years of DEER, which start with months of zero
+  flow, its knots and its steady spans of five days or more.
+
+  """
+
+  with open(DEER, "r") as daily_flow_file:
+    lines = daily_flow_file.readlines()[7:7 + 1825]
+  knot_days, flows = core.read_daily_lines(lines, "", io.StringIO())
+  daily_accumulation, hours, values, first_hour, size = core.build_knots(
+    knot_days, flows)
+  spans = core.steady_spans(hours, values, size, 5)
+  return lines, flows, (hours, values, first_hour, size), spans
+
+def test_steady_spans_cover_the_record(record):
+  lines, flows, (hours, values, first_hour, size), spans = record
+  assert [start for start, stop, flow in spans[1:]] == \
+    [stop for start, stop, flow in spans[:-1]]
+  assert spans[0][0] == 0 and spans[-1][1] == size - 1
+  steady = [span for span in spans if span[2] is not None]
+  assert len(steady) > 5
+  for start, stop, flow in steady:
+    assert start % 24 == 0 and stop - start >= 24*5
+    # flows starts with the 0 before the first day
+    np.testing.assert_array_equal(flows[1 + start//24:1 + stop//24], flow)
+  assert len(core.steady_spans(hours, values, size, 10**6)) == 1
+
+def test_thinned_matches_full_fit_away_from_steady_spans(record):
+  lines, flows, knots, spans = record
+  full = smooth_record(lines, warm_start = True)
+  thinned = smooth_record(lines, min_steady_days = 5, warm_start = True)
+  y, thin = full["hydrograph"][1:], thinned["hydrograph"][1:]
+  assert y.size == thin.size
+
+  # Steady spans are written at their exact flow
+  steady = np.zeros(y.size // 24 + 1, dtype=bool)
+  for start, stop, flow in spans:
+    if flow is not None:
+      np.testing.assert_array_equal(thin[start:stop], flow)
+      steady[start//24:stop//24] = True
+  assert np.abs(thin - y)[steady[np.arange(y.size) // 24]].max() > 0.1
+
+  # Beyond the spline's reach of steady spans and of the hours either
+  # run's cleaning constrained, the fits agree
+  reach = core.support_padding(1e-9)
+  reached = np.zeros(y.size // 24 + 1, dtype=bool)
+  for day in np.flatnonzero(steady):
+    reached[max(day - reach, 0):day + reach + 1] = True
+  for result in (full, thinned):
+    for day in np.unique((result["constrained_hours"] -
+      result["first_hour"] - 1) // 24):
+      reached[max(day - reach, 0):day + reach + 1] = True
+  compared = ~reached[np.arange(y.size) // 24]
+  assert compared.sum() > 24*365
+  np.testing.assert_allclose(thin[compared], y[compared], atol = 1e-6)
+
+  days = y.size // 24
+  np.testing.assert_allclose(thin[:24*days].reshape(days, 24).sum(1),
+    y[:24*days].reshape(days, 24).sum(1), atol = 1e-6)
+
+def test_thinned_chunks_follow_the_thinned_fit(record):
+  lines, flows, (hours, values, first_hour, size), spans = record
+  hydrograph, clean_hours, clean_values = core.clean_thinned_flows(hours,
+    values, first_hour, size, spans, verbose = False)
+  assert clean_hours.size > hours.size
+  hourly = np.concatenate(list(core.thinned_chunks(clean_hours, clean_values,
+    first_hour, size, spans)))
+  np.testing.assert_allclose(hourly, hydrograph[1:], atol = 1e-6)
+  quarter_hourly = np.concatenate(list(core.thinned_chunks(clean_hours,
+    clean_values, first_hour, size, spans, 15)))
+  np.testing.assert_allclose(quarter_hourly.reshape(-1, 4).mean(1),
+    hydrograph[1:], atol = 1e-6)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from CVHSSmoothing.batch import run_batch
+from CVHSSmoothing.Spline import spline
+from CVHSSmoothing.segments import read_daily_record
+from CVHSSmoothing.validation import validate_hydrograph, validate_output_file
+from conftest import DEER
+
+DAYS = pd.period_range("2000-01-01", periods = 10, freq = "D")
+FLOWS = np.arange(10, 20, dtype=float)
+
+def hydrograph(per_day = 24):
+  return np.concatenate(([0.], np.repeat(FLOWS, per_day)))
+
+def test_exact_hydrograph_passes():
+  report = validate_hydrograph(DAYS, FLOWS, hydrograph())
+  assert report["days"] == 10
+  assert report["max_error"] == 0 and report["volume_error"] == 0
+
+def test_volume_moved_across_days():
+  y = hydrograph()
+  # Move the last hour of 3 Jan to the first of 4 Jan
+  y[73] += y[72]
+  y[72] = 0
+  report = validate_hydrograph(DAYS, FLOWS, y, worst = 2)
+  assert report["max_error"] == pytest.approx(FLOWS[2]/24)
+  assert report["volume_error"] == pytest.approx(0)
+  assert sorted(day["date"] for day in report["worst_days"]) == \
+    ["2000-01-03", "2000-01-04"]
+
+def test_clipped_negative_flows_add_volume():
+  y = hydrograph()
+  y[25:29] = [-12, 12 + 2*FLOWS[1], -6, 6 + 2*FLOWS[1]]
+  assert validate_hydrograph(DAYS, FLOWS, y, clip = False)["max_error"] == \
+    pytest.approx(0)
+  report = validate_hydrograph(DAYS, FLOWS, y, worst = 1)
+  assert report["max_error"] == pytest.approx(18/24)
+  assert report["worst_days"][0]["date"] == "2000-01-02"
+  assert report["volume_error"] > 0
+
+def test_missing_and_partial_days_are_skipped():
+  y = hydrograph(96)[:-50]
+  y[100] = np.nan
+  report = validate_hydrograph(DAYS, FLOWS, y, interval = 15)
+  # 2 Jan holds the NaN and 10 Jan is cut short
+  assert report["days"] == 8
+  assert report["max_error"] == 0
+  assert validate_hydrograph(DAYS, FLOWS, [0.])["days"] == 0
+
+def test_batch_stores_unclipped_check(excerpt, tmp_path):
+  daily = excerpt(DEER, 400, 100)
+  output = str(tmp_path / "gauge.out")
+  volume = run_batch([(daily, output, False)],
+    str(tmp_path / "journal.json"))["completed"][output]["volume"]
+  assert volume["unclipped"]["days"] == volume["days"]
+  assert volume["unclipped"]["max_error"] < 1e-6
+
+  timeseries_info, days, daily_flows = read_daily_record(daily)
+  smoothed = spline(daily, output)
+  report = validate_output_file(output, daily, hydrograph = smoothed)
+  assert report["unclipped"] == validate_hydrograph(days, daily_flows,
+    smoothed, clip = False)
@@ -0,0 +1,48 @@
+import os
+
+from CVHSSmoothing.watch import (affected_jobs, changed_files, discover_jobs,
+  smooth_jobs, snapshot)
+from conftest import DEER
+
+def test_discover_jobs_pairs_peaks_and_outputs(excerpt, tmp_path):
+  excerpt(DEER, 10, name = "daily/a/GAUGE.txt")
+  excerpt(DEER, 10, name = "daily/OTHER.txt")
+  excerpt(DEER, 10, name = "peaks/GAUGE.txt")
+
+  jobs = discover_jobs(str(tmp_path / "daily"), str(tmp_path / "peaks"),
+    str(tmp_path / "out"))
+  assert jobs == [
+    (str(tmp_path / "daily" / "OTHER.txt"), str(tmp_path / "out" / "OTHER.out"),
+      False),
+    (str(tmp_path / "daily" / "a" / "GAUGE.txt"),
+      os.path.join(str(tmp_path / "out"), "a", "GAUGE.out"),
+      str(tmp_path / "peaks" / "GAUGE.txt"))]
+
+def test_repaired_gauge_is_resmoothed(excerpt, tmp_path):
+  daily = excerpt(DEER, 400, 100, "daily/GAUGE.txt")
+  excerpt(DEER, 400, 100, "daily/OTHER.txt")
+  with open(daily, "r") as daily_file:
+    lines = daily_file.readlines()
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines[:4])
+  daily_dir, output_dir = str(tmp_path / "daily"), str(tmp_path / "out")
+  os.makedirs(output_dir)
+  journal_file_name = str(tmp_path / "journal.json")
+  output = os.path.join(output_dir, "GAUGE.out")
+
+  jobs = discover_jobs(daily_dir, None, output_dir)
+  written = smooth_jobs(jobs, journal_file_name)
+  assert written == [os.path.join(output_dir, "OTHER.out")]
+  for attempt in range(3):
+    assert smooth_jobs(jobs, journal_file_name) == []
+
+  before = snapshot([daily_dir])
+  with open(daily, "w") as daily_file:
+    daily_file.writelines(lines)
+  changed = changed_files(before, snapshot([daily_dir]))
+  assert changed == {daily}
+
+  affected = affected_jobs(discover_jobs(daily_dir, None, output_dir), changed,
+    jobs)
+  assert [job[1] for job in affected] == [output]
+  assert smooth_jobs(affected, journal_file_name) == [output]